@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -95,6 +96,56 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# A per process LRU in front of a cache shared by every worker, see
+# core.cache. The shared tier is a file based cache by default, off the
+# database, and the query budgets leave cache traffic out. Kept in the
+# database instead (CACHE_SHARED_BACKEND=
+# django.core.cache.backends.db.DatabaseCache, CACHE_SHARED_LOCATION=
+# core_cache), a miss costs a SELECT and every set a SELECT COUNT(*), an
+# upsert and the culls on the primary database, none of them budgeted.
+# Both the file cache and the default invalidation only cover the workers
+# of one node: several nodes need a shared cache server, such as
+# memcached, and CACHE_INVALIDATION=postgres, which broadcasts writes with
+# a pg_notify per write and a LISTEN connection per process.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.TwoTierCache',
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'MAX_ENTRIES': int(os.environ.get('CACHE_LOCAL_MAX_ENTRIES', 1000)),
+            'MAX_SIZE': int(os.environ.get('CACHE_LOCAL_MAX_SIZE', 32 << 20)),
+            'LOCAL_TIMEOUT': int(os.environ.get('CACHE_LOCAL_TIMEOUT', 60)),
+            'INVALIDATION': os.environ.get(
+                'CACHE_INVALIDATION', 'generation',
+            ),
+        },
+    },
+    'shared': {
+        'BACKEND': os.environ.get(
+            'CACHE_SHARED_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache',
+        ),
+        'LOCATION': os.environ.get(
+            'CACHE_SHARED_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'traildig-cache'),
+        ),
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            # The file cache lists its directory on every set.
+            'MAX_ENTRIES': int(os.environ.get('CACHE_SHARED_MAX_ENTRIES', 10000)),
+            # The culls do not go by age: cull a small fraction at once.
+            'CULL_FREQUENCY': int(
+                os.environ.get('CACHE_SHARED_CULL_FREQUENCY', 10)
+            ),
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -145,6 +196,102 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
 
+# Closes the cache listeners before the test databases are dropped.
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
+
+# Fail (strict) or log requests going over their declared query budget.
+QUERY_BUDGET_STRICT = bool(int(os.environ.get('QUERY_BUDGET_STRICT', 0)))
+QUERY_BUDGET_LOG = bool(int(os.environ.get('QUERY_BUDGET_LOG', 0)))
+
+# Default and maximum number of trail digs per page.
+TRAILDIG_PAGE_SIZE = int(os.environ.get('TRAILDIG_PAGE_SIZE', 50))
+TRAILDIG_MAX_PAGE_SIZE = int(os.environ.get('TRAILDIG_MAX_PAGE_SIZE', 500))
+
+# Default number of volunteers in a leaderboard, see core.leaderboards.
+TRAILDIG_LEADERBOARD_SIZE = int(
+    os.environ.get('TRAILDIG_LEADERBOARD_SIZE', 10)
+)
+
+# Maximum number of trail digs accepted by one bulk create request.
+TRAILDIG_BULK_MAX_ITEMS = int(os.environ.get('TRAILDIG_BULK_MAX_ITEMS', 5000))
+
+# Create the tags a trail dig refers to instead of rejecting the write.
+TRAILDIG_AUTO_CREATE_TAGS = bool(
+    int(os.environ.get('TRAILDIG_AUTO_CREATE_TAGS', 0))
+)
+
+# Number of trail digs read per database round trip by the export.
+TRAILDIG_EXPORT_CHUNK_SIZE = int(
+    os.environ.get('TRAILDIG_EXPORT_CHUNK_SIZE', 2000)
+)
+
+# Days deletions stay in the change feeds, clients last synced before
+# have to download everything again, see core.changes.
+TRAILDIG_CHANGES_RETENTION_DAYS = int(
+    os.environ.get('TRAILDIG_CHANGES_RETENTION_DAYS', 30)
+)
+
+# Seconds between two reads of the change log by the push notifications
+# when no NOTIFY wakes them, between two keepalives on idle event streams
+# and before an idle long poll answers, see traildig.events.
+TRAILDIG_EVENTS_POLL_INTERVAL = float(
+    os.environ.get('TRAILDIG_EVENTS_POLL_INTERVAL', 2)
+)
+TRAILDIG_EVENTS_KEEPALIVE = float(
+    os.environ.get('TRAILDIG_EVENTS_KEEPALIVE', 15)
+)
+TRAILDIG_EVENTS_LONG_POLL_TIMEOUT = float(
+    os.environ.get('TRAILDIG_EVENTS_LONG_POLL_TIMEOUT', 25)
+)
+
+# Cache the data of trail dig and tag reads, see core.response_cache.
+TRAILDIG_RESPONSE_CACHE = bool(
+    int(os.environ.get('TRAILDIG_RESPONSE_CACHE', 1))
+)
+TRAILDIG_RESPONSE_CACHE_ALIAS = os.environ.get(
+    'TRAILDIG_RESPONSE_CACHE_ALIAS', 'default'
+)
+TRAILDIG_RESPONSE_CACHE_TIMEOUT = int(
+    os.environ.get('TRAILDIG_RESPONSE_CACHE_TIMEOUT', 300)
+)
+
+# Coalesce concurrent identical cache misses of the expensive reads,
+# within a process and, on PostgreSQL, across processes with an advisory
+# lock, waiting at most the timeout in seconds, see core.singleflight.
+TRAILDIG_COALESCE = bool(int(os.environ.get('TRAILDIG_COALESCE', 1)))
+TRAILDIG_COALESCE_ADVISORY_LOCK = bool(
+    int(os.environ.get('TRAILDIG_COALESCE_ADVISORY_LOCK', 1))
+)
+TRAILDIG_COALESCE_TIMEOUT = float(
+    os.environ.get('TRAILDIG_COALESCE_TIMEOUT', 10)
+)
+
+# Seconds a token authentication is cached, see user.authentication.
+TRAILDIG_AUTH_CACHE_TIMEOUT = int(
+    os.environ.get('TRAILDIG_AUTH_CACHE_TIMEOUT', 60)
+)
+TRAILDIG_AUTH_CACHE_ALIAS = os.environ.get(
+    'TRAILDIG_AUTH_CACHE_ALIAS', 'default'
+)
+
+# Lifetime in seconds of the signed access tokens, 0 to not issue them,
+# and the cache in front of their revocations, see user.access_tokens.
+TRAILDIG_ACCESS_TOKEN_LIFETIME = int(
+    os.environ.get('TRAILDIG_ACCESS_TOKEN_LIFETIME', 300)
+)
+TRAILDIG_ACCESS_TOKEN_CACHE_ALIAS = os.environ.get(
+    'TRAILDIG_ACCESS_TOKEN_CACHE_ALIAS', 'default'
+)
@@ -0,0 +1,563 @@
+"""
+Incrementally maintained aggregates over trail digs.
+
+Writes to digs and to their tag memberships are turned into signed
+contributions, accumulated in an `AggregateDelta` and applied with a
+handful of set-based UPDATE statements. That covers the tag totals, the
+monthly tag rollups and the volunteer leaderboards, see
+core.leaderboards.
+
+Every signal handler applies its own delta, unless the write runs inside
+`deferred()`: a request saving a dig and its tags then applies a single
+delta for all of them, once, before its transaction commits.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import (
+    IntegrityError,
+    connection,
+    transaction,
+)
+from django.db.models import (
+    BigIntegerField,
+    Case,
+    F,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import (
+    Coalesce,
+    ExtractMonth,
+    ExtractYear,
+)
+
+from core import (
+    changes,
+    versions,
+)
+from core.models import (
+    TrailDig,
+    Tag,
+    TagWorkRollup,
+    VolunteerTagTotal,
+    VolunteerTotal,
+)
+
+# Dig columns that aggregates depend on.
+DIG_FIELDS = ('time_minutes', 'number_people', 'date_time', 'user_id')
+
+TrailDigTag = TrailDig.tags.through
+
+# Rows updated per statement, keeping well under backend parameter limits.
+CHUNK_SIZE = 50
+
+_local = threading.local()
+
+UPSERT = '''
+    INSERT INTO {table} ({columns}) VALUES {rows}
+    ON CONFLICT ({keys}) DO UPDATE SET {updates}
+'''
+
+
+def dig_values(traildig):
+    """Return the aggregate relevant values of a trail dig instance."""
+    return {
+        name: TrailDig._meta.get_field(name).to_python(
+            getattr(traildig, name)
+        )
+        for name in DIG_FIELDS
+    }
+
+
+def lock_traildigs(**filters):
+    """Lock matching digs until the transaction ends, return their values.
+
+    Writers of a dig or of its tag links lock the dig before reading what
+    they count, so concurrent writes to the same dig are counted one after
+    the other, each against what the previous one committed. Returns the
+    stored aggregate relevant values by dig id.
+    """
+    rows = TrailDig.objects.select_for_update().filter(**filters).order_by(
+        'pk',
+    ).values('pk', *DIG_FIELDS)
+    return {row.pop('pk'): row for row in rows}
+
+
+def memberships(digs, **filters):
+    """Return (tag_id, tag name, dig values) for matching through rows.
+
+    digs maps the ids of locked digs to their values, see
+    `lock_traildigs`. Rows of other digs are skipped.
+    """
+    rows = TrailDigTag.objects.filter(**filters).values_list(
+        'traildig_id', 'tag_id', 'tag__name',
+    )
+    for traildig_id, tag_id, tag_name in rows:
+        if traildig_id in digs:
+            yield tag_id, tag_name, digs[traildig_id]
+
+
+class AggregateDelta:
+    """Accumulate dig contributions and apply them in bulk.
+
+    Applying also bumps the change version of the owners of the tags
+    counted and of `user_ids`, see core.versions, and records the changes
+    of the tags counted and of the objects passed to `record`, once each,
+    see core.changes.
+
+    The names of the tags counted are read when applying, unless they
+    were put in `tag_names`.
+    """
+
+    def __init__(self):
+        self.tag_minutes = defaultdict(int)
+        self.rollups = defaultdict(lambda: [0, 0])
+        self.user_ids = set()
+        self.volunteer_minutes = defaultdict(int)
+        self.volunteer_tag_minutes = defaultdict(int)
+        self.tag_names = {}
+        self.changed = {}
+
+    def add(self, tag_ids, dig, sign=1):
+        """Count a dig towards (or, with sign=-1, against) tags."""
+        minutes = sign * dig['time_minutes']
+        person_minutes = minutes * dig['number_people']
+        period = (dig['date_time'].year, dig['date_time'].month)
+        for tag_id in tag_ids:
+            self.tag_minutes[tag_id] += minutes
+            rollup = self.rollups[(tag_id,) + period]
+            rollup[0] += minutes
+            rollup[1] += person_minutes
+            self.volunteer_tag_minutes[(dig['user_id'], tag_id)] += (
+                person_minutes
+            )
+
+    def add_memberships(self, rows, sign=1):
+        """Count (tag_id, tag name, dig values) rows."""
+        for tag_id, tag_name, dig in rows:
+            self.tag_names[tag_id] = tag_name
+            self.add([tag_id], dig, sign)
+
+    def add_dig(self, dig, sign=1):
+        """Count a dig towards (or against) its volunteer's total."""
+        self.volunteer_minutes[dig['user_id']] += (
+            sign * dig['time_minutes'] * dig['number_people']
+        )
+
+    def record(self, kind, pairs, deleted=False):
+        """Record changes of (object id, owner id), the latest one wins."""
+        for object_id, user_id in pairs:
+            self.changed[(kind, object_id)] = (user_id, deleted)
+
+    def apply(self):
+        """Write the accumulated changes to the database."""
+        tag_minutes = {
+            tag_id: minutes
+            for tag_id, minutes in self.tag_minutes.items() if minutes
+        }
+        for chunk in _chunks(list(tag_minutes)):
+            Tag.objects.filter(pk__in=chunk).update(
+                work_done_minutes=F('work_done_minutes') + Case(
+                    *[When(pk=tag_id, then=Value(tag_minutes[tag_id]))
+                      for tag_id in chunk],
+                    output_field=BigIntegerField(),
+                ),
+            )
+        versions.touch(self.user_ids, list(self.tag_minutes))
+        changes.record_tags(tag_minutes)
+        self.tag_minutes.clear()
+        self.user_ids.clear()
+
+        recorded = defaultdict(dict)
+        for (kind, object_id), (user_id, deleted) in self.changed.items():
+            recorded[(kind, deleted)][object_id] = user_id
+        for (kind, deleted), pairs in recorded.items():
+            changes.record(kind, pairs.items(), deleted)
+        self.changed.clear()
+
+        _bump_rollups({
+            key: tuple(change)
+            for key, change in self.rollups.items() if any(change)
+        })
+        self.rollups.clear()
+
+        self.apply_leaderboards()
+
+    def apply_leaderboards(self):
+        """Write the accumulated volunteer totals."""
+        _bump_volunteer_totals({
+            (user_id,): (person_minutes,)
+            for user_id, person_minutes in self.volunteer_minutes.items()
+            if person_minutes
+        })
+        self.volunteer_minutes.clear()
+
+        changed = {
+            key: person_minutes
+            for key, person_minutes in self.volunteer_tag_minutes.items()
+            if person_minutes
+        }
+        unnamed = {tag_id for _, tag_id in changed} - set(self.tag_names)
+        if unnamed:
+            self.tag_names.update(
+                Tag.objects.filter(pk__in=unnamed).values_list('id', 'name')
+            )
+        by_name = defaultdict(int)
+        for (user_id, tag_id), person_minutes in changed.items():
+            by_name[(user_id, self.tag_names[tag_id])] += person_minutes
+        _bump_volunteer_tag_totals({
+            key: (person_minutes,)
+            for key, person_minutes in by_name.items() if person_minutes
+        })
+        self.volunteer_tag_minutes.clear()
+
+
+@contextmanager
+def deferred():
+    """Apply the bookkeeping of the dig writes inside once, at the end.
+
+    Runs the block in a transaction. The signal handlers add to one delta,
+    applied before it commits, instead of each applying their own. Nested
+    blocks share the outermost delta.
+    """
+    if getattr(_local, 'delta', None) is not None:
+        yield _local.delta
+        return
+    with transaction.atomic():
+        _local.delta = delta = AggregateDelta()
+        try:
+            yield delta
+        finally:
+            _local.delta = None
+        delta.apply()
+
+
+@contextmanager
+def collect():
+    """Yield the delta of the enclosing `deferred` block.
+
+    Outside of one, yields a new delta applied on exit.
+    """
+    delta = getattr(_local, 'delta', None)
+    if delta is not None:
+        yield delta
+        return
+    delta = AggregateDelta()
+    yield delta
+    delta.apply()
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    """Split a list into lists of at most size items."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _can_upsert():
+    """Return whether the database has INSERT ... ON CONFLICT DO UPDATE."""
+    if connection.vendor == 'postgresql':
+        return True
+    return (
+        connection.vendor == 'sqlite'
+        and connection.Database.sqlite_version_info >= (3, 24)
+    )
+
+
+def _upsert(model, key_fields, value_fields, changes):
+    """Add to counter rows, one INSERT ... ON CONFLICT per chunk."""
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    keys = [quote(model._meta.get_field(name).column) for name in key_fields]
+    values = [
+        quote(model._meta.get_field(name).column) for name in value_fields
+    ]
+    updates = ', '.join(
+        f'{column} = {table}.{column} + EXCLUDED.{column}'
+        for column in values
+    )
+    placeholders = '({})'.format(', '.join(['%s'] * (len(keys) + len(values))))
+    for chunk in _chunks(list(changes)):
+        sql = UPSERT.format(
+            table=table,
+            columns=', '.join(keys + values),
+            rows=', '.join([placeholders] * len(chunk)),
+            keys=', '.join(keys),
+            updates=updates,
+        )
+        params = []
+        for key in chunk:
+            params.extend(key)
+            params.extend(changes[key])
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+def _bump(model, key_fields, value_fields, changes):
+    """Add to counter rows, creating the missing ones.
+
+    ``changes`` maps tuples of `key_fields` values to tuples of amounts
+    added to `value_fields`. Upserts where the database can, otherwise
+    updates the existing rows and inserts the others.
+    """
+    if _can_upsert():
+        _upsert(model, key_fields, value_fields, changes)
+        return
+    for chunk in _chunks(list(changes)):
+        keys = Q()
+        for key in chunk:
+            keys |= Q(**dict(zip(key_fields, key)))
+
+        def column(index):
+            return Case(
+                *[When(**dict(zip(key_fields, key)),
+                       then=Value(changes[key][index]))
+                  for key in chunk],
+                output_field=BigIntegerField(),
+            )
+
+        updated = model.objects.filter(keys).update(**{
+            name: F(name) + column(index)
+            for index, name in enumerate(value_fields)
+        })
+        if updated == len(chunk):
+            continue
+
+        existing = set(model.objects.filter(keys).values_list(*key_fields))
+        missing = [key for key in chunk if key not in existing]
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create([
+                    model(
+                        **dict(zip(key_fields, key)),
+                        **dict(zip(value_fields, changes[key])),
+                    )
+                    for key in missing
+                ])
+        except IntegrityError:
+            # A concurrent writer created some of the rows first.
+            _bump(
+                model,
+                key_fields,
+                value_fields,
+                {key: changes[key] for key in missing},
+            )
+
+
+def _bump_rollups(changes):
+    """Add to monthly rollups, creating the missing rows.
+
+    ``changes`` maps (tag_id, year, month) to (minutes, person_minutes).
+    """
+    _bump(
+        TagWorkRollup,
+        ('tag_id', 'year', 'month'),
+        ('time_minutes', 'person_minutes'),
+        changes,
+    )
+
+
+def _bump_volunteer_totals(changes):
+    """Add to volunteer totals, ``changes`` maps (user_id,) to a tuple."""
+    _bump(VolunteerTotal, ('user_id',), ('person_minutes',), changes)
+
+
+def _bump_volunteer_tag_totals(changes):
+    """Add to volunteer tag totals keyed by (user_id, tag name)."""
+    _bump(
+        VolunteerTagTotal,
+        ('user_id', 'tag_name'),
+        ('person_minutes',),
+        changes,
+    )
+
+
+def _tag_volunteer_minutes(tag_id):
+    """Return the person-minutes per volunteer of the digs with a tag."""
+    rows = TrailDigTag.objects.filter(tag_id=tag_id).values(
+        'traildig__user_id',
+    ).annotate(
+        total=Sum(F('traildig__time_minutes') * F('traildig__number_people')),
+    ).order_by()
+    return {row['traildig__user_id']: row['total'] for row in rows}
+
+
+def rename_tag_totals(tag_id, old_name, new_name):
+    """Move the volunteer totals of a tag's digs to its new name."""
+    changes = {}
+    for user_id, total in _tag_volunteer_minutes(tag_id).items():
+        if total:
+            changes[(user_id, old_name)] = (-total,)
+            changes[(user_id, new_name)] = (total,)
+    _bump_volunteer_tag_totals(changes)
+
+
+def withdraw_tag_totals(tag_id, name):
+    """Withdraw the digs of a tag about to be deleted from its board.
+
+    Deleting a tag removes its through rows without m2m signals.
+    """
+    _bump_volunteer_tag_totals({
+        (user_id, name): (-total,)
+        for user_id, total in _tag_volunteer_minutes(tag_id).items()
+        if total
+    })
+
+
+def expected_tag_minutes():
+    """Return a subquery computing the tag total from scratch."""
+    totals = TrailDig.objects.filter(
+        tags=OuterRef('pk'),
+    ).values('tags').annotate(
+        total=Sum('time_minutes', output_field=BigIntegerField()),
+    ).values('total')
+    return Coalesce(Subquery(totals), 0)
+
+
+def stale_tags():
+    """Return tags whose stored total differs from the digs."""
+    return Tag.objects.annotate(
+        expected_minutes=expected_tag_minutes(),
+    ).exclude(work_done_minutes=F('expected_minutes'))
+
+
+def rebuild_tag_totals():
+    """Recompute every tag total in a single statement."""
+    return Tag.objects.update(work_done_minutes=expected_tag_minutes())
+
+
+def expected_rollups():
+    """Return the monthly rollups computed from scratch."""
+    rows = TrailDig.objects.filter(tags__isnull=False).annotate(
+        year=ExtractYear('date_time'),
+        month=ExtractMonth('date_time'),
+    ).values('tags', 'year', 'month').annotate(
+        total_minutes=Sum('time_minutes'),
+        total_person_minutes=Sum(F('time_minutes') * F('number_people')),
+    ).order_by()
+    return {
+        (row['tags'], row['year'], row['month']): (
+            row['total_minutes'],
+            row['total_person_minutes'],
+        )
+        for row in rows
+    }
+
+
+def stale_rollups():
+    """Return the (tag_id, year, month) keys of out of date rollups."""
+    expected = expected_rollups()
+    stored = {
+        (tag_id, year, month): (minutes, person_minutes)
+        for tag_id, year, month, minutes, person_minutes
+        in TagWorkRollup.objects.values_list(
+            'tag_id', 'year', 'month', 'time_minutes', 'person_minutes',
+        )
+    }
+    return sorted(
+        key for key in expected.keys() | stored.keys()
+        if expected.get(key, (0, 0)) != stored.get(key, (0, 0))
+    )
+
+
+@transaction.atomic
+def rebuild_rollups():
+    """Replace every monthly rollup with freshly computed rows."""
+    TagWorkRollup.objects.all().delete()
+    rollups = TagWorkRollup.objects.bulk_create(
+        [
+            TagWorkRollup(
+                tag_id=tag_id,
+                year=year,
+                month=month,
+                time_minutes=minutes,
+                person_minutes=person_minutes,
+            )
+            for (tag_id, year, month), (minutes, person_minutes)
+            in expected_rollups().items()
+        ],
+        batch_size=1000,
+    )
+    return len(rollups)
+
+
+def dig_person_minutes():
+    """Return the person-minutes expression of a dig."""
+    return Sum(F('time_minutes') * F('number_people'))
+
+
+def expected_volunteer_totals():
+    """Return the volunteer totals computed from scratch, by user id."""
+    rows = TrailDig.objects.values('user_id').annotate(
+        total=dig_person_minutes(),
+    ).order_by()
+    return {row['user_id']: row['total'] for row in rows if row['total']}
+
+
+def expected_volunteer_tag_totals():
+    """Return the volunteer tag totals from scratch, by (user id, name)."""
+    rows = TrailDig.objects.filter(tags__isnull=False).values(
+        'user_id', 'tags__name',
+    ).annotate(total=dig_person_minutes()).order_by()
+    return {
+        (row['user_id'], row['tags__name']): row['total']
+        for row in rows if row['total']
+    }
+
+
+def _stale(expected, stored):
+    """Return the sorted keys where stored and expected totals differ."""
+    return sorted(
+        key for key in expected.keys() | stored.keys()
+        if expected.get(key, 0) != stored.get(key, 0)
+    )
+
+
+def stale_volunteer_totals():
+    """Return the user ids of out of date volunteer totals."""
+    return _stale(
+        expected_volunteer_totals(),
+        dict(VolunteerTotal.objects.values_list('user_id', 'person_minutes')),
+    )
+
+
+def stale_volunteer_tag_totals():
+    """Return the (user id, tag name) keys of out of date totals."""
+    stored = {
+        (user_id, tag_name): total
+        for user_id, tag_name, total in VolunteerTagTotal.objects.values_list(
+            'user_id', 'tag_name', 'person_minutes',
+        )
+    }
+    return _stale(expected_volunteer_tag_totals(), stored)
+
+
+@transaction.atomic
+def rebuild_leaderboards():
+    """Replace every volunteer total, return the number of rows."""
+    VolunteerTotal.objects.all().delete()
+    VolunteerTagTotal.objects.all().delete()
+    totals = VolunteerTotal.objects.bulk_create(
+        [
+            VolunteerTotal(user_id=user_id, person_minutes=total)
+            for user_id, total in expected_volunteer_totals().items()
+        ],
+        batch_size=1000,
+    )
+    tag_totals = VolunteerTagTotal.objects.bulk_create(
+        [
+            VolunteerTagTotal(
+                user_id=user_id,
+                tag_name=tag_name,
+                person_minutes=total,
+            )
+            for (user_id, tag_name), total
+            in expected_volunteer_tag_totals().items()
+        ],
+        batch_size=1000,
+    )
+    return len(totals) + len(tag_totals)
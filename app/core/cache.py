@@ -0,0 +1,521 @@
+"""
+Two tier cache backend: a bounded LRU in each process in front of a cache
+shared by every worker and node.
+
+Reads are served from the local tier while its entry is fresh, then from
+the shared tier, whose answer, a miss included, is kept locally for up
+to LOCAL_TIMEOUT seconds. Writes go to the shared tier and are broadcast
+so the other processes drop their local copy:
+
+- ``generation``, the default: counters in a memory mapped file, one
+  per slot of keys hashed into GENERATION_SLOTS slots. A write bumps
+  the slot of its key; a process seeing slots move drops its local
+  entries in them only. Only covers the processes of one node.
+- ``postgres``: a NOTIFY on a channel every process LISTENs to, from a
+  background thread holding a connection of its own for the life of the
+  process. Works across nodes, at the cost of a pg_notify on the
+  database for every write. `stop_invalidations` closes the listeners;
+  it runs at exit and before the test runner drops the test databases.
+- ``auto``: postgres on PostgreSQL, generation otherwise.
+
+LOCAL_TIMEOUT bounds how stale a local entry gets should a broadcast be
+missed. Configure it in CACHES::
+
+    'default': {
+        'BACKEND': 'core.cache.TwoTierCache',
+        'OPTIONS': {
+            'SHARED': 'shared',         # alias of the shared cache
+            'MAX_ENTRIES': 1000,        # local entries
+            'MAX_SIZE': 32 * 1024 ** 2,  # local bytes, pickled
+            'LOCAL_TIMEOUT': 60,
+            'INVALIDATION': 'generation',
+        },
+    },
+
+Cache traffic is left out of the view query budgets.
+"""
+import atexit
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import select
+import struct
+import tempfile
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from time import monotonic
+
+from django.core.cache import caches
+from django.core.cache.backends.base import (
+    DEFAULT_TIMEOUT,
+    BaseCache,
+)
+from django.db import connections
+
+from core.query_budget import unbudgeted
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNEL = 'traildig_cache'
+# Seconds between reconnection attempts of a lost listener.
+LISTEN_RETRY = 5
+CLEAR = '*'
+# Slots the keys are hashed into by the generation invalidation.
+GENERATION_SLOTS = 4096
+# Local entry of a key missing from the shared tier; no pickle is empty.
+ABSENT = b''
+
+_missing = object()
+
+
+class LocalTier:
+    """LRU of pickled values with an expiry, bounded in entries and bytes.
+
+    `epoch` moves on every invalidation, letting a reader check nothing
+    was invalidated while it fetched a value from the shared tier.
+    """
+
+    def __init__(self, max_entries, max_size):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.epoch = 0
+        self.generation = None
+
+    def get(self, key):
+        """Return the pickled value of key, or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, pickled = entry
+            if expires_at <= monotonic():
+                self._pop(key)
+                return None
+            self.entries.move_to_end(key)
+            return pickled
+
+    def set(self, key, pickled, timeout, epoch=None):
+        """Keep a pickled value for timeout seconds.
+
+        Nothing is kept when epoch is given and an invalidation happened
+        since it was read.
+        """
+        if timeout <= 0 or len(pickled) > self.max_size:
+            return
+        with self.lock:
+            if epoch is not None and epoch != self.epoch:
+                return
+            self._pop(key)
+            self.entries[key] = (monotonic() + timeout, pickled)
+            self.size += len(pickled)
+            while (
+                len(self.entries) > self.max_entries
+                or self.size > self.max_size
+            ):
+                self._pop(next(iter(self.entries)))
+
+    def delete(self, key):
+        """Drop key."""
+        with self.lock:
+            self.epoch += 1
+            self._pop(key)
+
+    def delete_matching(self, predicate):
+        """Drop the keys predicate is true for."""
+        with self.lock:
+            self.epoch += 1
+            for key in [key for key in self.entries if predicate(key)]:
+                self._pop(key)
+
+    def clear(self):
+        """Drop every entry."""
+        with self.lock:
+            self.epoch += 1
+            self.entries.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+class GenerationCounter:
+    """Counters in a memory mapped file, shared by the processes of a node.
+
+    Slot 0 moves on clears, the others on writes of the keys hashing to
+    them, see `slot`.
+    """
+
+    def __init__(self, path, slots=GENERATION_SLOTS):
+        self.slots = slots
+        size = 8 * (slots + 1)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+        self.map = mmap.mmap(self.fd, size)
+
+    def slot(self, key):
+        """Return the slot of a key, stable across processes."""
+        if key == CLEAR:
+            return 0
+        return zlib.crc32(key.encode()) % self.slots + 1
+
+    def values(self):
+        """Return a copy of every counter, as bytes."""
+        return self.map[:]
+
+    def value(self, slot):
+        """Return the current generation of a slot."""
+        return struct.unpack_from('Q', self.map, 8 * slot)[0]
+
+    def bump(self, slot):
+        """Move a slot to its next generation and return it."""
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            value = self.value(slot) + 1
+            struct.pack_into('Q', self.map, 8 * slot, value)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        return value
+
+
+class GenerationInvalidation:
+    """Drop the local entries of the keys other processes wrote."""
+
+    def __init__(self, tier, path):
+        self.tier = tier
+        self.counter = GenerationCounter(path)
+        tier.generation = bytearray(self.counter.values())
+
+    def check(self):
+        """Drop the local entries whose slot moved."""
+        values = self.counter.values()
+        if values == self.tier.generation:
+            return
+        moved = {
+            slot
+            for slot, (seen, current) in enumerate(zip(
+                struct.iter_unpack('Q', self.tier.generation),
+                struct.iter_unpack('Q', values),
+            ))
+            if seen != current
+        }
+        if 0 in moved:
+            self.tier.clear()
+        else:
+            self.tier.delete_matching(
+                lambda key: self.counter.slot(key) in moved,
+            )
+        self.tier.generation = bytearray(values)
+
+    def publish(self, key):
+        """Tell the other processes key changed."""
+        slot = self.counter.slot(key)
+        value = self.counter.bump(slot)
+        seen = struct.unpack_from('Q', self.tier.generation, 8 * slot)[0]
+        if value == seen + 1:
+            # Nobody else wrote the slot in between, the local tier is
+            # current.
+            struct.pack_into('Q', self.tier.generation, 8 * slot, value)
+
+
+class PostgresInvalidation:
+    """Broadcast changed keys with NOTIFY and LISTEN for the others'."""
+
+    def __init__(self, tier, database, channel):
+        self.tier = tier
+        self.database = database
+        self.channel = channel
+        # Tells this process's notifications apart from the others'.
+        self.origin = uuid.uuid4().hex
+        self.stopped = threading.Event()
+        # Written to by stop, wakes the listener up from its select.
+        self.wake_read, self.wake_write = os.pipe()
+        self.listener = threading.Thread(
+            target=self.listen_forever,
+            name=f'cache-listener-{channel}',
+            daemon=True,
+        )
+        self.listener.start()
+
+    def check(self):
+        """Nothing to do, invalidations arrive in the background."""
+
+    def publish(self, key):
+        """Tell the other processes key changed."""
+        with unbudgeted(), connections[self.database].cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, %s)',
+                [self.channel, f'{self.origin} {key}'],
+            )
+
+    def handle(self, payload):
+        """Apply a notification."""
+        origin, _, key = payload.partition(' ')
+        if origin == self.origin:
+            return
+        if key == CLEAR:
+            self.tier.clear()
+        else:
+            self.tier.delete(key)
+
+    def stop(self, timeout=LISTEN_RETRY):
+        """Stop listening and close the listener's connection."""
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        os.write(self.wake_write, b'x')
+        self.listener.join(timeout)
+        if not self.listener.is_alive():
+            os.close(self.wake_read)
+            os.close(self.wake_write)
+
+    def listen_forever(self):
+        """Follow the notifications, reconnecting when needed."""
+        while not self.stopped.is_set():
+            try:
+                self.listen()
+            except Exception:
+                logger.exception('Cache invalidation listener failed.')
+            self.stopped.wait(LISTEN_RETRY)
+
+    def listen(self):
+        """Follow the notifications on a dedicated connection."""
+        wrapper = connections[self.database]
+        conn = wrapper.get_new_connection(wrapper.get_connection_params())
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            # Notifications may have been missed while not listening.
+            self.tier.clear()
+            while not self.stopped.is_set():
+                select.select([conn, self.wake_read], [], [], LISTEN_RETRY)
+                conn.poll()
+                while conn.notifies:
+                    self.handle(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+
+class Broadcast:
+    """The local tier and invalidation shared by a process's threads."""
+
+    def __init__(self, tier, invalidation):
+        self.pid = os.getpid()
+        self.tier = tier
+        self.invalidation = invalidation
+
+
+_broadcasts = {}
+_broadcasts_lock = threading.Lock()
+
+
+@atexit.register
+def stop_invalidations():
+    """Stop the invalidations of this process, closing their connections.
+
+    The caches set up new ones when used again.
+    """
+    with _broadcasts_lock:
+        broadcasts = [
+            broadcast for broadcast in _broadcasts.values()
+            if broadcast.pid == os.getpid()
+        ]
+        _broadcasts.clear()
+    for broadcast in broadcasts:
+        stop = getattr(broadcast.invalidation, 'stop', None)
+        if stop is not None:
+            stop()
+
+
+class TwoTierCache(BaseCache):
+    """Per process LRU in front of a shared cache, see the module."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.max_size = options.get('MAX_SIZE', 32 * 1024 ** 2)
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        self.invalidation = options.get('INVALIDATION', 'generation')
+        self.database = options.get('DATABASE', 'default')
+        self.channel = options.get('CHANNEL', DEFAULT_CHANNEL)
+        self.name = hashlib.sha1(
+            repr((location, sorted(options.items()))).encode(),
+        ).hexdigest()[:16]
+        self.generation_file = options.get(
+            'GENERATION_FILE',
+            os.path.join(
+                tempfile.gettempdir(),
+                f'traildig-cache-{self.name}.gen',
+            ),
+        )
+
+    @property
+    def shared(self):
+        """Return the shared tier."""
+        return caches[self.shared_alias]
+
+    def broadcast(self):
+        """Return this process's local tier and invalidation."""
+        broadcast = _broadcasts.get(self.name)
+        if broadcast is not None and broadcast.pid == os.getpid():
+            return broadcast
+        with _broadcasts_lock:
+            broadcast = _broadcasts.get(self.name)
+            # Forked workers start over, the listener thread is gone.
+            if broadcast is None or broadcast.pid != os.getpid():
+                tier = LocalTier(self._max_entries, self.max_size)
+                broadcast = Broadcast(tier, self.make_invalidation(tier))
+                _broadcasts[self.name] = broadcast
+        return broadcast
+
+    def make_invalidation(self, tier):
+        """Return the invalidation configured for tier."""
+        mode = self.invalidation
+        if mode == 'auto':
+            vendor = connections[self.database].vendor
+            mode = 'postgres' if vendor == 'postgresql' else 'generation'
+        if mode == 'postgres':
+            return PostgresInvalidation(tier, self.database, self.channel)
+        if mode == 'generation':
+            return GenerationInvalidation(tier, self.generation_file)
+        return None
+
+    def local(self):
+        """Return the local tier, checked for invalidations."""
+        broadcast = self.broadcast()
+        if broadcast.invalidation is not None:
+            broadcast.invalidation.check()
+        return broadcast.tier
+
+    def publish(self, key):
+        """Drop key from the other processes' local tiers."""
+        invalidation = self.broadcast().invalidation
+        if invalidation is not None:
+            invalidation.publish(key)
+
+    def local_timeout_for(self, timeout):
+        """Return how long a value set with timeout is kept locally."""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.local_timeout
+        return min(self.local_timeout, timeout)
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_key(key, version)
+        tier = self.local()
+        pickled = tier.get(local_key)
+        if pickled == ABSENT:
+            return default
+        if pickled is not None:
+            return pickle.loads(pickled)
+
+        epoch = tier.epoch
+        with unbudgeted():
+            value = self.shared.get(key, _missing, version=version)
+        if value is _missing:
+            tier.set(local_key, ABSENT, self.local_timeout, epoch)
+            return default
+        tier.set(
+            local_key,
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+            self.local_timeout,
+            epoch,
+        )
+        return value
+
+    def get_many(self, keys, version=None):
+        tier = self.local()
+        found = {}
+        missing = []
+        for key in keys:
+            pickled = tier.get(self.make_key(key, version))
+            if pickled is None:
+                missing.append(key)
+            elif pickled != ABSENT:
+                found[key] = pickle.loads(pickled)
+        if missing:
+            epoch = tier.epoch
+            with unbudgeted():
+                shared = self.shared.get_many(missing, version=version)
+            for key in missing:
+                pickled = ABSENT
+                if key in shared:
+                    pickled = pickle.dumps(
+                        shared[key], pickle.HIGHEST_PROTOCOL,
+                    )
+                tier.set(
+                    self.make_key(key, version),
+                    pickled,
+                    self.local_timeout,
+                    epoch,
+                )
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_key(key, version)
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with unbudgeted():
+            self.shared.set(key, value, timeout=timeout, version=version)
+        self.publish(local_key)
+        tier = self.local()
+        tier.delete(local_key)
+        tier.set(local_key, pickled, self.local_timeout_for(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with unbudgeted():
+            added = self.shared.add(
+                key, value, timeout=timeout, version=version,
+            )
+        local_key = self.make_key(key, version)
+        if added:
+            self.publish(local_key)
+        # Also drops a stale miss when the key turned out to exist.
+        self.local().delete(local_key)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        with unbudgeted():
+            return self.shared.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        local_key = self.make_key(key, version)
+        with unbudgeted():
+            deleted = self.shared.delete(key, version=version)
+        self.publish(local_key)
+        self.local().delete(local_key)
+        return deleted
+
+    def has_key(self, key, version=None):
+        pickled = self.local().get(self.make_key(key, version))
+        if pickled is not None:
+            return pickled != ABSENT
+        with unbudgeted():
+            return self.shared.has_key(key, version=version)  # noqa: W601
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self.make_key(key, version)
+        with unbudgeted():
+            value = self.shared.incr(key, delta, version=version)
+        self.publish(local_key)
+        self.local().delete(local_key)
+        return value
+
+    def clear(self):
+        with unbudgeted():
+            self.shared.clear()
+        self.publish(CLEAR)
+        self.local().clear()
@@ -0,0 +1,301 @@
+"""
+Change feeds of trail digs and tags for offline clients.
+
+Every write to a dig or tag records a `Change` row for the object. Only
+the latest change of an object is kept: recording one replaces the
+previous row with one taking a new auto-increment id, which moves the
+object to the end of its feed. Reading the changes past a cursor is then
+a range scan of the (kind, id) index, proportional to what changed.
+
+Deleting an object, directly or by cascade from its owner, leaves a
+tombstone row. Tombstones are pruned after
+TRAILDIG_CHANGES_RETENTION_DAYS, see `prune`, and cursors older than that
+are refused: their clients have to download everything again.
+
+Digs render their tags by name, so renaming or deleting a tag records
+its digs as changed. Tag totals only move in the tag feed.
+
+The bookkeeping is done by the signal handlers in core.signals, through
+`AggregateDelta.apply`, and by the bulk write paths. On PostgreSQL,
+transactions recording changes NOTIFY `CHANNEL` once they commit, waking
+the subscribers of traildig.events.
+
+Ids are handed out before the writes commit, so a reader could see a
+change past one still uncommitted and move its cursor beyond it. Readers
+never block writers for that: each transaction recording changes holds a
+shared advisory lock on an id below every id it writes, and `since` only
+returns the changes below the lowest such id, see `visible_bound`. The
+feed then lags behind a long transaction instead of waiting for it.
+"""
+import base64
+import binascii
+from datetime import (
+    datetime,
+    timedelta,
+    timezone as dt_timezone,
+)
+
+from django.conf import settings
+from django.db import (
+    connection,
+    transaction,
+)
+from django.utils import timezone
+
+from core.models import (
+    Change,
+    Tag,
+)
+from core.query_budget import unbudgeted
+
+TRAILDIG = Change.KIND_TRAILDIG
+TAG = Change.KIND_TAG
+
+CHANNEL = 'traildig_changes'
+
+# The transactions recording changes hold a shared advisory lock on the
+# bigint key IN_FLIGHT_LOCK << IN_FLIGHT_SHIFT | id, for an id below
+# theirs. Change ids stay below 2 ** IN_FLIGHT_SHIFT.
+IN_FLIGHT_LOCK = 0x7464
+IN_FLIGHT_SHIFT = 48
+
+# Objects recorded per statement, keeping under backend parameter limits.
+CHUNK_SIZE = 500
+
+COLUMNS = ('kind', 'object_id', 'user_id', 'deleted', 'changed_at')
+
+# On PostgreSQL, a recorded object takes a new id in place.
+UPSERT = '''
+    INSERT INTO {table} ({columns})
+    {rows}
+    ON CONFLICT (kind, object_id) DO UPDATE SET
+        id = nextval(pg_get_serial_sequence(%s, 'id')),
+        user_id = EXCLUDED.user_id,
+        deleted = EXCLUDED.deleted,
+        changed_at = EXCLUDED.changed_at
+'''
+
+INSERT = '''
+    INSERT INTO {table} ({columns})
+    {rows}
+'''
+
+
+def _write(rows, params, replaced):
+    """Insert rows, a VALUES list or a SELECT, replacing older changes.
+
+    replaced are the changes to delete first where there is no upsert.
+    """
+    table = Change._meta.db_table
+    columns = ', '.join(connection.ops.quote_name(name) for name in COLUMNS)
+    if connection.vendor != 'postgresql':
+        replaced.delete()
+        sql = INSERT.format(
+            table=connection.ops.quote_name(table),
+            columns=columns,
+            rows=rows,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+        return
+
+    sql = UPSERT.format(
+        table=connection.ops.quote_name(table),
+        columns=columns,
+        rows=rows,
+    )
+    with transaction.atomic(savepoint=False):
+        _begin_recording()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*params, table])
+
+
+def _notify():
+    with unbudgeted(), connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, ''])
+
+
+def _begin_recording():
+    """Hold back readers and NOTIFY on commit, once per transaction.
+
+    The advisory lock is taken on a new value of the id sequence, below
+    every id the transaction writes after it, and released when it ends.
+    """
+    if any(func is _notify for _, func in connection.run_on_commit):
+        return
+    with unbudgeted(), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock_shared("
+            "(%s::bigint << %s) | nextval(pg_get_serial_sequence(%s, 'id')))",
+            [IN_FLIGHT_LOCK, IN_FLIGHT_SHIFT, Change._meta.db_table],
+        )
+    transaction.on_commit(_notify)
+
+
+def _flags(deleted):
+    """Return the deleted and changed at column values of new changes."""
+    return [
+        deleted,
+        Change._meta.get_field('changed_at').get_db_prep_value(
+            timezone.now(),
+            connection,
+        ),
+    ]
+
+
+def record(kind, pairs, deleted=False):
+    """Record (object id, owner id) pairs as the latest changes."""
+    pairs = list(dict(pairs).items())
+    for start in range(0, len(pairs), CHUNK_SIZE):
+        chunk = pairs[start:start + CHUNK_SIZE]
+        flags = _flags(deleted)
+        params = []
+        for object_id, user_id in chunk:
+            params.extend([kind, object_id, user_id, *flags])
+        _write(
+            'VALUES ' + ', '.join(['(%s, %s, %s, %s, %s)'] * len(chunk)),
+            params,
+            Change.objects.filter(
+                kind=kind,
+                object_id__in=[object_id for object_id, _ in chunk],
+            ),
+        )
+
+
+def record_objects(kind, objects, deleted=False):
+    """Record changes of model instances."""
+    record(kind, [(obj.pk, obj.user_id) for obj in objects], deleted)
+
+
+def record_queryset(kind, queryset):
+    """Record changes of the objects of a queryset, without reading it."""
+    sql, params = queryset.values(
+        'id', 'user_id',
+    ).distinct().query.sql_with_params()
+    _write(
+        f'SELECT %s, src.id, src.user_id, %s, %s FROM ({sql}) src',
+        [kind, *_flags(False), *params],
+        Change.objects.filter(
+            kind=kind,
+            object_id__in=queryset.values('id'),
+        ),
+    )
+
+
+def record_tags(tag_ids):
+    """Record changes of tags by id."""
+    if tag_ids:
+        record_queryset(TAG, Tag.objects.filter(pk__in=list(tag_ids)))
+
+
+def visible_bound():
+    """Return the id from which changes may still be uncommitted.
+
+    That is the lowest id held by a transaction recording changes, or
+    the next id of the sequence. Read in that order: a writer missing
+    from the locks writes ids past the sequence value read before. None
+    on SQLite, which has a single writer.
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_sequence_last_value("
+            "pg_get_serial_sequence(%s, 'id')::regclass)",
+            [Change._meta.db_table],
+        )
+        last_value = cursor.fetchone()[0] or 0
+        # A bigint key shows as its high 32 bits in classid and its low
+        # 32 bits in objid. Other advisory locks of the app are exclusive.
+        cursor.execute(
+            """
+            SELECT min(
+                ((classid::bigint << 32) | objid::bigint)
+                & ((1::bigint << %s) - 1)
+            )
+            FROM pg_locks
+            WHERE locktype = 'advisory' AND objsubid = 1
+                AND mode = 'ShareLock'
+                AND (classid::bigint >> (%s - 32)) = %s
+                AND database = (
+                    SELECT oid FROM pg_database
+                    WHERE datname = current_database()
+                )
+            """,
+            [IN_FLIGHT_SHIFT, IN_FLIGHT_SHIFT, IN_FLIGHT_LOCK],
+        )
+        in_flight = cursor.fetchone()[0]
+    if in_flight is None:
+        return last_value + 1
+    return min(last_value + 1, in_flight)
+
+
+def _visible():
+    """Return the changes no writer in progress can come before."""
+    changes = Change.objects.all()
+    bound = visible_bound()
+    if bound is not None:
+        changes = changes.filter(id__lt=bound)
+    return changes
+
+
+def latest_id():
+    """Return the id of the latest visible change, 0 without any."""
+    change = _visible().order_by('-id').only('id').first()
+    return change.id if change else 0
+
+
+def since(kind, after, limit, user_id=None):
+    """Return the first changes past the change id after, in order.
+
+    kind None returns the changes of every kind. Changes that a writer
+    still in progress could come before are held back.
+    """
+    changes = _visible().filter(id__gt=after)
+    if kind is not None:
+        changes = changes.filter(kind=kind)
+    if user_id is not None:
+        changes = changes.filter(user_id=user_id)
+    return list(changes.order_by('id')[:limit])
+
+
+def horizon():
+    """Return the time before which tombstones may have been pruned."""
+    return timezone.now() - timedelta(
+        days=settings.TRAILDIG_CHANGES_RETENTION_DAYS,
+    )
+
+
+def prune():
+    """Delete the tombstones past the retention, return their count."""
+    deleted, _ = Change.objects.filter(
+        deleted=True,
+        changed_at__lt=horizon(),
+    ).delete()
+    return deleted
+
+
+def encode_cursor(after, synced_at):
+    """Return the cursor resuming a feed after a change id.
+
+    synced_at is when the client's copy was last complete, tombstones
+    needed by the client are not older.
+    """
+    value = f'{after}:{int(synced_at.timestamp())}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the (change id, synced at) of a cursor."""
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+        after, timestamp = (int(part) for part in value.split(':'))
+        synced_at = datetime.fromtimestamp(timestamp, dt_timezone.utc)
+    except (binascii.Error, UnicodeError, ValueError, OverflowError,
+            OSError):
+        raise ValueError('Invalid cursor.')
+    if after < 0:
+        raise ValueError('Invalid cursor.')
+    if not settings.USE_TZ:
+        synced_at = timezone.make_naive(synced_at)
+    return after, synced_at
@@ -0,0 +1,69 @@
+"""
+Volunteer leaderboards by person-minutes, overall and per tag name.
+
+The person-minutes of a dig are its time_minutes times its
+number_people. `VolunteerTotal` holds them summed per volunteer and
+`VolunteerTagTotal` per volunteer and tag name: tags belong to their
+user, so a tag's board ranks everyone using the same name. Both are
+maintained by `AggregateDelta` on every dig write, see core.aggregates,
+and rebuilt or checked with `manage.py rebuild_leaderboards`.
+
+Reads never aggregate digs. The top of a board is an ordered scan of
+its index and a volunteer's rank, a single query, counts the totals
+above theirs on the same index. Volunteers with equal totals share a
+rank.
+"""
+from django.db.models import (
+    F,
+    Func,
+    OuterRef,
+    Subquery,
+)
+
+from core.models import (
+    VolunteerTagTotal,
+    VolunteerTotal,
+)
+
+
+def board(tag_name=None):
+    """Return the ranked totals overall or of a tag name."""
+    if tag_name is None:
+        totals = VolunteerTotal.objects.all()
+    else:
+        totals = VolunteerTagTotal.objects.filter(tag_name=tag_name)
+    return totals.filter(person_minutes__gt=0)
+
+
+def top(size, tag_name=None):
+    """Return the first (rank, total) of a board, with their users."""
+    totals = board(tag_name).select_related('user').order_by(
+        '-person_minutes',
+        'user_id',
+    )[:size]
+    ranked = []
+    for index, total in enumerate(totals):
+        if ranked and ranked[-1][1].person_minutes == total.person_minutes:
+            rank = ranked[-1][0]
+        else:
+            rank = index + 1
+        ranked.append((rank, total))
+    return ranked
+
+
+def rank(user_id, tag_name=None):
+    """Return the (rank, person-minutes) of a user, None if not ranked."""
+    totals = board(tag_name)
+    above = totals.filter(
+        person_minutes__gt=OuterRef('person_minutes'),
+    ).order_by().values(
+        count=Func(F('person_minutes'), function='COUNT'),
+    )
+    ranked = totals.filter(user_id=user_id).values_list(
+        'person_minutes',
+        Subquery(above),
+    ).first()
+    if ranked is None:
+        return None
+    person_minutes, above = ranked
+    return above + 1, person_minutes
@@ -0,0 +1,19 @@
+"""
+Django command to prune the deletions kept in the change feeds.
+"""
+from django.core.management.base import BaseCommand
+
+from core import changes
+
+
+class Command(BaseCommand):
+    """Django command to prune change feed tombstones"""
+    help = (
+        'Delete the change feed tombstones older than '
+        'TRAILDIG_CHANGES_RETENTION_DAYS.'
+    )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        count = changes.prune()
+        self.stdout.write(self.style.SUCCESS(f'Pruned {count} tombstone(s).'))
@@ -0,0 +1,50 @@
+"""
+Django command to rebuild or verify the volunteer leaderboards.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core import aggregates
+
+
+class Command(BaseCommand):
+    """Django command to rebuild leaderboards"""
+    help = (
+        'Recompute the person-minutes per volunteer and per volunteer and '
+        'tag name from the trail digs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report volunteer totals that are out of date.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        if options['check']:
+            self.check_totals()
+            return
+
+        count = aggregates.rebuild_leaderboards()
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt {count} volunteer total(s).')
+        )
+
+    def check_totals(self):
+        """Report stale totals and fail if there are any."""
+        stale = aggregates.stale_volunteer_totals()
+        for user_id in stale:
+            self.stdout.write(f'Total of user {user_id} is stale')
+        stale_tags = aggregates.stale_volunteer_tag_totals()
+        for user_id, tag_name in stale_tags:
+            self.stdout.write(
+                f'Total of user {user_id} for tag {tag_name} is stale'
+            )
+
+        errors = len(stale) + len(stale_tags)
+        if errors:
+            raise CommandError(f'{errors} volunteer total(s) out of date.')
+        self.stdout.write(
+            self.style.SUCCESS('Volunteer totals are up to date.')
+        )
@@ -0,0 +1,53 @@
+"""
+Django command to rebuild or verify the denormalized tag totals.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core import aggregates
+
+
+class Command(BaseCommand):
+    """Django command to rebuild tag totals"""
+    help = (
+        'Recompute the work done per tag and the monthly tag rollups '
+        'from the trail digs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report totals and rollups that are out of date.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        if options['check']:
+            self.check_totals()
+            return
+
+        count = aggregates.rebuild_tag_totals()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} tag total(s).'))
+        count = aggregates.rebuild_rollups()
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt {count} monthly rollup(s).')
+        )
+
+    def check_totals(self):
+        """Report stale totals and fail if there are any."""
+        stale = list(aggregates.stale_tags())
+        for tag in stale:
+            self.stdout.write(
+                f'Tag {tag.pk} ({tag.name}): stored '
+                f'{tag.work_done_minutes}, expected {tag.expected_minutes}'
+            )
+        stale_rollups = aggregates.stale_rollups()
+        for tag_id, year, month in stale_rollups:
+            self.stdout.write(
+                f'Rollup of tag {tag_id} for {year}-{month:02d} is stale'
+            )
+
+        errors = len(stale) + len(stale_rollups)
+        if errors:
+            raise CommandError(f'{errors} tag aggregate(s) out of date.')
+        self.stdout.write(self.style.SUCCESS('Tag totals are up to date.'))
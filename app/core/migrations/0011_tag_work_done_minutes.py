@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-18 01:04
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_tag_totals(apps, schema_editor):
+    """Compute the initial totals from the existing digs."""
+    Tag = apps.get_model('core', 'Tag')
+    TrailDig = apps.get_model('core', 'TrailDig')
+    totals = TrailDig.objects.filter(
+        tags=OuterRef('pk'),
+    ).values('tags').annotate(
+        total=Sum('time_minutes'),
+    ).values('total')
+    Tag.objects.update(work_done_minutes=Coalesce(Subquery(totals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_alter_traildig_date_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='work_done_minutes',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(
+            populate_tag_totals,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 3.2.25 on 2026-10-18 01:05
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+import django.db.models.deletion
+
+
+def populate_rollups(apps, schema_editor):
+    """Compute the monthly rollups from the existing digs."""
+    TagWorkRollup = apps.get_model('core', 'TagWorkRollup')
+    TrailDig = apps.get_model('core', 'TrailDig')
+    rows = TrailDig.objects.filter(tags__isnull=False).annotate(
+        year=ExtractYear('date_time'),
+        month=ExtractMonth('date_time'),
+    ).values('tags', 'year', 'month').annotate(
+        total_minutes=Sum('time_minutes'),
+        total_person_minutes=Sum(F('time_minutes') * F('number_people')),
+    ).order_by()
+    TagWorkRollup.objects.bulk_create(
+        [
+            TagWorkRollup(
+                tag_id=row['tags'],
+                year=row['year'],
+                month=row['month'],
+                time_minutes=row['total_minutes'],
+                person_minutes=row['total_person_minutes'],
+            )
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_tag_work_done_minutes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagWorkRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('month', models.IntegerField()),
+                ('time_minutes', models.BigIntegerField(default=0)),
+                ('person_minutes', models.BigIntegerField(default=0)),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='core.tag')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='tagworkrollup',
+            constraint=models.UniqueConstraint(fields=('tag', 'year', 'month'), name='unique_tag_rollup_month'),
+        ),
+        migrations.RunPython(
+            populate_rollups,
+            migrations.RunPython.noop,
+        ),
+    ]
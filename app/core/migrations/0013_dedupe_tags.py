@@ -0,0 +1,111 @@
+from django.db import migrations
+from django.db.models import Exists, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, ExtractMonth, ExtractYear
+
+# Drop the links of a dig to a duplicate tag when the dig is also linked
+# to a lower numbered tag of the same user and name.
+DELETE_TWIN_LINKS = '''
+    DELETE FROM {links}
+    WHERE EXISTS (
+        SELECT 1
+        FROM {tags} dup
+        INNER JOIN {tags} keep
+            ON keep.user_id = dup.user_id
+            AND keep.name = dup.name
+            AND keep.id < dup.id
+        INNER JOIN {links} other
+            ON other.tag_id = keep.id
+            AND other.traildig_id = {links}.traildig_id
+        WHERE dup.id = {links}.tag_id
+    )
+'''
+
+# Point the remaining links at the lowest numbered tag of their group.
+REPOINT_LINKS = '''
+    UPDATE {links}
+    SET tag_id = (
+        SELECT MIN(keep.id)
+        FROM {tags} keep
+        INNER JOIN {tags} dup
+            ON keep.user_id = dup.user_id
+            AND keep.name = dup.name
+        WHERE dup.id = {links}.tag_id
+    )
+    WHERE tag_id IN (
+        SELECT dup.id
+        FROM {tags} dup
+        INNER JOIN {tags} keep
+            ON keep.user_id = dup.user_id
+            AND keep.name = dup.name
+            AND keep.id < dup.id
+    )
+'''
+
+
+def dedupe_tags(apps, schema_editor):
+    """Merge tags sharing a user and a name into the oldest one."""
+    Tag = apps.get_model('core', 'Tag')
+    TrailDig = apps.get_model('core', 'TrailDig')
+    TagWorkRollup = apps.get_model('core', 'TagWorkRollup')
+
+    twins = Tag.objects.filter(user=OuterRef('user'), name=OuterRef('name'))
+    older = Exists(twins.filter(id__lt=OuterRef('id')))
+    newer = Exists(twins.filter(id__gt=OuterRef('id')))
+    duplicates = Tag.objects.filter(older)
+    if not duplicates.exists():
+        return
+
+    quote = schema_editor.quote_name
+    tables = {
+        'tags': quote(Tag._meta.db_table),
+        'links': quote(TrailDig.tags.through._meta.db_table),
+    }
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(DELETE_TWIN_LINKS.format(**tables))
+        cursor.execute(REPOINT_LINKS.format(**tables))
+
+    # The kept tags took over the digs of their duplicates, recompute
+    # their aggregates before dropping the duplicates.
+    kept = Tag.objects.filter(newer).exclude(older)
+    TagWorkRollup.objects.filter(
+        tag__in=Tag.objects.filter(older | newer),
+    ).delete()
+    totals = TrailDig.objects.filter(
+        tags=OuterRef('pk'),
+    ).values('tags').annotate(
+        total=Sum('time_minutes'),
+    ).values('total')
+    kept.update(work_done_minutes=Coalesce(Subquery(totals), 0))
+    rows = TrailDig.objects.filter(tags__in=kept).annotate(
+        year=ExtractYear('date_time'),
+        month=ExtractMonth('date_time'),
+    ).values('tags', 'year', 'month').annotate(
+        total_minutes=Sum('time_minutes'),
+        total_person_minutes=Sum(F('time_minutes') * F('number_people')),
+    ).order_by()
+    TagWorkRollup.objects.bulk_create(
+        [
+            TagWorkRollup(
+                tag_id=row['tags'],
+                year=row['year'],
+                month=row['month'],
+                time_minutes=row['total_minutes'],
+                person_minutes=row['total_person_minutes'],
+            )
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+    duplicates.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_tagworkrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-18 01:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_tag_unique_name_per_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='traildig',
+            index=models.Index(fields=['user', '-id'], name='traildig_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traildig',
+            index=models.Index(fields=['user', 'date_time'], name='traildig_user_date_idx'),
+        ),
+        migrations.AlterField(
+            model_name='traildig',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        # The auto created through table only has a unique index led by
+        # traildig_id; filtering digs by tag reads it the other way round.
+        migrations.RunSQL(
+            'CREATE INDEX core_traildig_tags_tag_dig_idx '
+            'ON core_traildig_tags (tag_id, traildig_id)',
+            'DROP INDEX core_traildig_tags_tag_dig_idx',
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+POSTGRESQL_FORWARD = [
+    '''
+    ALTER TABLE core_traildig ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED
+    ''',
+    '''
+    CREATE INDEX core_traildig_search_idx
+    ON core_traildig USING GIN (search_vector)
+    ''',
+]
+POSTGRESQL_BACKWARD = [
+    'ALTER TABLE core_traildig DROP COLUMN search_vector',
+]
+
+SQLITE_FORWARD = [
+    '''
+    CREATE VIRTUAL TABLE core_traildig_fts
+    USING fts5(title, description)
+    ''',
+    '''
+    INSERT INTO core_traildig_fts (rowid, title, description)
+    SELECT id, title, description FROM core_traildig
+    ''',
+]
+SQLITE_BACKWARD = [
+    'DROP TABLE core_traildig_fts',
+]
+
+
+def run_for_vendor(statements):
+    """Return a RunPython function executing the vendor's statements."""
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_traildig_owner_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({
+                'postgresql': POSTGRESQL_FORWARD,
+                'sqlite': SQLITE_FORWARD,
+            }),
+            run_for_vendor({
+                'postgresql': POSTGRESQL_BACKWARD,
+                'sqlite': SQLITE_BACKWARD,
+            }),
+        ),
+    ]
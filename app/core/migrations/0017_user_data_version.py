@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 01:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_traildig_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='data_changed_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='data_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.2.25 on 2026-10-18 01:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+BATCH_SIZE = 1000
+
+
+def record_existing(apps, schema_editor):
+    """Start the change feeds with every existing dig and tag."""
+    Change = apps.get_model('core', 'Change')
+    for kind, model in [('tag', 'Tag'), ('traildig', 'TrailDig')]:
+        rows = apps.get_model('core', model).objects.order_by('pk')
+        batch = []
+        for object_id, user_id in rows.values_list('pk', 'user_id').iterator():
+            batch.append(Change(
+                kind=kind,
+                object_id=object_id,
+                user_id=user_id,
+            ))
+            if len(batch) == BATCH_SIZE:
+                Change.objects.bulk_create(batch)
+                batch = []
+        Change.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_user_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('traildig', 'Trail dig'), ('tag', 'Tag')], max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['kind', 'id'], name='change_kind_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['kind', 'user', 'id'], name='change_kind_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['deleted', 'changed_at'], name='change_tombstone_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='change',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_change_object'),
+        ),
+        migrations.RunPython(record_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:14
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Sum
+import django.db.models.deletion
+
+
+def populate_totals(apps, schema_editor):
+    """Compute the leaderboard totals from the existing digs."""
+    TrailDig = apps.get_model('core', 'TrailDig')
+    VolunteerTotal = apps.get_model('core', 'VolunteerTotal')
+    VolunteerTagTotal = apps.get_model('core', 'VolunteerTagTotal')
+    person_minutes = Sum(F('time_minutes') * F('number_people'))
+    rows = TrailDig.objects.values('user').annotate(
+        total=person_minutes,
+    ).order_by()
+    VolunteerTotal.objects.bulk_create(
+        [
+            VolunteerTotal(user_id=row['user'], person_minutes=row['total'])
+            for row in rows if row['total']
+        ],
+        batch_size=1000,
+    )
+    rows = TrailDig.objects.filter(tags__isnull=False).values(
+        'user', 'tags__name',
+    ).annotate(total=person_minutes).order_by()
+    VolunteerTagTotal.objects.bulk_create(
+        [
+            VolunteerTagTotal(
+                user_id=row['user'],
+                tag_name=row['tags__name'],
+                person_minutes=row['total'],
+            )
+            for row in rows if row['total']
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VolunteerTagTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag_name', models.CharField(max_length=255)),
+                ('person_minutes', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VolunteerTotal',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='volunteer_total', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('person_minutes', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='volunteertotal',
+            index=models.Index(fields=['-person_minutes', 'user'], name='volunteer_total_rank_idx'),
+        ),
+        migrations.AddField(
+            model_name='volunteertagtotal',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='volunteer_tag_totals', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='volunteertagtotal',
+            index=models.Index(fields=['tag_name', '-person_minutes', 'user'], name='volunteer_tag_rank_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='volunteertagtotal',
+            constraint=models.UniqueConstraint(fields=('tag_name', 'user'), name='unique_volunteer_tag_total'),
+        ),
+        migrations.RunPython(
+            populate_totals,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessTokenRevocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jti', models.CharField(blank=True, max_length=32)),
+                ('revoked_at', models.FloatField()),
+                ('expires_at', models.FloatField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='accesstokenrevocation',
+            index=models.Index(fields=['user', 'expires_at'], name='token_revocation_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accesstokenrevocation',
+            index=models.Index(fields=['expires_at'], name='token_revocation_expiry_idx'),
+        ),
+    ]
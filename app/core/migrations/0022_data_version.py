@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:37
+
+from django.db import migrations, models
+from django.db.models import Max, Sum
+
+
+def populate_version(apps, schema_editor):
+    """Start the version of all users from theirs."""
+    User = apps.get_model('core', 'User')
+    DataVersion = apps.get_model('core', 'DataVersion')
+    row = User.objects.aggregate(
+        version=Sum('data_version'),
+        changed_at=Max('data_changed_at'),
+    )
+    DataVersion.objects.create(
+        pk=1,
+        version=row['version'] or 0,
+        changed_at=row['changed_at'],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_access_token_revocation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.PositiveSmallIntegerField(default=1, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('changed_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.RunPython(
+            populate_version,
+            migrations.RunPython.noop,
+        ),
+    ]
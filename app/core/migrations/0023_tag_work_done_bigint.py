@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_data_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tag',
+            name='work_done_minutes',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
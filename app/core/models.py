@@ -2,7 +2,10 @@
 Database models
 """
 from django.conf import settings
-from django.db import models
+from django.db import (
+    models,
+    transaction,
+)
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -40,6 +43,10 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Bumped by every write changing the user's digs or tags, see
+    # core.versions.
+    data_version = models.BigIntegerField(default=0, editable=False)
+    data_changed_at = models.DateTimeField(null=True, editable=False)
 
     objects = UserManager()
 
@@ -51,6 +58,8 @@ class TrailDig(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        # Covered by the composite indexes below.
+        db_index=False,
     )
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
@@ -60,9 +69,27 @@ class TrailDig(models.Model):
     tags = models.ManyToManyField('Tag')
     date_time = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-id'],
+                name='traildig_user_id_idx',
+            ),
+            models.Index(
+                fields=['user', 'date_time'],
+                name='traildig_user_date_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # The signal handlers of core.signals lock the stored dig before
+        # it is written and count the change after, in one transaction.
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+
 
 class Tag(models.Model):
     """Tag object for filtering digs."""
@@ -71,6 +98,212 @@ class Tag(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    # Denormalized sum of time_minutes over the tagged digs, kept up to
+    # date by core.signals. Rebuild with `manage.py rebuild_tag_totals`.
+    work_done_minutes = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_tag_name_per_user',
+            ),
+        ]
 
     def __str__(self):
         return self.name
+
+
+class TagWorkRollup(models.Model):
+    """Work done on a tag during one month."""
+    tag = models.ForeignKey(
+        'Tag',
+        on_delete=models.CASCADE,
+        related_name='rollups',
+    )
+    year = models.IntegerField()
+    month = models.IntegerField()
+    time_minutes = models.BigIntegerField(default=0)
+    person_minutes = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tag', 'year', 'month'],
+                name='unique_tag_rollup_month',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.tag} {self.year}-{self.month:02d}'
+
+
+class VolunteerTotal(models.Model):
+    """Person-minutes of a volunteer over all their digs.
+
+    Kept up to date by core.signals, see core.leaderboards.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='volunteer_total',
+    )
+    person_minutes = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-person_minutes', 'user'],
+                name='volunteer_total_rank_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.person_minutes}'
+
+
+class VolunteerTagTotal(models.Model):
+    """Person-minutes of a volunteer over their digs with a tag name.
+
+    Tags belong to their user, the boards rank volunteers across the
+    tags sharing a name.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='volunteer_tag_totals',
+    )
+    tag_name = models.CharField(max_length=255)
+    person_minutes = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tag_name', 'user'],
+                name='unique_volunteer_tag_total',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['tag_name', '-person_minutes', 'user'],
+                name='volunteer_tag_rank_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.tag_name} {self.user_id}: {self.person_minutes}'
+
+
+class Change(models.Model):
+    """Latest change of a trail dig or tag, see core.changes."""
+    KIND_TRAILDIG = 'traildig'
+    KIND_TAG = 'tag'
+    KIND_CHOICES = [
+        (KIND_TRAILDIG, 'Trail dig'),
+        (KIND_TAG, 'Tag'),
+    ]
+
+    # The id orders the changes, clients resume the feed after one.
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    # Owner of the object. Not a constraint: the tombstones of a deleted
+    # user's objects outlive them.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name='+',
+    )
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'object_id'],
+                name='unique_change_object',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['kind', 'id'],
+                name='change_kind_id_idx',
+            ),
+            models.Index(
+                fields=['kind', 'user', 'id'],
+                name='change_kind_user_id_idx',
+            ),
+            models.Index(
+                fields=['deleted', 'changed_at'],
+                name='change_tombstone_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id} #{self.pk}'
+
+
+class ImportCheckpoint(models.Model):
+    """Rows of a file imported so far, see import_traildigs.
+
+    Written in the transaction of every imported batch, so it never
+    disagrees with the digs committed.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    path = models.CharField(max_length=4096)
+    read = models.PositiveIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name}: {self.read} rows of {self.path}'
+
+
+class AccessTokenRevocation(models.Model):
+    """Revocation of access tokens, see user.access_tokens.
+
+    Revokes the token with the jti, or every token of the user issued up
+    to revoked_at when jti is empty. Times are Unix times, like the
+    token claims; the row is useless once expires_at passed.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    jti = models.CharField(max_length=32, blank=True)
+    revoked_at = models.FloatField()
+    expires_at = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'expires_at'],
+                name='token_revocation_user_idx',
+            ),
+            models.Index(
+                fields=['expires_at'],
+                name='token_revocation_expiry_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} {self.jti or "*"} at {self.revoked_at}'
+
+
+class DataVersion(models.Model):
+    """Version of the data of all users together, see core.versions.
+
+    A single row, bumped along with the versions of the users.
+    """
+    ALL = 1
+
+    id = models.PositiveSmallIntegerField(primary_key=True, default=ALL)
+    version = models.BigIntegerField(default=0)
+    changed_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f'{self.version}.{self.changed_at}'
@@ -0,0 +1,34 @@
+"""
+Fast JSON parsing for the REST API.
+"""
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser decoding UTF-8 bodies with orjson when available.
+
+    Bodies orjson rejects are handed to JSONParser, so errors and the
+    edge cases orjson does not support behave exactly as before.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        data = stream.read()
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return super().parse(
+                io.BytesIO(data), media_type, parser_context,
+            )
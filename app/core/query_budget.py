@@ -0,0 +1,90 @@
+"""
+Query budgets for API views.
+
+Views declare the maximum number of database queries each of their
+actions may issue. Going over budget raises `QueryBudgetExceeded` when
+QUERY_BUDGET_STRICT is set (development and CI) and is otherwise logged
+when QUERY_BUDGET_LOG is set.
+
+Queries run inside `unbudgeted()`, such as cache traffic, do not count:
+the budgets assume the shared cache is off the database, as it is by
+default, see CACHES in the settings.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(Exception):
+    """A view action issued more queries than its budget."""
+
+
+class QueryCounter:
+    """Database execute wrapper counting the queries it sees."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not getattr(_local, 'unbudgeted', 0):
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def unbudgeted():
+    """Leave the queries run inside out of the query budgets."""
+    _local.unbudgeted = getattr(_local, 'unbudgeted', 0) + 1
+    try:
+        yield
+    finally:
+        _local.unbudgeted -= 1
+
+
+class QueryBudgetMixin:
+    """Enforce the declared query budget of every view action.
+
+    `query_budgets` maps viewset actions, or lower case HTTP methods for
+    plain API views, to the maximum number of queries they may run.
+    """
+    query_budgets = {}
+
+    @classmethod
+    def get_query_budget(cls, action):
+        """Return the query budget of an action or None."""
+        return cls.query_budgets.get(action)
+
+    def get_budget_action(self):
+        """Return the name the current request is budgeted under."""
+        return getattr(self, 'action', None) or self.request.method.lower()
+
+    def dispatch(self, request, *args, **kwargs):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = super().dispatch(request, *args, **kwargs)
+
+        self.check_query_budget(counter.count)
+        return response
+
+    def check_query_budget(self, count):
+        """Report the request if it went over its budget."""
+        action = self.get_budget_action()
+        budget = self.get_query_budget(action)
+        if budget is None or count <= budget:
+            return
+
+        message = (
+            f'{type(self).__name__}.{action} ran {count} queries, '
+            f'budget is {budget}.'
+        )
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        if settings.QUERY_BUDGET_LOG:
+            logger.warning(message)
@@ -0,0 +1,187 @@
+"""
+Fast and compact renderers for the REST API.
+
+`FastJSONRenderer` encodes with orjson when it is installed and renders
+the same bytes as DRF's JSONRenderer, except that floats in exponent
+notation are spelled without padding (1e-7 rather than 1e-07). Types
+orjson would encode another way, datetimes among them, go through DRF's
+encoder; anything else it cannot produce identically, indented output
+included, is left to DRF's JSONRenderer.
+"""
+import csv
+
+from rest_framework.renderers import (
+    BaseRenderer,
+    JSONRenderer,
+)
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer using orjson for compact output when available."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not self.can_render_fast(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same escaping as JSONRenderer, these are invalid in JavaScript.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029',
+        )
+
+    def can_render_fast(self, accepted_media_type, renderer_context):
+        """Return whether orjson produces the output JSONRenderer would."""
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        return (
+            orjson is not None
+            and indent is None
+            and self.compact
+            and not self.ensure_ascii
+        )
+
+
+class ColumnarJSONRenderer(FastJSONRenderer):
+    """JSON with the rows of list responses stored column by column.
+
+    A list of objects, or the ``results`` of a paginated response, is
+    replaced by ``{"columns": [names], "values": [[column values]]}``.
+    Other responses, errors included, render as plain JSON. See
+    traildig.client to decode.
+    """
+    media_type = 'application/vnd.traildig.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is None or response.status_code < 400:
+            data = to_columns(data)
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """MessagePack encoding of the same data as the JSON responses."""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=JSONEncoder().default)
+
+
+def to_columns(data):
+    """Return data with its list of rows stored column by column."""
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        return {**data, 'results': to_columns(data['results'])}
+    if not isinstance(data, list) or not all(
+        isinstance(row, dict) for row in data
+    ):
+        return data
+
+    names = list(dict.fromkeys(name for row in data for name in row))
+    return {
+        'columns': names,
+        'values': [[row.get(name) for row in data] for name in names],
+    }
+
+
+def format_renderers():
+    """Return the renderers of the default and the compact formats.
+
+    MessagePack is only offered when msgpack is installed.
+    """
+    renderers = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer]
+    if msgpack is not None:
+        renderers.append(MessagePackRenderer)
+    return renderers
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline delimited JSON, one object per line.
+
+    `stream` renders an iterable of rows lazily for streaming responses.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return b''.join(self.stream(rows))
+
+    def stream(self, rows):
+        """Yield the encoded lines of rows."""
+        renderer = FastJSONRenderer()
+        for row in rows:
+            yield renderer.render(row) + b'\n'
+
+
+class CSVRenderer(BaseRenderer):
+    """CSV with a header row taken from the keys of the first object.
+
+    List values are joined with semicolons. `stream` renders an iterable
+    of rows lazily for streaming responses.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+    list_separator = ';'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return b''.join(self.stream(rows))
+
+    def stream(self, rows):
+        """Yield the encoded header and lines of rows."""
+        writer = csv.writer(LineBuffer())
+        names = None
+        for row in rows:
+            if names is None:
+                names = list(row)
+                yield writer.writerow(names).encode(self.charset)
+            yield writer.writerow([
+                self.cell(row.get(name)) for name in names
+            ]).encode(self.charset)
+
+    def cell(self, value):
+        """Return the CSV representation of a value."""
+        if value is None:
+            return ''
+        if isinstance(value, list):
+            return self.list_separator.join(str(item) for item in value)
+        return value
+
+
+class LineBuffer:
+    """File like object handing back what is written to it."""
+
+    def write(self, value):
+        return value
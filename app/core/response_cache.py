@@ -0,0 +1,71 @@
+"""
+Cache of API response data for reads.
+
+Entries are keyed by the response validators, which embed the change
+versions of the users whose data a response shows (see core.versions).
+Every write bumps a version, moving the reads that could see it to new
+keys, so nothing is deleted on writes and stale entries simply expire.
+
+The data is cached before rendering, so a hit still honours the content
+negotiation of the request.
+"""
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+
+KEY_PREFIX = 'response:'
+
+_missing = object()
+
+
+class CacheStats:
+    """Hit and miss counters of this process, per view."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def record(self, view, hit):
+        """Count a lookup of view."""
+        with self.lock:
+            self.counts[view]['hits' if hit else 'misses'] += 1
+
+    def snapshot(self):
+        """Return the counters, by view name."""
+        with self.lock:
+            return {view: dict(counts) for view, counts in self.counts.items()}
+
+    def reset(self):
+        """Zero every counter."""
+        self.counts = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+
+stats = CacheStats()
+
+
+def enabled():
+    """Return whether responses are cached at all."""
+    return settings.TRAILDIG_RESPONSE_CACHE
+
+
+def get_cache():
+    """Return the cache the responses are stored in."""
+    return caches[settings.TRAILDIG_RESPONSE_CACHE_ALIAS]
+
+
+def get(view, key):
+    """Return the cached data for key, or None."""
+    data = get_cache().get(KEY_PREFIX + key, _missing)
+    stats.record(view, data is not _missing)
+    return None if data is _missing else data
+
+
+def set(key, data):
+    """Cache data under key."""
+    get_cache().set(
+        KEY_PREFIX + key,
+        data,
+        settings.TRAILDIG_RESPONSE_CACHE_TIMEOUT,
+    )
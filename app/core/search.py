@@ -0,0 +1,88 @@
+"""
+Full text search over trail dig titles and descriptions.
+
+On PostgreSQL the digs table carries a generated ``search_vector``
+tsvector column with a GIN index, kept up to date by the database. On
+SQLite, used by the tests, a standalone FTS5 table keyed by dig id is
+maintained by core.signals and by the bulk write paths instead; triggers
+would not survive the table rebuilds SQLite migrations do. Neither is
+declared on the model, see migration 0016_traildig_search.
+"""
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVectorField,
+)
+from django.db import connection
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+SEARCH_CONFIG = 'simple'
+FTS_TABLE = 'core_traildig_fts'
+# Relative weight of title over description matches.
+TITLE_WEIGHT = 10.0
+
+
+def uses_fts():
+    """Return whether search is served by the SQLite FTS5 table."""
+    return connection.vendor == 'sqlite'
+
+
+def fts_query(text):
+    """Return an FTS5 query matching every word of text, verbatim."""
+    return ' '.join(
+        '"{}"'.format(word.replace('"', '""')) for word in text.split()
+    )
+
+
+def search(queryset, text):
+    """Filter digs matching text and annotate them with `search_rank`.
+
+    A higher rank is a better match.
+    """
+    if uses_fts():
+        query = fts_query(text)
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [query],
+        )).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, %s, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = core_traildig.id',
+            [TITLE_WEIGHT, query],
+            output_field=FloatField(),
+        ))
+
+    vector = RawSQL(
+        'core_traildig.search_vector', [],
+        output_field=SearchVectorField(),
+    )
+    query = SearchQuery(text, config=SEARCH_CONFIG)
+    # ts_rank is a real. Cursor pagination compares the rank it read back
+    # as a Python float, exact against a double precision only.
+    return queryset.alias(search_vector=vector).filter(
+        search_vector=query,
+    ).annotate(search_rank=Cast(SearchRank(vector, query), FloatField()))
+
+
+def index_traildigs(traildigs):
+    """Add or refresh the search entries of digs."""
+    if not uses_fts() or not traildigs:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, title, description) '
+            f'VALUES (%s, %s, %s)',
+            [(dig.pk, dig.title, dig.description) for dig in traildigs],
+        )
+
+
+def unindex_traildigs(traildig_ids):
+    """Remove the search entries of digs."""
+    if not uses_fts() or not traildig_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+            [(traildig_id,) for traildig_id in traildig_ids],
+        )
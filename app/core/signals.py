@@ -0,0 +1,226 @@
+"""
+Signal handlers keeping denormalized data in sync with trail digs.
+
+Every handler changing a user's data also bumps their change version,
+see core.versions, and records the change feeds, see core.changes.
+
+The dig handlers add to the delta of an enclosing
+`aggregates.deferred()` block when there is one, so the writes of one
+request are applied together.
+"""
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from core import (
+    aggregates,
+    changes,
+    search,
+    versions,
+)
+from core.models import (
+    TrailDig,
+    Tag,
+)
+
+
+@receiver(pre_save, sender=TrailDig)
+def snapshot_traildig(sender, instance, raw=False, **kwargs):
+    """Lock a dig that is about to change and remember its stored values.
+
+    TrailDig.save runs in a transaction, the lock is held until the delta
+    of the edit is applied.
+    """
+    instance._aggregate_snapshot = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._aggregate_snapshot = aggregates.lock_traildigs(
+        pk=instance.pk,
+    ).get(instance.pk)
+
+
+@receiver(post_save, sender=TrailDig)
+def update_traildig_aggregates(sender, instance, created, raw=False,
+                               **kwargs):
+    """Move the contribution of an edited dig to its new values.
+
+    Also bumps the version of the dig's owner, in the same statement as
+    the tag owners'.
+    """
+    if raw:
+        return
+    old = getattr(instance, '_aggregate_snapshot', None)
+    new = aggregates.dig_values(instance)
+    with aggregates.collect() as delta:
+        delta.user_ids.add(instance.user_id)
+        if created:
+            delta.add_dig(new)
+        elif old is not None and new != old:
+            tag_names = dict(aggregates.TrailDigTag.objects.filter(
+                traildig_id=instance.pk,
+            ).values_list('tag_id', 'tag__name'))
+            delta.tag_names.update(tag_names)
+            delta.add(tag_names, old, sign=-1)
+            delta.add(tag_names, new)
+            delta.add_dig(old, sign=-1)
+            delta.add_dig(new)
+        delta.record(changes.TRAILDIG, [(instance.pk, instance.user_id)])
+
+
+@receiver(post_save, sender=TrailDig)
+def index_traildig(sender, instance, raw=False, **kwargs):
+    """Refresh the search entry of a saved dig."""
+    if not raw:
+        search.index_traildigs([instance])
+
+
+@receiver(post_delete, sender=TrailDig)
+def unindex_traildig(sender, instance, **kwargs):
+    """Drop the search entry of a deleted dig."""
+    search.unindex_traildigs([instance.pk])
+
+
+@receiver(post_delete, sender=TrailDig)
+def touch_traildig_owner(sender, instance, **kwargs):
+    """Bump the version of the owner of a deleted dig."""
+    with aggregates.collect() as delta:
+        delta.user_ids.add(instance.user_id)
+        delta.record(
+            changes.TRAILDIG,
+            [(instance.pk, instance.user_id)],
+            deleted=True,
+        )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def touch_tag_owner(sender, instance, raw=False, **kwargs):
+    """Bump the version of the owner of a saved or deleted tag."""
+    if not raw:
+        versions.touch([instance.user_id])
+        changes.record_objects(
+            changes.TAG,
+            [instance],
+            deleted=kwargs['signal'] is post_delete,
+        )
+
+
+@receiver(pre_save, sender=Tag)
+def snapshot_tag_name(sender, instance, raw=False, **kwargs):
+    """Remember the stored name of a tag that is about to change."""
+    instance._name_snapshot = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._name_snapshot = Tag.objects.filter(
+        pk=instance.pk,
+    ).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Tag)
+def rename_tag_leaderboard(sender, instance, created, raw=False, **kwargs):
+    """Move the volunteer totals of a renamed tag to its new name."""
+    old = getattr(instance, '_name_snapshot', None)
+    if not raw and not created and old is not None and old != instance.name:
+        aggregates.rename_tag_totals(instance.pk, old, instance.name)
+
+
+@receiver(pre_delete, sender=Tag)
+def withdraw_tag_leaderboard(sender, instance, **kwargs):
+    """Withdraw the digs of a tag about to be deleted from its board."""
+    aggregates.withdraw_tag_totals(instance.pk, instance.name)
+
+
+@receiver(post_save, sender=Tag)
+def record_renamed_tag_digs(sender, instance, created, raw=False,
+                            **kwargs):
+    """Record the digs of an edited tag as changed, they show its name."""
+    if not raw and not created:
+        changes.record_queryset(
+            changes.TRAILDIG,
+            TrailDig.objects.filter(tags=instance),
+        )
+
+
+@receiver(pre_delete, sender=Tag)
+def record_untagged_digs(sender, instance, **kwargs):
+    """Record the digs of a tag about to be deleted as changed."""
+    changes.record_queryset(
+        changes.TRAILDIG,
+        TrailDig.objects.filter(tags=instance),
+    )
+
+
+@receiver(pre_delete, sender=TrailDig)
+def remove_traildig_aggregates(sender, instance, **kwargs):
+    """Withdraw the stored contribution of a deleted dig.
+
+    Nothing is withdrawn when a concurrent delete removed it first.
+    """
+    digs = aggregates.lock_traildigs(pk=instance.pk)
+    if not digs:
+        return
+    with aggregates.collect() as delta:
+        delta.add_memberships(
+            aggregates.memberships(digs, traildig_id=instance.pk),
+            sign=-1,
+        )
+        delta.add_dig(digs[instance.pk], sign=-1)
+
+
+@receiver(m2m_changed, sender=TrailDig.tags.through)
+def update_membership_aggregates(sender, instance, action, reverse,
+                                 pk_set, **kwargs):
+    """Follow digs being tagged and untagged from either side.
+
+    Links are counted before they are written, in the transaction of the
+    related manager. The digs are locked before the join table is read,
+    so only the links that really change are counted, with the stored dig
+    values, even when the same links are written concurrently.
+    """
+    if action not in ('pre_add', 'pre_remove', 'pre_clear'):
+        return
+    if action != 'pre_clear' and not pk_set:
+        return
+
+    if not reverse:
+        links = {'traildig_id': instance.pk}
+        if action != 'pre_clear':
+            links['tag_id__in'] = pk_set
+        digs = aggregates.lock_traildigs(pk=instance.pk)
+    elif action == 'pre_clear':
+        links = {'tag_id': instance.pk}
+        digs = aggregates.lock_traildigs(
+            pk__in=aggregates.TrailDigTag.objects.filter(
+                **links,
+            ).values('traildig_id'),
+        )
+    else:
+        links = {'tag_id': instance.pk, 'traildig_id__in': pk_set}
+        digs = aggregates.lock_traildigs(pk__in=pk_set)
+
+    with aggregates.collect() as delta:
+        if action == 'pre_add':
+            existing = set(aggregates.TrailDigTag.objects.filter(
+                **links,
+            ).values_list('traildig_id', 'tag_id'))
+            tag_ids = [instance.pk] if reverse else pk_set
+            for traildig_id, dig in digs.items():
+                delta.add(
+                    [tag_id for tag_id in tag_ids
+                     if (traildig_id, tag_id) not in existing],
+                    dig,
+                )
+        else:
+            delta.add_memberships(
+                aggregates.memberships(digs, **links),
+                sign=-1,
+            )
+        # Digs render their tags.
+        delta.record(changes.TRAILDIG, [
+            (traildig_id, dig['user_id']) for traildig_id, dig in digs.items()
+        ])
@@ -0,0 +1,130 @@
+"""
+Coalescing of concurrent identical computations.
+
+`Group.do` runs a function once per key at a time within the process:
+callers arriving while it runs wait for it and share its result instead
+of computing the same thing again. Across processes, `advisory_lock`
+serializes the computations of a key with a PostgreSQL advisory lock, so
+the processes that waited can read the result the first one cached.
+
+Used by the expensive reads of the API on response cache misses, see
+traildig.views.CachedResponseMixin, so a popular response expiring does
+not send every concurrent request to the database at once.
+"""
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import (
+    OperationalError,
+    connection,
+    transaction,
+)
+
+from core.query_budget import unbudgeted
+
+# SQLSTATE of a lock wait canceled by lock_timeout.
+LOCK_NOT_AVAILABLE = '55P03'
+
+
+class _Call:
+    """A computation in progress, waited for by the other callers."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class Group:
+    """Coalesce the calls with the same key within the process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func, timeout=None):
+        """Return (func(), shared) once the call for key is done.
+
+        shared is True when the result came from a concurrent call. A
+        caller whose wait times out or whose leader failed runs func
+        itself.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(timeout) and not call.failed:
+                return call.result, True
+            return func(), False
+
+        try:
+            call.result = func()
+        except BaseException:
+            call.failed = True
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result, False
+
+
+group = Group()
+
+
+def enabled():
+    """Return whether expensive reads are coalesced."""
+    return settings.TRAILDIG_COALESCE
+
+
+def lock_id(key):
+    """Return the advisory lock id of a key, a signed 64 bit integer."""
+    digest = hashlib.sha1(f'singleflight:{key}'.encode()).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+
+@contextmanager
+def advisory_lock(key, timeout):
+    """Hold the advisory lock of key across processes, on PostgreSQL.
+
+    Yields whether the lock was used: the result of a process that held
+    it before may be cached by now. Proceeds without the lock after
+    waiting timeout seconds, and right away on other databases or when
+    disabled. The queries are left out of the query budgets.
+    """
+    if (
+        connection.vendor != 'postgresql'
+        or not settings.TRAILDIG_COALESCE_ADVISORY_LOCK
+    ):
+        yield False
+        return
+
+    lock = lock_id(key)
+    # A lock_timeout of 0 waits forever.
+    lock_timeout = f'{max(1, round(timeout * 1000))}ms'
+    nested = connection.in_atomic_block
+    acquired = False
+    with unbudgeted():
+        try:
+            # SET LOCAL lasts until the transaction ends: right after the
+            # lock is taken, unless the block is nested in another one.
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute('SET LOCAL lock_timeout = %s', [lock_timeout])
+                cursor.execute('SELECT pg_advisory_lock(%s)', [lock])
+                if nested:
+                    cursor.execute('SET LOCAL lock_timeout TO DEFAULT')
+            acquired = True
+        except OperationalError as error:
+            if getattr(error.__cause__, 'pgcode', None) != LOCK_NOT_AVAILABLE:
+                raise
+    try:
+        yield True
+    finally:
+        if acquired:
+            with unbudgeted(), connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [lock])
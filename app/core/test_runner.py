@@ -0,0 +1,28 @@
+"""
+Test runner of the project.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.test.runner import DiscoverRunner
+
+from core.cache import stop_invalidations
+
+
+class TestRunner(DiscoverRunner):
+    """Start from empty caches, close their listeners before dropping the
+    databases.
+
+    The file based shared cache outlives the test runs. A LISTEN
+    connection left open to a test database makes DROP DATABASE fail on
+    PostgreSQL.
+    """
+
+    def setup_databases(self, **kwargs):
+        old_config = super().setup_databases(**kwargs)
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        return old_config
+
+    def teardown_databases(self, old_config, **kwargs):
+        stop_invalidations()
+        super().teardown_databases(old_config, **kwargs)
@@ -0,0 +1,408 @@
+"""
+Tests for the incrementally maintained aggregates.
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed
+from django.test import TestCase
+
+from core import aggregates
+from core.models import (
+    TrailDig,
+    Tag,
+    TagWorkRollup,
+    VolunteerTagTotal,
+    VolunteerTotal,
+)
+
+
+def create_user(email='user@example.com', password='testpass123'):
+    """Create and return a new user"""
+    return get_user_model().objects.create_user(email=email, password=password)
+
+
+def create_traildig(user, **params):
+    """Create and return a sample dig."""
+    defaults = {
+        'title': 'Sample dig title',
+        'time_minutes': 30,
+        'number_people': 4,
+    }
+    defaults.update(params)
+
+    return TrailDig.objects.create(user=user, **defaults)
+
+
+class TagTotalTests(TestCase):
+    """Test the per tag work totals."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.tag = Tag.objects.create(user=self.user, name='Chomeuse')
+        self.other_tag = Tag.objects.create(user=self.user, name='MSA')
+
+    def assertTotal(self, tag, expected):
+        tag.refresh_from_db()
+        self.assertEqual(tag.work_done_minutes, expected)
+
+    def test_adding_tag_counts_dig(self):
+        """Test tagging a dig adds its minutes."""
+        dig = create_traildig(self.user, time_minutes=30)
+        dig.tags.add(self.tag, self.other_tag)
+        dig.tags.add(self.tag)
+
+        self.assertTotal(self.tag, 30)
+        self.assertTotal(self.other_tag, 30)
+
+    def test_reverse_add_counts_digs(self):
+        """Test adding digs from the tag side."""
+        dig1 = create_traildig(self.user, time_minutes=30)
+        dig2 = create_traildig(self.user, time_minutes=45)
+        self.tag.traildig_set.add(dig1, dig2)
+
+        self.assertTotal(self.tag, 75)
+
+    def test_updating_dig_minutes_moves_total(self):
+        """Test editing a dig updates the totals of its tags."""
+        dig = create_traildig(self.user, time_minutes=30)
+        dig.tags.add(self.tag)
+
+        dig.time_minutes = 90
+        dig.save()
+
+        self.assertTotal(self.tag, 90)
+        self.assertTotal(self.other_tag, 0)
+
+    def test_total_past_integer_range(self):
+        """Test a tag total can exceed the 32 bit integer range."""
+        for _ in range(2):
+            dig = create_traildig(
+                self.user, time_minutes=2 ** 31 - 1, number_people=1,
+            )
+            dig.tags.add(self.tag)
+
+        self.assertTotal(self.tag, 2 ** 32 - 2)
+        self.assertFalse(aggregates.stale_tags().exists())
+
+    def test_removing_and_clearing_tags(self):
+        """Test untagging a dig withdraws its minutes."""
+        dig = create_traildig(self.user, time_minutes=30)
+        dig.tags.add(self.tag, self.other_tag)
+
+        dig.tags.remove(self.tag)
+        dig.tags.remove(self.tag)
+        self.assertTotal(self.tag, 0)
+        self.assertTotal(self.other_tag, 30)
+
+        dig.tags.clear()
+        self.assertTotal(self.other_tag, 0)
+
+    def test_reverse_clear(self):
+        """Test clearing the digs of a tag."""
+        dig = create_traildig(self.user, time_minutes=30)
+        dig.tags.add(self.tag, self.other_tag)
+
+        self.tag.traildig_set.clear()
+
+        self.assertTotal(self.tag, 0)
+        self.assertTotal(self.other_tag, 30)
+
+    def test_deleting_dig_withdraws_minutes(self):
+        """Test deleting a dig updates the totals."""
+        dig1 = create_traildig(self.user, time_minutes=30)
+        dig2 = create_traildig(self.user, time_minutes=15)
+        dig1.tags.add(self.tag)
+        dig2.tags.add(self.tag)
+
+        dig1.delete()
+
+        self.assertTotal(self.tag, 15)
+
+    def test_deleting_stale_instance(self):
+        """Test deleting withdraws the stored minutes, not the loaded."""
+        dig = create_traildig(self.user, time_minutes=30)
+        dig.tags.add(self.tag)
+        stale = TrailDig.objects.get(pk=dig.pk)
+        dig.time_minutes = 50
+        dig.save()
+
+        stale.delete()
+
+        self.assertTotal(self.tag, 0)
+        self.assertFalse(VolunteerTotal.objects.exclude(
+            person_minutes=0,
+        ).exists())
+
+    def test_links_added_concurrently_counted_once(self):
+        """Test links another writer added first are not counted again."""
+        dig = create_traildig(self.user, time_minutes=30)
+        dig.tags.add(self.tag)
+
+        # As sent by a writer that found the link missing before the
+        # other one committed.
+        m2m_changed.send(
+            sender=aggregates.TrailDigTag,
+            instance=dig,
+            action='pre_add',
+            reverse=False,
+            model=Tag,
+            pk_set={self.tag.pk, self.other_tag.pk},
+            using='default',
+        )
+
+        self.assertTotal(self.tag, 30)
+        self.assertTotal(self.other_tag, 30)
+
+    def test_deferred_writes_apply_once(self):
+        """Test the writes of a deferred block apply a single delta."""
+        dig = create_traildig(self.user, time_minutes=30)
+        dig.tags.add(self.tag)
+
+        with patch.object(
+            aggregates.AggregateDelta,
+            'apply',
+            autospec=True,
+            side_effect=aggregates.AggregateDelta.apply,
+        ) as apply, aggregates.deferred():
+            dig.tags.set([self.other_tag])
+            dig.time_minutes = 45
+            dig.save()
+
+        apply.assert_called_once()
+        self.assertTotal(self.tag, 0)
+        self.assertTotal(self.other_tag, 45)
+        self.assertFalse(aggregates.stale_tags().exists())
+
+    def test_deferred_failure_applies_nothing(self):
+        """Test a failing deferred block leaves the totals alone."""
+        dig = create_traildig(self.user, time_minutes=30)
+
+        with self.assertRaises(ValueError), aggregates.deferred():
+            dig.tags.add(self.tag)
+            raise ValueError()
+
+        self.assertTotal(self.tag, 0)
+        self.assertFalse(dig.tags.exists())
+
+    def test_deleting_user_cascades(self):
+        """Test a user deletion withdraws the minutes of their digs."""
+        other_user = create_user(email='other@example.com')
+        dig = create_traildig(other_user, time_minutes=30)
+        dig.tags.add(self.tag)
+
+        other_user.delete()
+
+        self.assertTotal(self.tag, 0)
+
+    def test_rebuild_matches_incremental(self):
+        """Test the rebuild finds nothing to fix after normal writes."""
+        dig = create_traildig(self.user, time_minutes=30)
+        dig.tags.add(self.tag)
+        dig.time_minutes = 40
+        dig.save()
+
+        self.assertFalse(aggregates.stale_tags().exists())
+        Tag.objects.update(work_done_minutes=0)
+        self.assertTrue(aggregates.stale_tags().exists())
+
+        aggregates.rebuild_tag_totals()
+
+        self.assertFalse(aggregates.stale_tags().exists())
+        self.assertTotal(self.tag, 40)
+
+
+class TagRollupTests(TestCase):
+    """Test the monthly work rollups per tag."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.tag = Tag.objects.create(user=self.user, name='Chomeuse')
+
+    def rollups(self):
+        return list(TagWorkRollup.objects.filter(tag=self.tag).order_by(
+            'year', 'month',
+        ).values_list('year', 'month', 'time_minutes', 'person_minutes'))
+
+    def test_digs_are_rolled_up_per_month(self):
+        """Test tagged digs are summed per month."""
+        create_traildig(
+            self.user, time_minutes=30, number_people=2,
+            date_time='2024-10-25 10:00:00',
+        ).tags.add(self.tag)
+        create_traildig(
+            self.user, time_minutes=60, number_people=3,
+            date_time='2024-10-02 08:00:00',
+        ).tags.add(self.tag)
+        create_traildig(
+            self.user, time_minutes=10, number_people=1,
+            date_time='2025-01-25 11:00:00',
+        ).tags.add(self.tag)
+
+        self.assertEqual(self.rollups(), [
+            (2024, 10, 90, 240),
+            (2025, 1, 10, 10),
+        ])
+
+    def test_moving_dig_to_other_month(self):
+        """Test editing the date moves the dig between rollups."""
+        dig = create_traildig(
+            self.user, time_minutes=30, number_people=2,
+            date_time='2024-10-25 10:00:00',
+        )
+        dig.tags.add(self.tag)
+
+        dig.date_time = '2024-11-01 10:00:00'
+        dig.number_people = 4
+        dig.save()
+
+        self.assertEqual(self.rollups(), [
+            (2024, 10, 0, 0),
+            (2024, 11, 30, 120),
+        ])
+        self.assertEqual(aggregates.stale_rollups(), [])
+
+    def test_untagging_and_deleting(self):
+        """Test removing digs empties the rollups."""
+        dig1 = create_traildig(self.user, date_time='2024-10-25 10:00:00')
+        dig2 = create_traildig(self.user, date_time='2024-10-26 10:00:00')
+        dig1.tags.add(self.tag)
+        dig2.tags.add(self.tag)
+
+        dig1.tags.remove(self.tag)
+        dig2.delete()
+
+        self.assertEqual(self.rollups(), [(2024, 10, 0, 0)])
+
+    def test_rebuild_rollups(self):
+        """Test rebuilding recreates the rollups."""
+        create_traildig(
+            self.user, time_minutes=30, number_people=2,
+            date_time='2024-10-25 10:00:00',
+        ).tags.add(self.tag)
+        TagWorkRollup.objects.update(time_minutes=0)
+        self.assertEqual(aggregates.stale_rollups(), [(self.tag.id, 2024, 10)])
+
+        aggregates.rebuild_rollups()
+
+        self.assertEqual(self.rollups(), [(2024, 10, 30, 60)])
+        self.assertEqual(aggregates.stale_rollups(), [])
+
+
+class VolunteerTotalTests(TestCase):
+    """Test the person-minutes per volunteer behind the leaderboards."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.other_user = create_user(email='other@example.com')
+        self.tag = Tag.objects.create(user=self.user, name='SDM')
+        self.other_tag = Tag.objects.create(user=self.other_user, name='SDM')
+
+    def totals(self):
+        return dict(VolunteerTotal.objects.filter(
+            person_minutes__gt=0,
+        ).values_list('user_id', 'person_minutes'))
+
+    def tag_totals(self):
+        return {
+            (user_id, tag_name): total
+            for user_id, tag_name, total in VolunteerTagTotal.objects.filter(
+                person_minutes__gt=0,
+            ).values_list('user_id', 'tag_name', 'person_minutes')
+        }
+
+    def assertConsistent(self):
+        self.assertEqual(aggregates.stale_volunteer_totals(), [])
+        self.assertEqual(aggregates.stale_volunteer_tag_totals(), [])
+
+    def test_digs_are_counted(self):
+        """Test digs count towards their volunteer, tagged or not."""
+        create_traildig(self.user, time_minutes=30, number_people=4)
+        create_traildig(self.user, time_minutes=10, number_people=1)
+        create_traildig(
+            self.other_user, time_minutes=60, number_people=2,
+        ).tags.add(self.other_tag)
+        create_traildig(self.user, number_people=2).tags.add(self.tag)
+
+        self.assertEqual(self.totals(), {
+            self.user.id: 190,
+            self.other_user.id: 120,
+        })
+        self.assertEqual(self.tag_totals(), {
+            (self.user.id, 'SDM'): 60,
+            (self.other_user.id, 'SDM'): 120,
+        })
+        self.assertConsistent()
+
+    def test_editing_and_deleting_digs(self):
+        """Test edits move and deletions withdraw the person-minutes."""
+        dig = create_traildig(self.user, time_minutes=30, number_people=4)
+        dig.tags.add(self.tag)
+
+        dig.number_people = 1
+        dig.save()
+        self.assertEqual(self.totals(), {self.user.id: 30})
+        self.assertEqual(self.tag_totals(), {(self.user.id, 'SDM'): 30})
+
+        dig.tags.remove(self.tag)
+        self.assertEqual(self.tag_totals(), {})
+
+        dig.delete()
+        self.assertEqual(self.totals(), {})
+        self.assertConsistent()
+
+    def test_renaming_and_deleting_tags(self):
+        """Test tag names carry their digs' person-minutes."""
+        create_traildig(self.user).tags.add(self.tag)
+        create_traildig(self.other_user).tags.add(self.other_tag)
+
+        self.tag.name = 'MSA'
+        self.tag.save()
+        self.assertEqual(self.tag_totals(), {
+            (self.user.id, 'MSA'): 120,
+            (self.other_user.id, 'SDM'): 120,
+        })
+
+        self.tag.delete()
+        self.assertEqual(self.tag_totals(), {
+            (self.other_user.id, 'SDM'): 120,
+        })
+        self.assertEqual(self.totals()[self.user.id], 120)
+        self.assertConsistent()
+
+    def test_deleting_user_cascades(self):
+        """Test a deleted volunteer leaves the boards."""
+        create_traildig(self.other_user).tags.add(self.other_tag)
+
+        self.other_user.delete()
+
+        self.assertEqual(self.totals(), {})
+        self.assertEqual(self.tag_totals(), {})
+
+    def test_without_upsert(self):
+        """Test the totals are kept where the database cannot upsert."""
+        with patch('core.aggregates._can_upsert', return_value=False):
+            dig = create_traildig(self.user, time_minutes=30)
+            dig.tags.add(self.tag)
+            create_traildig(self.user, time_minutes=10).tags.add(self.tag)
+
+        self.assertEqual(self.totals(), {self.user.id: 160})
+        self.assertEqual(self.tag_totals(), {(self.user.id, 'SDM'): 160})
+        self.assertConsistent()
+
+    def test_rebuild_leaderboards(self):
+        """Test rebuilding recreates the totals."""
+        create_traildig(self.user).tags.add(self.tag)
+        VolunteerTotal.objects.update(person_minutes=0)
+        VolunteerTagTotal.objects.update(person_minutes=5)
+        self.assertEqual(aggregates.stale_volunteer_totals(), [self.user.id])
+        self.assertEqual(
+            aggregates.stale_volunteer_tag_totals(),
+            [(self.user.id, 'SDM')],
+        )
+
+        aggregates.rebuild_leaderboards()
+
+        self.assertEqual(self.totals(), {self.user.id: 120})
+        self.assertEqual(self.tag_totals(), {(self.user.id, 'SDM'): 120})
+        self.assertConsistent()
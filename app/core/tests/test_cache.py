@@ -0,0 +1,295 @@
+"""
+Tests for the two tier cache backend.
+"""
+import os
+import tempfile
+import time
+from unittest.mock import (
+    MagicMock,
+    patch,
+)
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+
+from core.cache import (
+    CLEAR,
+    GenerationInvalidation,
+    LocalTier,
+    PostgresInvalidation,
+    stop_invalidations,
+)
+
+
+def two_tier_caches(location, shared=None, **options):
+    """Return CACHES with a two tier 'default' over a 'shared' cache."""
+    return {
+        'default': {
+            'BACKEND': 'core.cache.TwoTierCache',
+            'LOCATION': location,
+            'OPTIONS': {'SHARED': 'shared', **options},
+        },
+        'shared': shared or {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': location,
+        },
+    }
+
+
+class LocalTierTests(SimpleTestCase):
+    """Test the per process tier."""
+
+    def test_lru_bounded_in_entries(self):
+        """Test the least recently used entries are dropped first."""
+        tier = LocalTier(max_entries=2, max_size=1024)
+        tier.set('a', b'1', 60)
+        tier.set('b', b'2', 60)
+        tier.get('a')
+
+        tier.set('c', b'3', 60)
+
+        self.assertEqual(tier.get('a'), b'1')
+        self.assertIsNone(tier.get('b'))
+        self.assertEqual(tier.get('c'), b'3')
+
+    def test_bounded_in_bytes(self):
+        """Test the tier stays within its size."""
+        tier = LocalTier(max_entries=10, max_size=10)
+        tier.set('a', b'12345', 60)
+        tier.set('b', b'12345', 60)
+
+        tier.set('c', b'123', 60)
+        tier.set('d', b'12345678901', 60)
+
+        self.assertIsNone(tier.get('a'))
+        self.assertIsNone(tier.get('d'))
+        self.assertEqual(tier.size, 8)
+
+    def test_expiry(self):
+        """Test entries expire after their timeout."""
+        tier = LocalTier(max_entries=10, max_size=1024)
+        with patch('core.cache.monotonic', return_value=100):
+            tier.set('a', b'1', 30)
+        with patch('core.cache.monotonic', return_value=129):
+            self.assertEqual(tier.get('a'), b'1')
+        with patch('core.cache.monotonic', return_value=130):
+            self.assertIsNone(tier.get('a'))
+        self.assertEqual(tier.size, 0)
+
+    def test_set_after_invalidation_ignored(self):
+        """Test a value read before an invalidation is not kept."""
+        tier = LocalTier(max_entries=10, max_size=1024)
+        epoch = tier.epoch
+
+        tier.delete('a')
+        tier.set('a', b'stale', 60, epoch)
+
+        self.assertIsNone(tier.get('a'))
+
+
+class InvalidationTests(SimpleTestCase):
+    """Test the broadcast of writes between processes."""
+
+    def test_generation(self):
+        """Test a write elsewhere drops the written key only."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.gen')
+            mine = LocalTier(10, 1024)
+            other = LocalTier(10, 1024)
+            mine_invalidation = GenerationInvalidation(mine, path)
+            other_invalidation = GenerationInvalidation(other, path)
+            self.assertNotEqual(
+                other_invalidation.counter.slot('a'),
+                other_invalidation.counter.slot('b'),
+            )
+            for key in ['a', 'b']:
+                mine.set(key, b'1', 60)
+                other.set(key, b'1', 60)
+
+            mine_invalidation.publish('a')
+            mine_invalidation.check()
+            other_invalidation.check()
+
+            self.assertEqual(mine.get('a'), b'1')
+            self.assertIsNone(other.get('a'))
+            self.assertEqual(other.get('b'), b'1')
+
+    def test_generation_clear(self):
+        """Test a clear elsewhere drops the whole local tier."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.gen')
+            mine = LocalTier(10, 1024)
+            other = LocalTier(10, 1024)
+            mine_invalidation = GenerationInvalidation(mine, path)
+            other_invalidation = GenerationInvalidation(other, path)
+            other.set('a', b'1', 60)
+
+            mine_invalidation.publish(CLEAR)
+            other_invalidation.check()
+
+            self.assertIsNone(other.get('a'))
+
+    def test_postgres_notifications(self):
+        """Test notifications from other processes drop keys."""
+        tier = LocalTier(10, 1024)
+        invalidation = PostgresInvalidation.__new__(PostgresInvalidation)
+        invalidation.tier = tier
+        invalidation.origin = 'mine'
+        for key in ['a', 'b', 'c']:
+            tier.set(key, b'1', 60)
+
+        invalidation.handle('mine a')
+        invalidation.handle('other b')
+
+        self.assertEqual(tier.get('a'), b'1')
+        self.assertIsNone(tier.get('b'))
+
+        invalidation.handle('other *')
+
+        self.assertIsNone(tier.get('a'))
+
+    def test_postgres_listener_stops(self):
+        """Test stopping the listener closes its connection."""
+        read, write = os.pipe()
+        self.addCleanup(os.close, read)
+        self.addCleanup(os.close, write)
+        conn = MagicMock(notifies=[])
+        conn.fileno.return_value = read
+        wrapper = MagicMock()
+        wrapper.get_new_connection.return_value = conn
+
+        with patch('core.cache.connections', {'default': wrapper}):
+            invalidation = PostgresInvalidation(
+                LocalTier(10, 1024), 'default', 'channel',
+            )
+            deadline = time.monotonic() + 5
+            while not conn.cursor.called and time.monotonic() < deadline:
+                time.sleep(0.01)
+            invalidation.stop()
+
+        self.assertFalse(invalidation.listener.is_alive())
+        conn.close.assert_called_once_with()
+
+    def test_stop_invalidations(self):
+        """Test the invalidations of the process are stopped once."""
+        with override_settings(CACHES=two_tier_caches('stop')):
+            cache = caches['default']
+            broadcast = cache.broadcast()
+            broadcast.invalidation = MagicMock()
+
+            stop_invalidations()
+            stop_invalidations()
+
+            broadcast.invalidation.stop.assert_called_once_with()
+            self.assertIsNot(cache.broadcast(), broadcast)
+
+
+class TwoTierCacheTests(SimpleTestCase):
+    """Test the cache backend over a local memory shared tier."""
+
+    def test_read_through(self):
+        """Test values are served locally once read."""
+        with override_settings(CACHES=two_tier_caches('read-through')):
+            cache = caches['default']
+            caches['shared'].set('key', 'value')
+
+            self.assertEqual(cache.get('key'), 'value')
+            caches['shared'].delete('key')
+
+            self.assertEqual(cache.get('key'), 'value')
+            self.assertIsNone(cache.get('missing'))
+
+    def test_write_through(self):
+        """Test writes reach the shared tier."""
+        with override_settings(CACHES=two_tier_caches('write-through')):
+            cache = caches['default']
+            cache.set('key', {'a': 1})
+            cache.set_many({'b': 2, 'c': 3})
+            cache.incr('b')
+
+            self.assertEqual(caches['shared'].get('key'), {'a': 1})
+            self.assertEqual(
+                cache.get_many(['key', 'b', 'c', 'd']),
+                {'key': {'a': 1}, 'b': 3, 'c': 3},
+            )
+
+            cache.delete('key')
+            self.assertIsNone(cache.get('key'))
+            self.assertFalse(cache.add('b', 5))
+            cache.clear()
+            self.assertIsNone(cache.get('b'))
+
+    def test_misses_kept_locally(self):
+        """Test a miss is remembered until the key is written."""
+        with override_settings(CACHES=two_tier_caches('misses')):
+            cache = caches['default']
+            self.assertIsNone(cache.get('key'))
+            self.assertEqual(cache.get_many(['other']), {})
+
+            caches['shared'].set('key', 'value')
+            caches['shared'].set('other', 'value')
+
+            self.assertIsNone(cache.get('key'))
+            self.assertFalse(cache.has_key('key'))  # noqa: W601
+            self.assertEqual(cache.get('key', 'default'), 'default')
+            self.assertEqual(cache.get_many(['other']), {})
+
+            cache.set('key', 'mine')
+            self.assertEqual(cache.get('key'), 'mine')
+            self.assertTrue(cache.add('added', 1))
+            self.assertEqual(cache.get('added'), 1)
+
+    def test_values_copied(self):
+        """Test mutating a value read does not change the cached one."""
+        with override_settings(CACHES=two_tier_caches('copies')):
+            cache = caches['default']
+            cache.set('key', [1])
+
+            cache.get('key').append(2)
+
+            self.assertEqual(cache.get('key'), [1])
+
+    def test_other_process_write(self):
+        """Test a write broadcast by another process is seen."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.gen')
+            with override_settings(CACHES=two_tier_caches(
+                'other-process',
+                INVALIDATION='generation',
+                GENERATION_FILE=path,
+            )):
+                cache = caches['default']
+                cache.set('key', 'old')
+                caches['shared'].set('key', 'new')
+                self.assertEqual(cache.get('key'), 'old')
+
+                other = GenerationInvalidation(LocalTier(10, 1024), path)
+                other.publish(cache.make_key('key'))
+
+                self.assertEqual(cache.get('key'), 'new')
+
+
+class DatabaseSharedTierTests(TestCase):
+    """Test the cache backend over the database cache."""
+
+    def test_database_shared_tier(self):
+        """Test the shared tier can be the database."""
+        with override_settings(CACHES=two_tier_caches(
+            'database',
+            shared={
+                'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                'LOCATION': 'core_cache_test',
+            },
+        )):
+            call_command('createcachetable', verbosity=0)
+            cache = caches['default']
+            cache.set('key', 'value')
+            cache.broadcast().tier.clear()
+
+            self.assertEqual(cache.get('key'), 'value')
+            self.assertEqual(caches['shared'].get('key'), 'value')
@@ -1,13 +1,23 @@
 """
 Test custom Django management commands.
 """
+from io import StringIO
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as Psycopg2Error
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
+
+from core.models import (
+    TrailDig,
+    Tag,
+    TagWorkRollup,
+    VolunteerTotal,
+)
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -32,3 +42,77 @@ class CommandTests(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class RebuildTagTotalsTests(TestCase):
+    """Test the rebuild_tag_totals command."""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.tag = Tag.objects.create(user=user, name='Chomeuse')
+        dig = TrailDig.objects.create(
+            user=user,
+            title='Sample dig',
+            time_minutes=60,
+            number_people=3,
+        )
+        dig.tags.add(self.tag)
+        Tag.objects.update(work_done_minutes=0)
+        TagWorkRollup.objects.all().delete()
+
+    def test_check_reports_stale_totals(self):
+        """Test --check fails without fixing stale totals."""
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_tag_totals', check=True, stdout=out)
+
+        self.assertIn('Chomeuse', out.getvalue())
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.work_done_minutes, 0)
+
+    def test_rebuild_fixes_totals(self):
+        """Test rebuilding restores the totals."""
+        call_command('rebuild_tag_totals', stdout=StringIO())
+
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.work_done_minutes, 60)
+        self.assertTrue(self.tag.rollups.filter(time_minutes=60).exists())
+        call_command('rebuild_tag_totals', check=True, stdout=StringIO())
+
+
+class RebuildLeaderboardsTests(TestCase):
+    """Test the rebuild_leaderboards command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        TrailDig.objects.create(
+            user=self.user,
+            title='Sample dig',
+            time_minutes=60,
+            number_people=3,
+        )
+        VolunteerTotal.objects.all().delete()
+
+    def test_check_reports_stale_totals(self):
+        """Test --check fails without fixing stale totals."""
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_leaderboards', check=True, stdout=out)
+
+        self.assertIn(f'user {self.user.id}', out.getvalue())
+        self.assertFalse(VolunteerTotal.objects.exists())
+
+    def test_rebuild_fixes_totals(self):
+        """Test rebuilding restores the totals."""
+        out = StringIO()
+        call_command('rebuild_leaderboards', stdout=out)
+
+        self.assertIn('Rebuilt 1 volunteer total(s).', out.getvalue())
+        self.assertEqual(self.user.volunteer_total.person_minutes, 180)
+        call_command('rebuild_leaderboards', check=True, stdout=StringIO())
@@ -0,0 +1,57 @@
+"""
+Tests for the volunteer leaderboards.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from core import leaderboards
+from core.models import (
+    VolunteerTagTotal,
+    VolunteerTotal,
+)
+
+
+def create_user(email):
+    """Create and return a new user"""
+    return get_user_model().objects.create_user(
+        email=email,
+        password='testpass123',
+    )
+
+
+class RankTests(TestCase):
+    """Test the rank of a volunteer."""
+
+    def setUp(self):
+        self.users = [
+            create_user(f'user{index}@example.com') for index in range(4)
+        ]
+        for user, person_minutes in zip(self.users, [300, 120, 120, 0]):
+            VolunteerTotal.objects.update_or_create(
+                user=user,
+                defaults={'person_minutes': person_minutes},
+            )
+            VolunteerTagTotal.objects.create(
+                user=user,
+                tag_name='SDM',
+                person_minutes=person_minutes // 2,
+            )
+
+    def test_rank_single_query(self):
+        """Test a rank is read in one query whatever its position."""
+        for user, expected in zip(self.users, [(1, 300), (2, 120), (2, 120)]):
+            with self.assertNumQueries(1):
+                self.assertEqual(leaderboards.rank(user.id), expected)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                leaderboards.rank(self.users[1].id, 'SDM'),
+                (2, 60),
+            )
+
+    def test_unranked(self):
+        """Test volunteers without person-minutes are not ranked."""
+        with self.assertNumQueries(1):
+            self.assertIsNone(leaderboards.rank(self.users[3].id))
+        with self.assertNumQueries(1):
+            self.assertIsNone(leaderboards.rank(self.users[0].id, 'MSA'))
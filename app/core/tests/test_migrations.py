@@ -0,0 +1,83 @@
+"""
+Tests for data migrations.
+"""
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class DedupeTagsMigrationTests(TransactionTestCase):
+    """Test merging duplicate tags before adding the unique constraint."""
+    migrate_from = [('core', '0012_tagworkrollup')]
+    migrate_to = [('core', '0013_dedupe_tags')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        apps = executor.loader.project_state(self.migrate_from).apps
+        User = apps.get_model('core', 'User')
+        Tag = apps.get_model('core', 'Tag')
+        TrailDig = apps.get_model('core', 'TrailDig')
+        TagWorkRollup = apps.get_model('core', 'TagWorkRollup')
+
+        user = User.objects.create(email='user@example.com')
+        other_user = User.objects.create(email='other@example.com')
+        self.keep = Tag.objects.create(user=user, name='SDM')
+        dup1 = Tag.objects.create(user=user, name='SDM')
+        dup2 = Tag.objects.create(user=user, name='SDM')
+        self.other = Tag.objects.create(user=other_user, name='SDM')
+
+        def dig(minutes, *tags):
+            traildig = TrailDig.objects.create(
+                user=user,
+                title='Dig',
+                time_minutes=minutes,
+                number_people=2,
+                date_time='2024-10-25 10:00:00',
+            )
+            traildig.tags.add(*tags)
+            return traildig
+
+        self.dig_both = dig(10, self.keep, dup1)
+        self.dig_dups = dig(20, dup1, dup2)
+        self.dig_dup = dig(40, dup2, self.other)
+        for tag in [self.keep, dup1, dup2]:
+            TagWorkRollup.objects.create(
+                tag=tag, year=2024, month=10, time_minutes=1,
+            )
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.migrate_to)
+        self.apps = executor.loader.project_state(self.migrate_to).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_are_merged(self):
+        """Test links move to the oldest tag and aggregates follow."""
+        Tag = self.apps.get_model('core', 'Tag')
+        TrailDig = self.apps.get_model('core', 'TrailDig')
+        TagWorkRollup = self.apps.get_model('core', 'TagWorkRollup')
+
+        self.assertEqual(
+            set(Tag.objects.values_list('id', flat=True)),
+            {self.keep.id, self.other.id},
+        )
+        for dig in [self.dig_both, self.dig_dups, self.dig_dup]:
+            tags = TrailDig.objects.get(id=dig.id).tags
+            self.assertIn(self.keep.id, tags.values_list('id', flat=True))
+        self.assertEqual(
+            TrailDig.objects.get(id=self.dig_dup.id).tags.count(),
+            2,
+        )
+
+        keep = Tag.objects.get(id=self.keep.id)
+        self.assertEqual(keep.work_done_minutes, 70)
+        rollup = TagWorkRollup.objects.get(tag_id=self.keep.id)
+        self.assertEqual(
+            (rollup.time_minutes, rollup.person_minutes),
+            (70, 140),
+        )
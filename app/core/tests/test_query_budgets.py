@@ -0,0 +1,315 @@
+"""
+Tests for the per view query budgets.
+"""
+from importlib import import_module
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import (
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import (
+    TrailDig,
+    Tag,
+)
+from core.query_budget import (
+    QueryBudgetExceeded,
+    QueryBudgetMixin,
+    QueryCounter,
+    unbudgeted,
+)
+from traildig.views import TrailDigViewSet
+
+BUDGETED_URLCONFS = ['traildig.urls', 'user.urls']
+
+
+def iter_callbacks(patterns):
+    """Yield the view callbacks of url patterns, recursively."""
+    for pattern in patterns:
+        if hasattr(pattern, 'url_patterns'):
+            yield from iter_callbacks(pattern.url_patterns)
+        else:
+            yield pattern.callback
+
+
+def view_actions(callback):
+    """Return the view class of a callback and the actions it serves."""
+    view_class = callback.cls
+    if getattr(callback, 'actions', None):
+        return view_class, set(callback.actions.values())
+    return view_class, {
+        method for method in view_class.http_method_names
+        if method != 'options' and hasattr(view_class, method)
+    }
+
+
+def create_user(email='user@example.com', password='testpass123', **extra):
+    """Create and return a new user"""
+    return get_user_model().objects.create_user(
+        email=email,
+        password=password,
+        **extra,
+    )
+
+
+def create_traildigs(user, count, tags):
+    """Create digs tagged with every tag."""
+    for i in range(count):
+        dig = TrailDig.objects.create(
+            user=user,
+            title=f'Dig {i}',
+            time_minutes=30,
+            number_people=3,
+        )
+        dig.tags.add(*tags)
+
+
+class QueryBudgetDeclarationTests(TestCase):
+    """Test every API route declares its query budgets."""
+
+    def test_every_action_has_a_budget(self):
+        """Test all views are budgeted for all of their actions."""
+        for urlconf in BUDGETED_URLCONFS:
+            patterns = import_module(urlconf).urlpatterns
+            for callback in iter_callbacks(patterns):
+                view_class, actions = view_actions(callback)
+                with self.subTest(view=view_class.__name__):
+                    self.assertTrue(issubclass(view_class, QueryBudgetMixin))
+                    for action in actions:
+                        self.assertIsNotNone(
+                            view_class.get_query_budget(action),
+                            f'{view_class.__name__}.{action} has no budget',
+                        )
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryBudgetTests(TestCase):
+    """Test the API stays within its query budgets."""
+
+    def setUp(self):
+        self.user = create_user(name='Test Name')
+        self.admin = get_user_model().objects.create_superuser(
+            'admin@example.com',
+            'testpass123',
+        )
+        self.tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ['Chomeuse', 'MSA', 'SDM']
+        ]
+        create_traildigs(self.user, 5, self.tags)
+        self.dig = TrailDig.objects.order_by('id').first()
+        self.client = self.client_for(self.user)
+
+    def client_for(self, user):
+        """Return a client authenticated with a real token."""
+        client = APIClient()
+        token = Token.objects.create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def assertWithinBudget(self, method, url, data=None, client=None):
+        """Run a request and check it stays within its budget."""
+        client = client or self.client
+        with CaptureQueriesContext(connection) as queries:
+            res = getattr(client, method)(url, data, format='json')
+
+        match = resolve(url)
+        view_class, _ = view_actions(match.func)
+        actions = getattr(match.func, 'actions', None)
+        action = actions[method] if actions else method
+        budget = view_class.get_query_budget(action)
+        self.assertLessEqual(len(queries), budget, f'{url} {method}')
+        return res, len(queries)
+
+    def test_traildig_routes(self):
+        """Test the trail dig routes stay within budget."""
+        list_url = reverse('traildig:traildig-list')
+        detail_url = reverse('traildig:traildig-detail', args=[self.dig.id])
+        payload = {
+            'title': 'New dig',
+            'time_minutes': 60,
+            'number_people': 2,
+            'tags': [{'name': 'MSA'}, {'name': 'SDM'}],
+        }
+
+        res, _ = self.assertWithinBudget('get', list_url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, _ = self.assertWithinBudget('post', list_url, payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        res, _ = self.assertWithinBudget(
+            'post', reverse('traildig:traildig-bulk'), [payload] * 3,
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        res, _ = self.assertWithinBudget(
+            'get', reverse('traildig:traildig-export'),
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, _ = self.assertWithinBudget(
+            'get', reverse('traildig:traildig-changes'),
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, _ = self.assertWithinBudget('get', detail_url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, _ = self.assertWithinBudget('put', detail_url, payload)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, _ = self.assertWithinBudget(
+            'patch', detail_url, {'tags': [{'name': 'Chomeuse'}]},
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, _ = self.assertWithinBudget('delete', detail_url)
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_tag_routes(self):
+        """Test the tag routes stay within budget."""
+        admin_client = self.client_for(self.admin)
+        tag = self.tags[0]
+        detail_url = reverse('traildig:tag-detail', args=[tag.id])
+
+        res, _ = self.assertWithinBudget('get', reverse('traildig:tag-list'))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, _ = self.assertWithinBudget(
+            'get', reverse('traildig:tag-series', args=[tag.id]),
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, _ = self.assertWithinBudget(
+            'get', reverse('traildig:tag-changes'),
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, _ = self.assertWithinBudget(
+            'put', detail_url, {'name': 'Chomeuse 2'}, admin_client,
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, _ = self.assertWithinBudget(
+            'patch', detail_url, {'name': 'Chomeuse 3'}, admin_client,
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, _ = self.assertWithinBudget(
+            'delete', detail_url, client=admin_client,
+        )
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_leaderboard_routes(self):
+        """Test the leaderboard routes stay within budget."""
+        res, _ = self.assertWithinBudget(
+            'get', reverse('traildig:leaderboard-list'), {'tag': 'MSA'},
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, _ = self.assertWithinBudget(
+            'get', reverse('traildig:leaderboard-rank'),
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_api_root(self):
+        """Test the browsable API root stays within budget."""
+        res, _ = self.assertWithinBudget('get', reverse('traildig:api-root'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_user_routes(self):
+        """Test the user routes stay within budget."""
+        res, _ = self.assertWithinBudget('post', reverse('user:create'), {
+            'email': 'new@example.com',
+            'password': 'testpass123',
+            'name': 'New',
+        }, APIClient())
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        res, _ = self.assertWithinBudget('post', reverse('user:token'), {
+            'email': 'new@example.com',
+            'password': 'testpass123',
+        }, APIClient())
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        me_url = reverse('user:me')
+        res, _ = self.assertWithinBudget('get', me_url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, _ = self.assertWithinBudget('put', me_url, {
+            'email': 'user@example.com',
+            'password': 'newpass123',
+            'name': 'Renamed',
+        })
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, _ = self.assertWithinBudget('patch', me_url, {'name': 'Again'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        """Test listing more digs and tags does not add queries."""
+        url = reverse('traildig:traildig-list')
+        # Later requests find the token in the authentication cache.
+        self.client.get(reverse('user:me'))
+        _, few = self.assertWithinBudget('get', url)
+
+        more_tags = [
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+            for i in range(5)
+        ]
+        create_traildigs(self.user, 20, self.tags + more_tags)
+        _, many = self.assertWithinBudget('get', url)
+
+        self.assertEqual(few, many)
+
+    def test_strict_mode_raises(self):
+        """Test going over budget fails loudly in strict mode."""
+        url = reverse('traildig:traildig-list')
+
+        with patch.object(TrailDigViewSet, 'query_budgets', {'list': 1}), \
+                self.assertRaises(QueryBudgetExceeded):
+            self.client.get(url)
+
+    @override_settings(QUERY_BUDGET_STRICT=False, QUERY_BUDGET_LOG=True)
+    def test_log_mode_warns(self):
+        """Test going over budget is logged outside strict mode."""
+        url = reverse('traildig:traildig-list')
+
+        with patch.object(TrailDigViewSet, 'query_budgets', {'list': 1}), \
+                self.assertLogs('core.query_budget', 'WARNING') as logs:
+            res = self.client.get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('TrailDigViewSet.list', logs.output[0])
+
+    def test_unbudgeted_queries_not_counted(self):
+        """Test queries run inside unbudgeted() are left out."""
+        counter = QueryCounter()
+
+        with connection.execute_wrapper(counter):
+            Tag.objects.count()
+            with unbudgeted():
+                Tag.objects.count()
+
+        self.assertEqual(counter.count, 1)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class WriteQueryBudgetTests(TransactionTestCase):
+    """Test the dig writes stay within budget outside of a transaction."""
+
+    def test_traildig_writes(self):
+        """Test the budgets also hold when the view opens the transaction."""
+        user = create_user()
+        tags = [
+            Tag.objects.create(user=user, name=name)
+            for name in ['Chomeuse', 'MSA', 'SDM']
+        ]
+        create_traildigs(user, 2, tags)
+        dig = TrailDig.objects.order_by('id').first()
+        url = reverse('traildig:traildig-detail', args=[dig.id])
+        client = APIClient()
+        client.force_authenticate(user)
+
+        res = client.patch(url, {
+            'time_minutes': 45,
+            'tags': [{'name': 'Chomeuse'}],
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = client.delete(url)
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,122 @@
+"""
+Tests for the fast JSON renderer and parser.
+"""
+import datetime
+import decimal
+import io
+import uuid
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnDict
+
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer
+
+SAMPLE = {
+    'naive': datetime.datetime(2024, 10, 25, 10, 0, 0, 123456),
+    'utc': datetime.datetime(2024, 10, 25, 10, 0, tzinfo=timezone.utc),
+    'offset': datetime.datetime(
+        2024, 10, 25, 10, 0,
+        tzinfo=datetime.timezone(datetime.timedelta(hours=2)),
+    ),
+    'date': datetime.date(2024, 10, 25),
+    'time': datetime.time(10, 30, 15),
+    'duration': datetime.timedelta(hours=1, minutes=30),
+    'decimal': decimal.Decimal('12.50'),
+    'lazy': gettext_lazy('This field is required.'),
+    'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'text': 'Chômeuse «dig» line "quoted"\\',
+    'numbers': [0, -1, 1.5, 0.1, 2 ** 62, True, None],
+    'nested': ReturnDict({'tags': ({'id': 1},)}, serializer=None),
+    'set': frozenset(),
+}
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """Test the fast renderer output matches JSONRenderer."""
+
+    def assertSameRender(self, data, media_type=None, context=None):
+        expected = JSONRenderer().render(data, media_type, context)
+        self.assertEqual(
+            FastJSONRenderer().render(data, media_type, context),
+            expected,
+        )
+
+    def test_same_output(self):
+        """Test common values render identically."""
+        self.assertSameRender(SAMPLE)
+        self.assertSameRender([SAMPLE, SAMPLE])
+        self.assertSameRender('plain')
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_exponent_floats(self):
+        """Test floats in exponent notation keep their value."""
+        data = [1e-07, 1e16, -2.5e-300]
+        rendered = FastJSONRenderer().render(data)
+
+        self.assertEqual(rendered, b'[1e-7,1e16,-2.5e-300]')
+        self.assertEqual(JSONParser().parse(io.BytesIO(rendered)), data)
+
+    def test_unsupported_values_fall_back(self):
+        """Test values orjson cannot encode render like JSONRenderer."""
+        self.assertSameRender({'big': 2 ** 70})
+        self.assertSameRender({1: 'non string key'})
+
+    def test_indented_output(self):
+        """Test indentation is honoured."""
+        self.assertSameRender(SAMPLE, 'application/json; indent=2')
+        self.assertSameRender(SAMPLE, context={'indent': 4})
+
+    def test_without_orjson(self):
+        """Test the renderer works when orjson is not installed."""
+        with patch('core.renderers.orjson', None):
+            self.assertSameRender(SAMPLE)
+
+
+class FastJSONParserTests(SimpleTestCase):
+    """Test the fast parser matches JSONParser."""
+
+    def parse(self, parser, body, encoding='utf-8'):
+        return parser.parse(io.BytesIO(body), parser_context={
+            'encoding': encoding,
+        })
+
+    def test_same_output(self):
+        """Test bodies parse identically."""
+        body = JSONRenderer().render(SAMPLE)
+        for encoding in ['utf-8', 'UTF8']:
+            self.assertEqual(
+                self.parse(FastJSONParser(), body, encoding),
+                self.parse(JSONParser(), body, encoding),
+            )
+        body = '{"title": "Chômeuse"}'.encode('latin-1')
+        self.assertEqual(
+            self.parse(FastJSONParser(), body, 'latin-1'),
+            {'title': 'Chômeuse'},
+        )
+
+    def test_invalid_bodies(self):
+        """Test invalid bodies are rejected like JSONParser does."""
+        for body in [b'{"title": ', b'{"value": NaN}', b'\xff']:
+            with self.subTest(body=body):
+                with self.assertRaises(ParseError) as fast:
+                    self.parse(FastJSONParser(), body)
+                with self.assertRaises(ParseError) as slow:
+                    self.parse(JSONParser(), body)
+                self.assertEqual(
+                    str(fast.exception.detail), str(slow.exception.detail),
+                )
+
+    def test_without_orjson(self):
+        """Test the parser works when orjson is not installed."""
+        with patch('core.parsers.orjson', None):
+            self.assertEqual(
+                self.parse(FastJSONParser(), b'{"id": 1}'), {'id': 1},
+            )
@@ -0,0 +1,190 @@
+"""
+Tests for the coalescing of concurrent computations.
+"""
+import threading
+import time
+from unittest.mock import (
+    MagicMock,
+    patch,
+)
+
+from django.db import OperationalError
+from django.test import (
+    SimpleTestCase,
+    override_settings,
+)
+
+from core import singleflight
+
+
+class GroupTests(SimpleTestCase):
+    """Test calls are coalesced within the process."""
+
+    def test_concurrent_calls_share_result(self):
+        """Test the calls made while one runs wait for its result."""
+        group = singleflight.Group()
+        calls = []
+        results = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        def call():
+            results.append(group.do('key', compute, timeout=5))
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        # Let the followers reach the wait.
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [
+            ('result', False),
+            ('result', True),
+            ('result', True),
+        ])
+        self.assertEqual(group.calls, {})
+
+    def test_sequential_calls_not_shared(self):
+        """Test a call after another finished computes again."""
+        group = singleflight.Group()
+
+        self.assertEqual(group.do('key', lambda: 1), (1, False))
+        self.assertEqual(group.do('key', lambda: 2), (2, False))
+
+    def test_failure_not_shared(self):
+        """Test waiting callers compute themselves when the leader fails."""
+        group = singleflight.Group()
+        call = group.calls['key'] = singleflight._Call()
+        call.failed = True
+        call.done.set()
+
+        self.assertEqual(group.do('key', lambda: 'own'), ('own', False))
+
+        with self.assertRaises(ValueError):
+            group.do('other', lambda: int('nope'))
+        self.assertEqual(list(group.calls), ['key'])
+
+    def test_wait_timeout(self):
+        """Test a caller stops waiting after the timeout."""
+        group = singleflight.Group()
+        group.calls['key'] = singleflight._Call()
+
+        self.assertEqual(
+            group.do('key', lambda: 'own', timeout=0.01),
+            ('own', False),
+        )
+
+
+class AdvisoryLockTests(SimpleTestCase):
+    """Test the advisory lock serializing processes."""
+
+    def test_lock_id(self):
+        """Test lock ids are stable signed 64 bit integers."""
+        lock = singleflight.lock_id('key')
+
+        self.assertEqual(lock, singleflight.lock_id('key'))
+        self.assertNotEqual(lock, singleflight.lock_id('other'))
+        self.assertTrue(-2 ** 63 <= lock < 2 ** 63)
+
+    def test_unused_outside_postgres(self):
+        """Test other databases proceed without the lock."""
+        with singleflight.advisory_lock('key', 1) as locked:
+            self.assertFalse(locked)
+
+    def postgres_connection(self, nested=False, lock_error=None):
+        """Return a mocked PostgreSQL connection taking the lock."""
+        connection = MagicMock(vendor='postgresql', in_atomic_block=nested)
+        cursor = connection.cursor.return_value.__enter__.return_value
+
+        def execute(sql, params=None):
+            if lock_error is not None and 'pg_advisory_lock' in sql:
+                raise lock_error
+
+        cursor.execute.side_effect = execute
+        return connection, cursor
+
+    def lock_timeout_error(self, pgcode=singleflight.LOCK_NOT_AVAILABLE):
+        """Return the error of a lock wait canceled by lock_timeout."""
+        cause = Exception('canceling statement due to lock timeout')
+        cause.pgcode = pgcode
+        error = OperationalError(*cause.args)
+        error.__cause__ = cause
+        return error
+
+    def advisory_lock(self, connection, key, timeout):
+        """Enter advisory_lock on a mocked connection and transaction."""
+        with patch('core.singleflight.connection', connection), \
+                patch('core.singleflight.transaction') as transaction:
+            with singleflight.advisory_lock(key, timeout) as locked:
+                self.assertTrue(locked)
+        transaction.atomic.assert_called_once_with()
+
+    @override_settings(TRAILDIG_COALESCE_ADVISORY_LOCK=True)
+    def test_waits_for_holder(self):
+        """Test the lock is waited for under a lock_timeout then released."""
+        connection, cursor = self.postgres_connection()
+
+        self.advisory_lock(connection, 'key', 1.5)
+
+        lock = singleflight.lock_id('key')
+        self.assertEqual(
+            [call.args for call in cursor.execute.call_args_list],
+            [
+                ('SET LOCAL lock_timeout = %s', ['1500ms']),
+                ('SELECT pg_advisory_lock(%s)', [lock]),
+                ('SELECT pg_advisory_unlock(%s)', [lock]),
+            ],
+        )
+
+    @override_settings(TRAILDIG_COALESCE_ADVISORY_LOCK=True)
+    def test_nested_transaction_timeout_reset(self):
+        """Test the lock_timeout does not outlive the lock in a transaction."""
+        connection, cursor = self.postgres_connection(nested=True)
+
+        self.advisory_lock(connection, 'key', 1)
+
+        self.assertEqual(
+            cursor.execute.call_args_list[2].args,
+            ('SET LOCAL lock_timeout TO DEFAULT',),
+        )
+
+    @override_settings(TRAILDIG_COALESCE_ADVISORY_LOCK=True)
+    def test_gives_up_after_timeout(self):
+        """Test a held lock is not waited for past the timeout."""
+        connection, cursor = self.postgres_connection(
+            lock_error=self.lock_timeout_error(),
+        )
+
+        self.advisory_lock(connection, 'key', 0)
+
+        self.assertEqual(
+            [call.args for call in cursor.execute.call_args_list],
+            [
+                ('SET LOCAL lock_timeout = %s', ['1ms']),
+                ('SELECT pg_advisory_lock(%s)', [singleflight.lock_id('key')]),
+            ],
+        )
+
+    @override_settings(TRAILDIG_COALESCE_ADVISORY_LOCK=True)
+    def test_other_errors_raised(self):
+        """Test errors other than the lock timeout are not swallowed."""
+        error = self.lock_timeout_error(pgcode='57014')
+        connection, cursor = self.postgres_connection(lock_error=error)
+
+        with patch('core.singleflight.connection', connection), \
+                patch('core.singleflight.transaction'):
+            with self.assertRaises(OperationalError):
+                with singleflight.advisory_lock('key', 1):
+                    pass
@@ -0,0 +1,76 @@
+"""
+Per user change versions backing conditional GETs.
+
+Every write changing a user's digs or tags, including the tag totals
+shown with them, bumps the user's `data_version` and `data_changed_at`,
+and the `DataVersion` row of all users together. The signal handlers in
+core.signals and the bulk write paths do it, in the same statement as
+their other bookkeeping where they can.
+
+Validators for a response are then read from that row when it shows the
+data of every user, or with one aggregate over the users whose data it
+shows, instead of over the rows it lists.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import (
+    F,
+    Max,
+    Q,
+    Sum,
+)
+from django.utils import timezone
+
+from core.models import (
+    DataVersion,
+    Tag,
+)
+
+
+def touch(user_ids=(), tag_ids=()):
+    """Bump the version of users and of the owners of tags."""
+    if not user_ids and not tag_ids:
+        return
+    owners = Q(pk__in=list(user_ids))
+    if tag_ids:
+        owners |= Q(pk__in=Tag.objects.filter(
+            pk__in=list(tag_ids),
+        ).values('user_id'))
+    now = timezone.now()
+    get_user_model().objects.filter(owners).update(
+        data_version=F('data_version') + 1,
+        data_changed_at=now,
+    )
+    touch_all(now)
+
+
+def touch_all(now):
+    """Bump the version of the data of all users."""
+    bump = DataVersion.objects.filter(pk=DataVersion.ALL)
+    if not bump.update(version=F('version') + 1, changed_at=now):
+        # Only when the row is missing, as after a flush.
+        DataVersion.objects.bulk_create(
+            [DataVersion(pk=DataVersion.ALL)],
+            ignore_conflicts=True,
+        )
+        bump.update(version=F('version') + 1, changed_at=now)
+
+
+def current(users=None):
+    """Return the (version, last change) of the users' data.
+
+    The version is a string changing whenever the data of any of the
+    users, or of all users when None, changes. The last change is part
+    of it, so a deleted user taking their versions out of the sum cannot
+    bring back an old one.
+    """
+    if users is None:
+        row = DataVersion.objects.filter(pk=DataVersion.ALL).values(
+            'version',
+            'changed_at',
+        ).first() or {'version': 0, 'changed_at': None}
+        return f"{row['version']}.{row['changed_at']}", row['changed_at']
+    row = users.aggregate(
+        version=Sum('data_version'),
+        changed_at=Max('data_changed_at'),
+    )
+    return f"{row['version'] or 0}.{row['changed_at']}", row['changed_at']
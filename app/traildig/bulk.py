@@ -0,0 +1,94 @@
+"""
+Bulk writes of trail digs.
+
+Bulk inserts bypass the model signals, so the bookkeeping the signal
+handlers normally do is performed here explicitly, in bulk.
+"""
+from django.db import (
+    connection,
+    transaction,
+)
+
+from core import (
+    aggregates,
+    changes,
+    search,
+)
+from core.models import (
+    TrailDig,
+    Tag,
+)
+
+BATCH_SIZE = 1000
+
+
+def save_tags(tags):
+    """Give a primary key to the tags that were not saved yet.
+
+    Missing tags are upserted with a single INSERT ... ON CONFLICT DO
+    NOTHING, so concurrent writers creating the same tag do not fail,
+    then selected back in one query.
+    """
+    new_tags = [tag for tag in tags if tag.pk is None]
+    if not new_tags:
+        return
+
+    Tag.objects.bulk_create(new_tags, ignore_conflicts=True)
+    saved = Tag.objects.filter(
+        user_id__in={tag.user_id for tag in new_tags},
+        name__in={tag.name for tag in new_tags},
+    )
+    pks = {(tag.user_id, tag.name): tag.pk for tag in saved}
+    for tag in new_tags:
+        tag.pk = pks[tag.user_id, tag.name]
+    # Some may have been created concurrently, recording them again is
+    # harmless.
+    changes.record_objects(changes.TAG, new_tags)
+
+
+@transaction.atomic
+def create_traildigs(items, batch_size=BATCH_SIZE):
+    """Insert digs with their tags and return the created instances.
+
+    Every item is a mapping of TrailDig field values where ``tags`` is a
+    list of Tag instances, saved or not.
+    """
+    save_tags([tag for item in items for tag in item.get('tags', [])])
+
+    digs = []
+    dig_tags = []
+    for item in items:
+        fields = dict(item)
+        tags = {tag.pk: tag for tag in fields.pop('tags', [])}
+        dig_tags.append(list(tags.values()))
+        digs.append(TrailDig(**fields))
+
+    if connection.features.can_return_rows_from_bulk_insert:
+        TrailDig.objects.bulk_create(digs, batch_size=batch_size)
+    else:
+        # Primary keys are needed for the through rows. raw=True tells
+        # the signal handlers the bookkeeping is done here.
+        for dig in digs:
+            dig.save_base(raw=True)
+
+    aggregates.TrailDigTag.objects.bulk_create(
+        [
+            aggregates.TrailDigTag(traildig_id=dig.pk, tag_id=tag.pk)
+            for dig, tags in zip(digs, dig_tags)
+            for tag in tags
+        ],
+        batch_size=batch_size,
+    )
+
+    delta = aggregates.AggregateDelta()
+    delta.user_ids.update(dig.user_id for dig in digs)
+    for dig, tags in zip(digs, dig_tags):
+        values = aggregates.dig_values(dig)
+        delta.tag_names.update((tag.pk, tag.name) for tag in tags)
+        delta.add([tag.pk for tag in tags], values)
+        delta.add_dig(values)
+    delta.apply()
+    changes.record_objects(changes.TRAILDIG, digs)
+    search.index_traildigs(digs)
+
+    return digs
@@ -0,0 +1,38 @@
+"""
+Client side decoding of the trail dig API response formats.
+
+Only depends on the standard library, and on msgpack for MessagePack
+responses, so API clients can reuse it as is. `decode` returns the data
+the default JSON format would have returned.
+"""
+import json
+
+JSON_MEDIA_TYPE = 'application/json'
+COLUMNAR_MEDIA_TYPE = 'application/vnd.traildig.columnar+json'
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+
+
+def from_columns(data):
+    """Return data with its column by column rows turned back into rows."""
+    if isinstance(data, dict) and set(data) == {'columns', 'values'}:
+        names, values = data['columns'], data['values']
+        count = len(values[0]) if values else 0
+        return [
+            {name: column[i] for name, column in zip(names, values)}
+            for i in range(count)
+        ]
+    if isinstance(data, dict) and isinstance(data.get('results'), dict):
+        return {**data, 'results': from_columns(data['results'])}
+    return data
+
+
+def decode(content, content_type):
+    """Decode a response body given its Content-Type header."""
+    media_type = content_type.split(';')[0].strip()
+    if media_type == MSGPACK_MEDIA_TYPE:
+        import msgpack
+        return msgpack.unpackb(content)
+    data = json.loads(content)
+    if media_type == COLUMNAR_MEDIA_TYPE:
+        return from_columns(data)
+    return data
@@ -0,0 +1,436 @@
+"""
+Push notifications of trail dig and tag changes, served under ASGI.
+
+Dashboards subscribe instead of polling the lists:
+
+- ``/api/traildig/events/``: Server-Sent Events. Every batch of changes
+  is sent as a ``traildig`` or ``tag`` event with the changed and deleted
+  ids, its id is the latest change id: browsers reconnecting send it back
+  in Last-Event-ID and miss nothing.
+- ``/api/traildig/events/poll/?since=<id>``: long poll fallback. Answers
+  the events past the change id as soon as there are some, or no events
+  after TRAILDIG_EVENTS_LONG_POLL_TIMEOUT seconds. Without ``since`` it
+  answers right away with the latest change id to start from.
+
+Both take ``?mine=true`` and ``?kinds=traildig,tag``. They authenticate
+like the API, or with an access token in ``?access_token=`` as
+EventSource cannot set headers. Clients then read what changed from the
+change feeds.
+
+app.asgi routes these paths here and the rest to Django, so idle
+connections hold no worker. In every event loop one `ChangeHub` reads
+the change log, see core.changes, for all the subscriptions: woken by
+the NOTIFY of committed writes on PostgreSQL and otherwise every
+TRAILDIG_EVENTS_POLL_INTERVAL seconds.
+"""
+import asyncio
+import json
+import logging
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import (
+    DatabaseError,
+    connection,
+    connections,
+)
+from django.http import (
+    HttpRequest,
+    QueryDict,
+)
+
+from rest_framework import exceptions
+
+from core import changes
+from traildig import serializers
+from user.authentication import (
+    AccessTokenAuthentication,
+    CachedTokenAuthentication,
+)
+
+logger = logging.getLogger(__name__)
+
+EVENTS_PATH = '/api/traildig/events/'
+POLL_PATH = '/api/traildig/events/poll/'
+
+AUTHENTICATION_CLASSES = [
+    CachedTokenAuthentication,
+    AccessTokenAuthentication,
+]
+
+# Changes read per query by a hub.
+BATCH_SIZE = 1000
+
+# Milliseconds browsers wait before reconnecting a dropped stream.
+RETRY_MS = 3000
+
+
+def authenticate(headers, query):
+    """Return the user authenticated by an ASGI request, None if anonymous.
+
+    Raises AuthenticationFailed for invalid credentials.
+    """
+    request = HttpRequest()
+    for name, value in headers:
+        key = name.decode('latin1').upper().replace('-', '_')
+        request.META[f'HTTP_{key}'] = value.decode('latin1')
+    token = query.get('access_token')
+    if token and 'HTTP_AUTHORIZATION' not in request.META:
+        request.META['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+
+    for authentication_class in AUTHENTICATION_CLASSES:
+        result = authentication_class().authenticate(request)
+        if result is not None:
+            return result[0]
+    return None
+
+
+def read_changes(after, limit):
+    """Return the first changes of every kind past the change id after."""
+    try:
+        return changes.since(None, after, limit)
+    except DatabaseError:
+        # Reconnects on the next read, e.g. after a database restart.
+        connection.close()
+        raise
+
+
+class Subscription:
+    """The changes a client follows and its events not sent yet."""
+
+    def __init__(self, kinds, user_id=None, after=None):
+        self.kinds = kinds
+        self.user_id = user_id
+        # Latest change id seen, the hub's latest when None.
+        self.after = after
+        self.events = []
+        self.ready = asyncio.Event()
+
+    def deliver(self, rows):
+        """Queue events for the followed changes among rows."""
+        rows = [row for row in rows if row.id > self.after]
+        if not rows:
+            return
+        self.after = rows[-1].id
+
+        events = {}
+        for row in rows:
+            if row.kind not in self.kinds or (
+                self.user_id is not None and row.user_id != self.user_id
+            ):
+                continue
+            event = events.setdefault(row.kind, {
+                'id': self.after,
+                'kind': row.kind,
+                'changed': [],
+                'deleted': [],
+            })
+            event['deleted' if row.deleted else 'changed'].append(
+                row.object_id,
+            )
+        if events:
+            self.events.extend(events.values())
+            self.ready.set()
+
+    async def wait(self, timeout):
+        """Return the queued events, waiting up to timeout for some."""
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        events, self.events = self.events, []
+        self.ready.clear()
+        return events
+
+
+class ChangeHub:
+    """Read the change log for the subscriptions of one event loop."""
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.latest_id = None
+        self.wake = asyncio.Event()
+        self.task = None
+        self.listener = None
+
+    async def get_latest_id(self):
+        """Return the latest change id read, reading it the first time."""
+        if self.latest_id is None:
+            self.latest_id = await sync_to_async(changes.latest_id)()
+        return self.latest_id
+
+    async def subscribe(self, subscription):
+        """Start delivering changes to a subscription."""
+        if subscription.after is None:
+            subscription.after = await self.get_latest_id()
+        self.subscriptions.add(subscription)
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+        elif subscription.after < await self.get_latest_id():
+            # Catch it up right away.
+            self.wake.set()
+
+    def unsubscribe(self, subscription):
+        """Stop delivering changes to a subscription."""
+        self.subscriptions.discard(subscription)
+
+    async def run(self):
+        """Deliver changes for as long as there are subscriptions."""
+        await self.listen()
+        try:
+            while True:
+                try:
+                    await self.read()
+                except Exception:
+                    logger.exception('Reading the change log failed.')
+                try:
+                    await asyncio.wait_for(
+                        self.wake.wait(),
+                        settings.TRAILDIG_EVENTS_POLL_INTERVAL,
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                self.wake.clear()
+                if not self.subscriptions:
+                    # Read again by the next subscription, writes go on.
+                    self.latest_id = None
+                    self.task = None
+                    return
+        finally:
+            self.unlisten()
+
+    async def read(self):
+        """Deliver the changes past the subscription furthest behind."""
+        while self.subscriptions:
+            after = min(sub.after for sub in self.subscriptions)
+            rows = await sync_to_async(read_changes)(after, BATCH_SIZE)
+            if rows:
+                self.latest_id = max(self.latest_id or 0, rows[-1].id)
+            for subscription in list(self.subscriptions):
+                subscription.deliver(rows)
+            if len(rows) < BATCH_SIZE:
+                return
+
+    async def listen(self):
+        """LISTEN for committed changes on PostgreSQL, else only poll."""
+        if connection.vendor != 'postgresql':
+            return
+        loop = asyncio.get_event_loop()
+        wrapper = connections['default']
+        try:
+            conn = await loop.run_in_executor(
+                None,
+                wrapper.get_new_connection,
+                wrapper.get_connection_params(),
+            )
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN "{changes.CHANNEL}"')
+        except Exception:
+            logger.exception('Listening to the change log failed.')
+            return
+        self.listener = (conn, conn.fileno())
+        loop.add_reader(self.listener[1], self.notified)
+
+    def notified(self):
+        """Wake the hub on notifications."""
+        conn, _ = self.listener
+        try:
+            conn.poll()
+        except Exception:
+            logger.exception('Listening to the change log failed.')
+            self.unlisten()
+            return
+        conn.notifies.clear()
+        self.wake.set()
+
+    def unlisten(self):
+        """Close the LISTEN connection."""
+        if self.listener is None:
+            return
+        conn, fd = self.listener
+        self.listener = None
+        asyncio.get_event_loop().remove_reader(fd)
+        conn.close()
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    """Return the hub of the running event loop."""
+    loop = asyncio.get_event_loop()
+    if loop not in _hubs:
+        _hubs[loop] = ChangeHub()
+    return _hubs[loop]
+
+
+async def respond(send, status, data, headers=()):
+    """Send a JSON response."""
+    body = json.dumps(data).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'cache-control', b'no-store'),
+            *headers,
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def wait_disconnect(receive):
+    """Return once the client is gone."""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def wait_events(subscription, timeout, disconnected):
+    """Return the subscription's next events, None if the client left."""
+    waiting = asyncio.ensure_future(subscription.wait(timeout))
+    await asyncio.wait(
+        {waiting, disconnected},
+        return_when=asyncio.FIRST_COMPLETED,
+    )
+    if not waiting.done():
+        waiting.cancel()
+        return None
+    return waiting.result()
+
+
+def format_event(event):
+    """Return an event in the Server-Sent Events format."""
+    data = {key: event[key] for key in ('changed', 'deleted')}
+    return (
+        f"id: {event['id']}\n"
+        f"event: {event['kind']}\n"
+        f"data: {json.dumps(data)}\n\n"
+    )
+
+
+async def stream(receive, send, subscription, disconnected):
+    """Send events as they come, with keepalives while idle."""
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-store'),
+            # Tells nginx not to buffer the stream.
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': f'retry: {RETRY_MS}\n\n'.encode(),
+        'more_body': True,
+    })
+    while True:
+        events = await wait_events(
+            subscription,
+            settings.TRAILDIG_EVENTS_KEEPALIVE,
+            disconnected,
+        )
+        if events is None:
+            return
+        body = ''.join(format_event(event) for event in events)
+        await send({
+            'type': 'http.response.body',
+            'body': (body or ': keepalive\n\n').encode(),
+            'more_body': True,
+        })
+
+
+async def long_poll(receive, send, subscription, disconnected):
+    """Answer the first events, or none once the poll times out."""
+    events = await wait_events(
+        subscription,
+        settings.TRAILDIG_EVENTS_LONG_POLL_TIMEOUT,
+        disconnected,
+    )
+    if events is None:
+        return
+    await respond(send, 200, {
+        'last_event_id': subscription.after,
+        'events': events,
+    })
+
+
+async def events_application(scope, receive, send):
+    """Serve the event stream and the long poll, see the module."""
+    if scope['method'] != 'GET':
+        await respond(send, 405, {
+            'detail': f"Method \"{scope['method']}\" not allowed.",
+        }, [(b'allow', b'GET')])
+        return
+
+    query = QueryDict(scope['query_string'])
+    unauthenticated = [(
+        b'www-authenticate',
+        CachedTokenAuthentication().authenticate_header(None).encode(),
+    )]
+    try:
+        user = await sync_to_async(authenticate)(scope['headers'], query)
+    except exceptions.AuthenticationFailed as exc:
+        await respond(send, 401, {'detail': exc.detail}, unauthenticated)
+        return
+    if user is None:
+        await respond(send, 401, {
+            'detail': str(exceptions.NotAuthenticated.default_detail),
+        }, unauthenticated)
+        return
+
+    params = serializers.EventParamsSerializer(data=query)
+    if not params.is_valid():
+        await respond(send, 400, params.errors)
+        return
+    data = params.validated_data
+    after = data.get('since')
+    if scope['path'] == EVENTS_PATH:
+        headers = dict(scope['headers'])
+        last_event_id = headers.get(b'last-event-id', b'')
+        if last_event_id.isdigit():
+            after = int(last_event_id)
+
+    hub = get_hub()
+    if scope['path'] == POLL_PATH and after is None:
+        await respond(send, 200, {
+            'last_event_id': await hub.get_latest_id(),
+            'events': [],
+        })
+        return
+
+    subscription = Subscription(
+        kinds=data.get('kinds', {changes.TRAILDIG, changes.TAG}),
+        user_id=user.pk if data['mine'] else None,
+        after=after,
+    )
+    await hub.subscribe(subscription)
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        if scope['path'] == EVENTS_PATH:
+            await stream(receive, send, subscription, disconnected)
+        else:
+            await long_poll(receive, send, subscription, disconnected)
+    finally:
+        hub.unsubscribe(subscription)
+        disconnected.cancel()
+
+
+def router(django_application):
+    """Return an ASGI application serving the events, Django the rest."""
+    async def application(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] in (
+            EVENTS_PATH,
+            POLL_PATH,
+        ):
+            await events_application(scope, receive, send)
+        else:
+            await django_application(scope, receive, send)
+
+    return application
@@ -0,0 +1,56 @@
+"""
+Streaming export of trail digs.
+
+Rows are read with a server side cursor where the database supports it
+and the tag names are fetched once per chunk, so memory use does not
+depend on the number of digs exported.
+"""
+from itertools import islice
+
+from core.aggregates import TrailDigTag
+from traildig.compiled import CompiledSerializer
+from traildig.serializers import TrailDigDetailSerializer
+
+EXPORT_FIELDS = [
+    'id',
+    'title',
+    'description',
+    'time_minutes',
+    'number_people',
+    'link',
+    'date_time',
+]
+
+
+def chunked(iterable, size):
+    """Yield lists of up to size items from iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def tag_names(traildig_ids):
+    """Return the sorted tag names of digs keyed by dig id."""
+    names = {}
+    links = TrailDigTag.objects.filter(
+        traildig_id__in=traildig_ids,
+    ).values_list('traildig_id', 'tag__name').order_by('tag__name')
+    for traildig_id, name in links:
+        names.setdefault(traildig_id, []).append(name)
+    return names
+
+
+def iter_export_rows(queryset, chunk_size):
+    """Yield the export representation of the digs of a queryset."""
+    compiled = CompiledSerializer(
+        TrailDigDetailSerializer(fields=EXPORT_FIELDS),
+    )
+    rows = compiled.values(queryset).iterator(chunk_size=chunk_size)
+    for chunk in chunked(rows, chunk_size):
+        names = tag_names([row['pk'] for row in chunk])
+        for row, item in zip(chunk, compiled.render(chunk)):
+            item['tags'] = names.get(row['pk'], [])
+            yield item
@@ -0,0 +1,80 @@
+"""
+Filters for the traildig APIs.
+"""
+from rest_framework.filters import (
+    BaseFilterBackend,
+    OrderingFilter,
+)
+
+from core import search
+from core.aggregates import TrailDigTag
+from traildig.serializers import (
+    OwnerFilterParamsSerializer,
+    TrailDigFilterParamsSerializer,
+)
+
+
+class StableOrderingFilter(OrderingFilter):
+    """Ordering filter that breaks ties on the primary key.
+
+    Cursor pagination keys pages on the first ordering field, so a unique
+    tie breaker keeps rows with the same value in a stable order.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        if (
+            self.ordering_param not in request.query_params
+            and request.query_params.get('search', '').strip()
+        ):
+            # Best matches first, see TrailDigFilter.
+            ordering = ['-search_rank']
+        else:
+            ordering = list(super().get_ordering(request, queryset, view))
+        if ordering and ordering[-1].lstrip('-') not in ('id', 'pk'):
+            direction = '-' if ordering[0].startswith('-') else ''
+            ordering.append(direction + 'id')
+        return ordering
+
+
+class OwnerFilter(BaseFilterBackend):
+    """Restrict the results to the requesting user's rows with ?mine=true."""
+    params_serializer_class = OwnerFilterParamsSerializer
+
+    def filter_queryset(self, request, queryset, view):
+        params = self.params_serializer_class(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return self.filter_params(queryset, request, params.validated_data)
+
+    def filter_params(self, queryset, request, params):
+        """Apply the validated query parameters to the queryset."""
+        if params['mine']:
+            queryset = queryset.filter(user=request.user)
+        return queryset
+
+
+class TrailDigFilter(OwnerFilter):
+    """Filter trail digs by owner, tags, date window, people and text.
+
+    ``tags`` is a comma separated list of tag ids, a dig matches when it
+    has any of them. ``search`` matches every word against the title and
+    description and annotates the digs with their `search_rank`.
+    """
+    params_serializer_class = TrailDigFilterParamsSerializer
+
+    def filter_params(self, queryset, request, params):
+        queryset = super().filter_params(queryset, request, params)
+        if 'tags' in params:
+            queryset = queryset.filter(id__in=TrailDigTag.objects.filter(
+                tag_id__in=params['tags'],
+            ).values('traildig_id'))
+        if 'date_from' in params:
+            queryset = queryset.filter(date_time__gte=params['date_from'])
+        if 'date_to' in params:
+            queryset = queryset.filter(date_time__lte=params['date_to'])
+        if 'min_people' in params:
+            queryset = queryset.filter(
+                number_people__gte=params['min_people'],
+            )
+        if params.get('search', '').strip():
+            queryset = search.search(queryset, params['search'])
+        return queryset
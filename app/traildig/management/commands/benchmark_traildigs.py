@@ -0,0 +1,114 @@
+"""
+Django command comparing the trail dig list serialization paths.
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+
+from rest_framework.renderers import JSONRenderer
+
+from core.models import (
+    TrailDig,
+    Tag,
+)
+from core.renderers import FastJSONRenderer
+from traildig import bulk
+from traildig.compiled import CompiledSerializer
+from traildig.serializers import TrailDigSerializer
+
+RELATED_ORDERING = {'tags': ['name']}
+
+
+class Command(BaseCommand):
+    """Django command to benchmark list serialization"""
+    help = (
+        'Serialize sample trail digs with the DRF serializer and with the '
+        'compiled list path, render them with the DRF and the fast JSON '
+        'renderers and report rows per second. The sample data is rolled '
+        'back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=1000,
+            help='Number of sample trail digs.',
+        )
+        parser.add_argument(
+            '--tags',
+            type=int,
+            default=3,
+            help='Number of tags on every sample trail dig.',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Number of runs per path, the best one is reported.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        with transaction.atomic():
+            queryset = self.create_sample(options['rows'], options['tags'])
+            for name, run in self.get_paths(queryset):
+                best = min(
+                    self.time_run(run) for _ in range(options['repeat'])
+                )
+                self.stdout.write(
+                    f'{name}: {options["rows"] / best:,.0f} rows/s '
+                    f'({best * 1000:.1f} ms)'
+                )
+            transaction.set_rollback(True)
+
+    def create_sample(self, rows, tags):
+        """Create the sample digs and return a queryset of them."""
+        user = get_user_model().objects.create_user(
+            email='benchmark@example.com',
+        )
+        tags = [
+            Tag.objects.create(user=user, name=f'Tag {i}')
+            for i in range(tags)
+        ]
+        bulk.create_traildigs([
+            {
+                'user': user,
+                'title': f'Benchmark dig {i}',
+                'description': 'Benchmark description',
+                'time_minutes': 60,
+                'number_people': 4,
+                'link': 'https://example.com/dig',
+                'tags': tags,
+            }
+            for i in range(rows)
+        ])
+        return TrailDig.objects.filter(user=user).order_by('-id')
+
+    def get_paths(self, queryset):
+        """Return the named serialization paths to compare."""
+        serializer = TrailDigSerializer()
+        compiled = CompiledSerializer(serializer, RELATED_ORDERING)
+        prefetched = queryset.prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.order_by(
+                *RELATED_ORDERING['tags'],
+            )),
+        )
+        data = compiled.render(compiled.values(queryset))
+        return [
+            ('serializer', lambda: TrailDigSerializer(
+                prefetched.all(), many=True,
+            ).data),
+            ('compiled', lambda: compiled.render(compiled.values(queryset))),
+            ('json renderer', lambda: JSONRenderer().render(data)),
+            ('fast json renderer', lambda: FastJSONRenderer().render(data)),
+        ]
+
+    def time_run(self, run):
+        """Return the duration of one run in seconds."""
+        start = time.perf_counter()
+        run()
+        return time.perf_counter() - start
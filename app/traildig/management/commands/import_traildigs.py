@@ -0,0 +1,221 @@
+"""
+Django command to import trail digs from a CSV or JSON lines file.
+"""
+import csv
+import json
+import os
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from core.models import ImportCheckpoint
+from traildig import bulk
+from traildig.export import chunked
+from traildig.serializers import (
+    TrailDigDetailSerializer,
+    lookup_tags,
+)
+
+BATCH_SIZE = 1000
+FORMATS = ['csv', 'jsonl']
+# Tag names separator in CSV files, as written by the export.
+CSV_TAG_SEPARATOR = ';'
+
+
+class Command(BaseCommand):
+    """Django command to import trail digs"""
+    help = (
+        'Import trail digs from a CSV or JSON lines file, such as the ones '
+        'written by the export. Rows are validated like API writes and '
+        'inserted in batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import.')
+        parser.add_argument(
+            '--user',
+            required=True,
+            help='Email of the user owning the digs and their tags.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='File format, guessed from the extension by default.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Number of rows validated and inserted together.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate the rows without writing anything.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help=(
+                'Name of a checkpoint, kept in the database with every '
+                'batch, recording the rows already imported. An interrupted '
+                'import run again with it resumes after them.'
+            ),
+        )
+        parser.add_argument(
+            '--rejects',
+            help='JSON lines file receiving the rejected rows and errors.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist.")
+        if options['batch_size'] < 1:
+            raise CommandError('The batch size must be positive.')
+
+        path = options['path']
+        file_format = options['format'] or self.guess_format(path)
+        checkpoint = options['checkpoint']
+        dry_run = options['dry_run']
+        counts = {'read': 0, 'imported': 0, 'rejected': 0}
+        if not dry_run:
+            counts.update(self.read_checkpoint(checkpoint, path))
+        skip = counts['read']
+
+        rejects = None
+        if options['rejects']:
+            rejects = open(options['rejects'], 'a' if skip else 'w')
+        try:
+            with open(path, newline='', encoding='utf-8') as source:
+                rows = islice(self.read_rows(source, file_format), skip, None)
+                for batch in chunked(rows, options['batch_size']):
+                    valid, invalid = self.validate(user, batch, counts)
+                    counts['read'] += len(batch)
+                    counts['imported'] += len(valid)
+                    counts['rejected'] += len(invalid)
+                    self.write_rejects(rejects, invalid)
+                    if not dry_run:
+                        # The checkpoint commits with the batch: a crash
+                        # leaves both or neither.
+                        with transaction.atomic():
+                            bulk.create_traildigs(valid)
+                            self.write_checkpoint(checkpoint, path, counts)
+                    self.stdout.write(
+                        f"{counts['read']} rows read, "
+                        f"{counts['imported']} imported, "
+                        f"{counts['rejected']} rejected."
+                    )
+        finally:
+            if rejects:
+                rejects.close()
+
+        verb = 'Validated' if dry_run else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {counts['imported']} trail dig(s), "
+            f"rejected {counts['rejected']}."
+        ))
+
+    def guess_format(self, path):
+        """Return the format of a file from its extension."""
+        extension = os.path.splitext(path)[1].lstrip('.').lower()
+        if extension in ('json', 'ndjson'):
+            return 'jsonl'
+        if extension not in FORMATS:
+            raise CommandError(
+                f'Cannot guess the format of {path}, use --format.'
+            )
+        return extension
+
+    def read_rows(self, source, file_format):
+        """Yield the dig payloads of a file, as the API expects them."""
+        if file_format == 'csv':
+            for row in csv.DictReader(source):
+                if row.get('date_time') == '':
+                    del row['date_time']
+                names = (row.pop('tags', None) or '').split(CSV_TAG_SEPARATOR)
+                row['tags'] = [name for name in names if name]
+                yield self.to_payload(row)
+        else:
+            for line in source:
+                if line.strip():
+                    try:
+                        yield self.to_payload(json.loads(line))
+                    except ValueError as exc:
+                        yield {'__error__': f'Invalid JSON: {exc}'}
+
+    def to_payload(self, row):
+        """Return a row with its tag names as the API expects them."""
+        if isinstance(row, dict) and isinstance(row.get('tags'), list):
+            row['tags'] = [
+                {'name': tag} if isinstance(tag, str) else tag
+                for tag in row['tags']
+            ]
+        return row
+
+    def validate(self, user, batch, counts):
+        """Return the valid dig values and the rejected rows of a batch."""
+        # One serializer validates the whole batch, building its fields
+        # once instead of once per row.
+        serializer = TrailDigDetailSerializer(context={
+            'user': user,
+            'tag_lookup': lookup_tags(user, batch),
+        })
+        valid = []
+        invalid = []
+        for number, row in enumerate(batch, start=counts['read'] + 1):
+            if not isinstance(row, dict) or '__error__' in row:
+                error = row.get('__error__') if isinstance(row, dict) \
+                    else 'Expected an object.'
+                invalid.append({'row': number, 'errors': [error]})
+                continue
+            try:
+                data = serializer.run_validation(row)
+            except ValidationError as exc:
+                invalid.append({
+                    'row': number,
+                    'data': row,
+                    'errors': exc.detail,
+                })
+            else:
+                valid.append(dict(data, user=user))
+        return valid, invalid
+
+    def write_rejects(self, rejects, invalid):
+        """Append the rejected rows to the rejects file."""
+        if rejects is None:
+            return
+        for reject in invalid:
+            rejects.write(json.dumps(reject, default=str) + '\n')
+        rejects.flush()
+
+    def read_checkpoint(self, checkpoint, path):
+        """Return the counts of a previous run of the import, if any."""
+        if not checkpoint:
+            return {}
+        state = ImportCheckpoint.objects.filter(name=checkpoint).first()
+        if state is None:
+            return {}
+        if state.path != os.path.abspath(path):
+            raise CommandError(
+                f'The checkpoint {checkpoint} is for another file.'
+            )
+        self.stdout.write(f"Resuming after row {state.read}.")
+        return {
+            'read': state.read,
+            'imported': state.imported,
+            'rejected': state.rejected,
+        }
+
+    def write_checkpoint(self, checkpoint, path, counts):
+        """Record the rows imported so far."""
+        if not checkpoint:
+            return
+        ImportCheckpoint.objects.update_or_create(
+            name=checkpoint,
+            defaults={'path': os.path.abspath(path), **counts},
+        )
@@ -0,0 +1,142 @@
+"""
+Django command to compute season reports from a trail dig snapshot.
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from traildig import reports
+
+REPORTS = ['summary', 'minutes', 'crews', 'tags']
+
+
+class Command(BaseCommand):
+    """Django command to report on trail digs"""
+    help = (
+        'Compute reports over a snapshot written by snapshot_traildigs, '
+        'without reading the database: totals, the distributions of the '
+        'dig durations and crew sizes and the work per tag and week.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Snapshot directory.')
+        parser.add_argument(
+            '--report',
+            choices=REPORTS,
+            action='append',
+            help='Report to compute, repeatable. All of them by default.',
+        )
+        parser.add_argument(
+            '--from',
+            dest='start',
+            help='First day of the digs reported, YYYY-MM-DD.',
+        )
+        parser.add_argument(
+            '--to',
+            dest='end',
+            help='Last day of the digs reported, YYYY-MM-DD.',
+        )
+        parser.add_argument(
+            '--percentiles',
+            default='50,90,99',
+            help='Comma separated percentiles of the distributions.',
+        )
+        parser.add_argument(
+            '--bins',
+            type=int,
+            default=10,
+            help='Number of bins of the duration histogram.',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Write the reports as one JSON object.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        if reports.np is None:
+            raise CommandError(
+                'Reports require numpy, see requirements.reports.txt.'
+            )
+        start = self.parse_day(options['start'])
+        end = self.parse_day(options['end'])
+        try:
+            percentiles = [
+                float(value) for value in options['percentiles'].split(',')
+            ]
+        except ValueError:
+            raise CommandError('Percentiles must be numbers.')
+        if not all(0 <= value <= 100 for value in percentiles):
+            raise CommandError('Percentiles must be between 0 and 100.')
+        if options['bins'] < 1:
+            raise CommandError('The number of bins must be positive.')
+
+        try:
+            snapshot = reports.Snapshot(options['path'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        rows = reports.select(snapshot, start, end)
+
+        results = {}
+        for name in options['report'] or REPORTS:
+            if name == 'summary':
+                results[name] = reports.summary_report(snapshot, rows)
+            elif name == 'minutes':
+                results[name] = reports.time_minutes_report(
+                    snapshot,
+                    rows,
+                    percentiles,
+                    options['bins'],
+                )
+            elif name == 'crews':
+                results[name] = reports.crew_size_report(
+                    snapshot,
+                    rows,
+                    percentiles,
+                )
+            else:
+                results[name] = reports.tag_week_report(snapshot, rows)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+        else:
+            for name, result in results.items():
+                self.write_report(name, result)
+
+    def parse_day(self, value):
+        """Return the date of a YYYY-MM-DD option, None if not given."""
+        if value is None:
+            return None
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise CommandError(f'Invalid date {value}.')
+        return day
+
+    def write_report(self, name, result):
+        """Write a report as text."""
+        self.stdout.write(self.style.SUCCESS(f'{name}:'))
+        if name == 'tags':
+            for row in result:
+                self.stdout.write(
+                    f"  {row['tag']}  {row['week']}  {row['digs']} dig(s)  "
+                    f"{row['time_minutes']} min  "
+                    f"{row['person_minutes']} person-min"
+                )
+            return
+        for key, value in result.items():
+            if key == 'histogram':
+                for item in value:
+                    self.stdout.write(
+                        f"  {item['low']:g}-{item['high']:g}: "
+                        f"{item['count']}"
+                    )
+            elif isinstance(value, dict):
+                for inner_key, inner_value in value.items():
+                    self.stdout.write(f'  {key} {inner_key:g}: {inner_value}')
+            else:
+                self.stdout.write(f'  {key}: {value}')
@@ -0,0 +1,51 @@
+"""
+Django command to write a columnar snapshot of the trail digs.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from traildig import snapshot
+
+
+class Command(BaseCommand):
+    """Django command to snapshot trail digs"""
+    help = (
+        'Write the trail digs and their tags as memory-mappable NumPy '
+        'columns to a directory, for report_traildigs. An existing '
+        'snapshot there is replaced once the new one is complete.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Snapshot directory.')
+        parser.add_argument(
+            '--database',
+            default='default',
+            help='Database alias to read from, e.g. a replica.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=snapshot.CHUNK_SIZE,
+            help='Number of rows read per query.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        if snapshot.np is None:
+            raise CommandError(
+                'Snapshots require numpy, see requirements.reports.txt.'
+            )
+        if options['database'] not in connections:
+            raise CommandError(f"Unknown database {options['database']}.")
+        if options['chunk_size'] < 1:
+            raise CommandError('The chunk size must be positive.')
+
+        meta = snapshot.write(
+            options['path'],
+            using=options['database'],
+            chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {meta['digs']} trail dig(s), {meta['tags']} tag(s) and "
+            f"{meta['memberships']} tag membership(s) to {options['path']}."
+        ))
@@ -0,0 +1,14 @@
+"""
+Pagination for the traildig APIs.
+"""
+from django.conf import settings
+
+from rest_framework.pagination import CursorPagination
+
+
+class TrailDigCursorPagination(CursorPagination):
+    """Keyset pagination of trail digs using opaque cursors."""
+    ordering = '-id'
+    page_size = settings.TRAILDIG_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.TRAILDIG_MAX_PAGE_SIZE
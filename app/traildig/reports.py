@@ -0,0 +1,203 @@
+"""
+Season reports over the columnar snapshots of traildig.snapshot.
+
+Every report takes an open `Snapshot` and a selection of dig rows, see
+`select`, and is computed with whole-column NumPy operations over the
+memory-mapped files: filters are boolean masks, grouped sums sort the
+group keys once and add with ``np.add.reduceat`` in int64, so they stay
+exact, and percentiles come from ``np.percentile``.
+
+Tags are grouped by name, as in the per-tag leaderboards: every user
+has their own tags, the reports add up the tags sharing a name.
+"""
+import json
+import os
+
+from traildig import snapshot
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+SECONDS_PER_DAY = 86400
+
+
+class Snapshot:
+    """A snapshot directory, its columns mapped in memory on first use."""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(os.path.join(path, 'meta.json')) as source:
+                self.meta = json.load(source)
+        except (OSError, ValueError):
+            raise ValueError(f'{path} is not a trail dig snapshot.')
+        if self.meta.get('version') != snapshot.FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported snapshot version {self.meta.get('version')}."
+            )
+        self._columns = {}
+        self._tag_names = None
+
+    def __len__(self):
+        return self.meta['digs']
+
+    def column(self, name):
+        """Return a column, mapped read only."""
+        if name not in self._columns:
+            self._columns[name] = np.load(
+                snapshot.column_path(self.path, name),
+                mmap_mode='r',
+            )
+        return self._columns[name]
+
+    @property
+    def tag_names(self):
+        """Return the names of the tags, by tag row."""
+        if self._tag_names is None:
+            with open(os.path.join(self.path, 'tags.json')) as source:
+                self._tag_names = json.load(source)
+        return self._tag_names
+
+    def person_minutes(self, rows):
+        """Return time_minutes * number_people of the selected digs."""
+        return (
+            self.column('time_minutes')[rows].astype('int64')
+            * self.column('number_people')[rows]
+        )
+
+
+def select(snapshot, start=None, end=None):
+    """Return the mask of the digs from the date start to the date end."""
+    dates = snapshot.column('date_time')
+    rows = np.ones(len(dates), dtype=bool)
+    if start is not None:
+        rows &= dates >= np.datetime64(start, 's')
+    if end is not None:
+        rows &= dates < np.datetime64(end, 's') + SECONDS_PER_DAY
+    return rows
+
+
+def grouped_sums(keys, *values):
+    """Return the distinct keys, their row counts and sums of values."""
+    order = np.argsort(keys, kind='stable')
+    distinct, starts, counts = np.unique(
+        keys[order],
+        return_index=True,
+        return_counts=True,
+    )
+    if not len(keys):
+        return (distinct, counts) + tuple(
+            np.zeros(0, dtype='int64') for _ in values
+        )
+    return (distinct, counts) + tuple(
+        np.add.reduceat(np.asarray(column, dtype='int64')[order], starts)
+        for column in values
+    )
+
+
+def distribution(values, percentiles):
+    """Return the count, total, mean and percentiles of values."""
+    if not len(values):
+        return {'count': 0, 'total': 0, 'mean': None, 'percentiles': {}}
+    return {
+        'count': int(len(values)),
+        'total': int(values.sum(dtype='int64')),
+        'mean': float(values.mean()),
+        'percentiles': {
+            percentile: float(value)
+            for percentile, value in zip(
+                percentiles,
+                np.percentile(values, percentiles),
+            )
+        },
+    }
+
+
+def histogram(values, bins):
+    """Return the counts of values in equal width bins between extremes."""
+    if not len(values):
+        return []
+    counts, edges = np.histogram(values, bins=bins)
+    return [
+        {'low': float(low), 'high': float(high), 'count': int(count)}
+        for low, high, count in zip(edges[:-1], edges[1:], counts)
+    ]
+
+
+def summary_report(snapshot, rows):
+    """Return the dig and volunteer counts, total work and date range."""
+    dates = snapshot.column('date_time')[rows]
+    return {
+        'digs': int(rows.sum()),
+        'volunteers': len(np.unique(snapshot.column('user_id')[rows])),
+        'time_minutes': int(
+            snapshot.column('time_minutes')[rows].sum(dtype='int64')
+        ),
+        'person_minutes': int(snapshot.person_minutes(rows).sum()),
+        'first': str(dates.min()) if len(dates) else None,
+        'last': str(dates.max()) if len(dates) else None,
+    }
+
+
+def time_minutes_report(snapshot, rows, percentiles, bins):
+    """Return the distribution of the dig durations."""
+    minutes = snapshot.column('time_minutes')[rows]
+    return dict(
+        distribution(minutes, percentiles),
+        histogram=histogram(minutes, bins),
+    )
+
+
+def crew_size_report(snapshot, rows, percentiles):
+    """Return the distribution and the dig count per crew size."""
+    people = snapshot.column('number_people')[rows]
+    sizes, counts = np.unique(people, return_counts=True)
+    return dict(
+        distribution(people, percentiles),
+        sizes={int(size): int(count) for size, count in zip(sizes, counts)},
+    )
+
+
+def week_starts(dates):
+    """Return the Monday starting the week of every date, in days."""
+    days = dates.astype('datetime64[D]').astype('int64')
+    # 1970-01-01, day 0, was a Thursday.
+    return days - (days + 3) % 7
+
+
+def tag_week_report(snapshot, rows):
+    """Return the work per tag name and week, ordered by both."""
+    dig = np.asarray(snapshot.column('membership_dig'))
+    tag = np.asarray(snapshot.column('membership_tag'))
+    kept = rows[dig]
+    dig, tag = dig[kept], tag[kept]
+    if not len(dig):
+        return []
+
+    names, name_rows = np.unique(
+        np.array(snapshot.tag_names, dtype=str),
+        return_inverse=True,
+    )
+    weeks = week_starts(snapshot.column('date_time')[dig])
+    first = weeks.min()
+    week_count = (weeks.max() - first) // 7 + 1
+    keys = name_rows[tag].astype('int64') * week_count + (weeks - first) // 7
+
+    distinct, counts, minutes, person_minutes = grouped_sums(
+        keys,
+        snapshot.column('time_minutes')[dig],
+        snapshot.person_minutes(dig),
+    )
+    return [
+        {
+            'tag': str(names[key // week_count]),
+            'week': str(np.datetime64(int(first + key % week_count * 7), 'D')),
+            'digs': int(count),
+            'time_minutes': int(total),
+            'person_minutes': int(person_total),
+        }
+        for key, count, total, person_total
+        in zip(distinct, counts, minutes, person_minutes)
+    ]
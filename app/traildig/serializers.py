@@ -1,40 +1,225 @@
 """
 Serializers for traildig APIs
 """
-from django.db import models
+from django.conf import settings
 
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
 
+from core import changes
 from core.models import (
     TrailDig,
     Tag,
 )
+from traildig import bulk
 
 
-class TagSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Serializer mixin rendering only the fields named by `fields`."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class TagSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for tag."""
-    amount_work_done_minutes = serializers.SerializerMethodField()
-    # amount_work_done_per_year = serializers.SerializerMethodField()
+    amount_work_done_minutes = serializers.IntegerField(
+        source='work_done_minutes',
+        read_only=True,
+    )
 
     class Meta:
         model = Tag
         fields = ['id', 'name', 'amount_work_done_minutes']
-        # , 'amount_work_done_per_year']
         read_only_fields = ['id']
 
-    def get_amount_work_done_minutes(self, obj):
-        return TrailDig.objects.filter(tags=obj).aggregate(
-            total=models.Sum('time_minutes'))['total'] or 0
+    def validate_name(self, value):
+        """Ensure a renamed tag does not collide with another one."""
+        if self.instance is not None and Tag.objects.filter(
+            user_id=self.instance.user_id,
+            name=value,
+        ).exclude(id=self.instance.id).exists():
+            raise ValidationError(f"Tag {value} already exists.")
+        return value
+
+
+class TagSeriesParamsSerializer(serializers.Serializer):
+    """Serializer for the tag series query parameters."""
+    start = serializers.RegexField(r'^\d{4}(-\d{2})?$', required=False)
+    end = serializers.RegexField(r'^\d{4}(-\d{2})?$', required=False)
+    period = serializers.ChoiceField(
+        choices=['month', 'year'],
+        default='month',
+    )
+
+    def _to_month(self, value, last):
+        """Convert YYYY or YYYY-MM into a (year, month) tuple."""
+        if '-' not in value:
+            return int(value), 12 if last else 1
+        year, month = (int(part) for part in value.split('-'))
+        if not 1 <= month <= 12:
+            raise ValidationError(f"Invalid month in {value}.")
+        return year, month
+
+    def validate_start(self, value):
+        return self._to_month(value, last=False)
+
+    def validate_end(self, value):
+        return self._to_month(value, last=True)
+
+    def validate(self, data):
+        """Ensure the range is not reversed."""
+        if data.get('start', (0, 0)) > data.get('end', (9999, 12)):
+            raise ValidationError("start must not be after end.")
+        return data
+
+
+class TagSeriesSerializer(serializers.Serializer):
+    """Serializer for the work done on a tag during one period."""
+    year = serializers.IntegerField()
+    month = serializers.IntegerField(required=False)
+    time_minutes = serializers.IntegerField(source='total_minutes')
+    person_minutes = serializers.IntegerField(source='total_person_minutes')
+
+
+class LeaderboardParamsSerializer(serializers.Serializer):
+    """Serializer for the leaderboard query parameters."""
+    tag = serializers.CharField(max_length=255, required=False)
+    size = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.TRAILDIG_MAX_PAGE_SIZE,
+        default=settings.TRAILDIG_LEADERBOARD_SIZE,
+    )
+
+
+class LeaderboardRankParamsSerializer(serializers.Serializer):
+    """Serializer for the leaderboard rank query parameters."""
+    tag = serializers.CharField(max_length=255, required=False)
+    user = serializers.IntegerField(min_value=1, required=False)
+
+
+class LeaderboardEntrySerializer(serializers.Serializer):
+    """Serializer for the rank of a volunteer on a leaderboard."""
+    rank = serializers.IntegerField(allow_null=True)
+    user = serializers.IntegerField()
+    name = serializers.CharField(required=False)
+    person_minutes = serializers.IntegerField()
+
+
+class OwnerFilterParamsSerializer(serializers.Serializer):
+    """Serializer for the owner scoping query parameter."""
+    mine = serializers.BooleanField(default=False)
+
+
+class ChangeFeedParamsSerializer(OwnerFilterParamsSerializer):
+    """Serializer for the change feed query parameters."""
+    since = serializers.CharField(required=False)
+    page_size = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.TRAILDIG_MAX_PAGE_SIZE,
+        default=settings.TRAILDIG_PAGE_SIZE,
+    )
 
-    # def get_amount_work_done_per_year(self, obj):
-    #    current_year = timezone.now().year
-    #    return TrailDig.objects.filter(tags=obj,
-    #        created__year=current_year).aggregate(
-    #        total=models.Sum('time_minutes'))['total'] or 0
+    def validate_since(self, value):
+        """Convert the cursor into a (change id, synced at) tuple."""
+        try:
+            return changes.decode_cursor(value)
+        except ValueError as exc:
+            raise ValidationError(str(exc))
 
 
-class TrailDigSerializer(serializers.ModelSerializer):
+class EventParamsSerializer(OwnerFilterParamsSerializer):
+    """Serializer for the change notification query parameters."""
+    kinds = serializers.RegexField(
+        r'^(traildig|tag)(,(traildig|tag))*$',
+        required=False,
+    )
+    since = serializers.IntegerField(min_value=0, required=False)
+
+    def validate_kinds(self, value):
+        """Convert comma separated kinds into a set."""
+        return set(value.split(','))
+
+
+class TrailDigFilterParamsSerializer(OwnerFilterParamsSerializer):
+    """Serializer for the trail dig list query parameters."""
+    tags = serializers.RegexField(r'^\d+(,\d+)*$', required=False)
+    date_from = serializers.DateTimeField(required=False)
+    date_to = serializers.DateTimeField(required=False)
+    min_people = serializers.IntegerField(min_value=0, required=False)
+    search = serializers.CharField(
+        max_length=255,
+        required=False,
+        allow_blank=True,
+    )
+
+    def validate_tags(self, value):
+        """Convert comma separated ids into a list."""
+        return [int(tag_id) for tag_id in value.split(',')]
+
+    def validate(self, data):
+        """Ensure the date window is not reversed."""
+        if (
+            'date_from' in data and 'date_to' in data
+            and data['date_from'] > data['date_to']
+        ):
+            raise ValidationError("date_from must not be after date_to.")
+        return data
+
+
+def context_user(context):
+    """Return the user a serializer writes for.
+
+    That is the requesting user, or the context's `user` outside of
+    requests, e.g. for imports.
+    """
+    if 'user' in context:
+        return context['user']
+    return context['request'].user
+
+
+def lookup_tags(user, data):
+    """Return the user's tags referenced by any dig payload, by name."""
+    names = {
+        tag['name']
+        for item in data if isinstance(item, dict)
+        for tag in item.get('tags') or [] if isinstance(tag, dict)
+        and isinstance(tag.get('name'), str)
+    }
+    tags = Tag.objects.filter(user=user, name__in=names)
+    return {tag.name: tag for tag in tags}
+
+
+class TrailDigListSerializer(serializers.ListSerializer):
+    """Serializer for creating many trail digs at once."""
+
+    def to_internal_value(self, data):
+        """Resolve the tags of every item with a single query."""
+        if isinstance(data, list):
+            if len(data) > settings.TRAILDIG_BULK_MAX_ITEMS:
+                raise ValidationError({
+                    api_settings.NON_FIELD_ERRORS_KEY: [
+                        f"Ensure there are at most "
+                        f"{settings.TRAILDIG_BULK_MAX_ITEMS} trail digs."
+                    ],
+                })
+            self.context['tag_lookup'] = lookup_tags(
+                context_user(self.context),
+                data,
+            )
+
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        """Create the trail digs in bulk."""
+        return bulk.create_traildigs(validated_data)
+
+
+class TrailDigSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for trail digs."""
     tags = TagSerializer(many=True, required=False)
 
@@ -50,25 +235,26 @@ class TrailDigSerializer(serializers.ModelSerializer):
             'date_time'
         ]
         read_only_fields = ['id']
+        list_serializer_class = TrailDigListSerializer
 
-    def _get_tags(self, tags, traildig):
-        """Handle getting tags."""
-        auth_user = self.context['request'].user
-        for tag in tags:
-            try:
-                tag_obj = Tag.objects.get(
-                    user=auth_user,
-                    **tag,
-                )
-                traildig.tags.add(tag_obj)
-            except Tag.DoesNotExist:
-                raise ValidationError(f"Tag {tag['name']} does not exist.")
+    def _lookup_tags(self, names):
+        """Return the requesting user's tags among names, by name."""
+        lookup = self.context.get('tag_lookup')
+        if lookup is None:
+            tags = Tag.objects.filter(
+                user=context_user(self.context),
+                name__in=names,
+            )
+            lookup = {tag.name: tag for tag in tags}
+        return lookup
 
     def create(self, validated_data):
         """Create a traildig"""
         tags = validated_data.pop('tags', [])
         traildig = TrailDig.objects.create(**validated_data)
-        self._get_tags(tags, traildig)
+        if tags:
+            bulk.save_tags(tags)
+            traildig.tags.add(*tags)
 
         return traildig
 
@@ -76,8 +262,9 @@ class TrailDigSerializer(serializers.ModelSerializer):
         """Update a traildig"""
         tags = validated_data.pop('tags', None)
         if tags is not None:
-            instance.tags.clear()
-            self._get_tags(tags, instance)
+            bulk.save_tags(tags)
+            # Only the links that changed are written.
+            instance.tags.set(tags)
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
@@ -87,12 +274,22 @@ class TrailDigSerializer(serializers.ModelSerializer):
 
     def validate(self, data):
         """Custom validations."""
-        tags = data.get('tags', [])
-        for tag in tags:
-            try:
-                Tag.objects.get(name=tag['name'])
-            except Tag.DoesNotExist:
-                raise ValidationError(f"Tag {tag['name']} does not exist.")
+        tags = data.get('tags')
+        if tags is not None:
+            lookup = self._lookup_tags({tag['name'] for tag in tags})
+            for tag in tags:
+                if tag['name'] in lookup:
+                    continue
+                if not settings.TRAILDIG_AUTO_CREATE_TAGS:
+                    raise ValidationError(
+                        f"Tag {tag['name']} does not exist."
+                    )
+                # Saved with the dig, see bulk.save_tags.
+                lookup[tag['name']] = Tag(
+                    user=context_user(self.context),
+                    name=tag['name'],
+                )
+            data['tags'] = [lookup[tag['name']] for tag in tags]
 
         return data
 
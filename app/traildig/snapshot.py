@@ -0,0 +1,229 @@
+"""
+Columnar snapshots of the trail digs for offline reports.
+
+A snapshot is a directory of NumPy ``.npy`` files, one per column, that
+traildig.reports reads memory-mapped: reports never touch the database
+and only page in the columns they use.
+
+- Digs, ordered by id: ``id``, ``user_id``, ``time_minutes``,
+  ``number_people`` and ``date_time`` (UTC, to the second).
+- Tags, ordered by id: ``tag_id``, ``tag_user_id``, with their names in
+  ``tags.json``.
+- Tag memberships: ``membership_dig`` and ``membership_tag``, the rows of
+  the dig and of the tag in the columns above.
+
+``meta.json`` holds the format version, when the snapshot was taken and
+the row counts. ``manage.py snapshot_traildigs`` writes the columns in
+chunks of consecutive ids, inside one read only transaction that is
+REPEATABLE READ on PostgreSQL so the columns agree with each other, to
+a temporary directory moved into place once complete. Point it at a
+replica with ``--database``.
+
+NumPy is not a web requirement but an optional one, see
+requirements.reports.txt: only the snapshot and report commands import
+this module and traildig.reports.
+"""
+import json
+import os
+import shutil
+import tempfile
+
+from django.db import (
+    connections,
+    transaction,
+)
+from django.utils import timezone
+
+from core.aggregates import TrailDigTag
+from core.models import (
+    TrailDig,
+    Tag,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+FORMAT_VERSION = 1
+
+# Rows read per query.
+CHUNK_SIZE = 50000
+
+DIG_COLUMNS = {
+    'id': 'int64',
+    'user_id': 'int64',
+    'time_minutes': 'int32',
+    'number_people': 'int32',
+    'date_time': 'datetime64[s]',
+}
+TAG_COLUMNS = {
+    'tag_id': 'int64',
+    'tag_user_id': 'int64',
+}
+MEMBERSHIP_COLUMNS = {
+    'membership_dig': 'int32',
+    'membership_tag': 'int32',
+}
+
+
+def column_path(path, name):
+    """Return the file of a column in a snapshot directory."""
+    return os.path.join(path, f'{name}.npy')
+
+
+def _open_columns(path, columns, count):
+    """Create the files of columns with count rows, return them mapped."""
+    return {
+        name: np.lib.format.open_memmap(
+            column_path(path, name),
+            mode='w+',
+            dtype=dtype,
+            shape=(count,),
+        )
+        for name, dtype in columns.items()
+    }
+
+
+def _close_columns(arrays):
+    """Flush mapped columns to disk."""
+    for array in arrays.values():
+        if array.size:
+            array.flush()
+
+
+def _utc(value):
+    """Return a dig date as a naive UTC datetime."""
+    if timezone.is_aware(value):
+        value = timezone.make_naive(value, timezone.utc)
+    return value
+
+
+def _iter_chunks(queryset, fields, chunk_size):
+    """Yield lists of value tuples of a queryset, in chunks of ids."""
+    last = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last).order_by('pk').values_list(
+            'pk', *fields,
+        )[:chunk_size])
+        if not rows:
+            return
+        last = rows[-1][0]
+        yield rows
+
+
+def _write_digs(path, using, chunk_size):
+    """Write the dig columns, return the sorted dig ids."""
+    digs = TrailDig.objects.using(using)
+    arrays = _open_columns(path, DIG_COLUMNS, digs.count())
+    start = 0
+    fields = ('user_id', 'time_minutes', 'number_people', 'date_time')
+    for rows in _iter_chunks(digs, fields, chunk_size):
+        end = start + len(rows)
+        ids, user_ids, minutes, people, dates = zip(*rows)
+        arrays['id'][start:end] = ids
+        arrays['user_id'][start:end] = user_ids
+        arrays['time_minutes'][start:end] = minutes
+        arrays['number_people'][start:end] = people
+        arrays['date_time'][start:end] = np.array(
+            [_utc(value) for value in dates],
+            dtype='datetime64[s]',
+        )
+        start = end
+    _close_columns(arrays)
+    return np.asarray(arrays['id'][:start])
+
+
+def _write_tags(path, using):
+    """Write the tag columns and names, return the sorted tag ids."""
+    rows = list(Tag.objects.using(using).order_by('pk').values_list(
+        'pk', 'user_id', 'name',
+    ))
+    arrays = _open_columns(path, TAG_COLUMNS, len(rows))
+    if rows:
+        ids, user_ids, names = zip(*rows)
+        arrays['tag_id'][:] = ids
+        arrays['tag_user_id'][:] = user_ids
+    else:
+        names = ()
+    _close_columns(arrays)
+    with open(os.path.join(path, 'tags.json'), 'w') as target:
+        json.dump(list(names), target)
+    return np.asarray(arrays['tag_id'])
+
+
+def _write_memberships(path, using, dig_ids, tag_ids, chunk_size):
+    """Write the membership columns, return their count."""
+    links = TrailDigTag.objects.using(using)
+    arrays = _open_columns(path, MEMBERSHIP_COLUMNS, links.count())
+    start = 0
+    fields = ('traildig_id', 'tag_id')
+    for rows in _iter_chunks(links, fields, chunk_size):
+        end = start + len(rows)
+        _, traildig_id, tag_id = (np.array(column) for column in zip(*rows))
+        arrays['membership_dig'][start:end] = np.searchsorted(
+            dig_ids,
+            traildig_id,
+        )
+        arrays['membership_tag'][start:end] = np.searchsorted(
+            tag_ids,
+            tag_id,
+        )
+        start = end
+    _close_columns(arrays)
+    return start
+
+
+def _begin_snapshot(using):
+    """Make the current transaction a consistent read only snapshot."""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY'
+            )
+
+
+def write(path, using='default', chunk_size=CHUNK_SIZE):
+    """Write a snapshot of every dig to the directory path.
+
+    Replaces the snapshot already there, returns the meta data.
+    """
+    path = os.path.abspath(path)
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    work = tempfile.mkdtemp(prefix='.snapshot-', dir=parent)
+    try:
+        taken_at = timezone.now()
+        with transaction.atomic(using=using):
+            _begin_snapshot(using)
+            dig_ids = _write_digs(work, using, chunk_size)
+            tag_ids = _write_tags(work, using)
+            memberships = _write_memberships(
+                work,
+                using,
+                dig_ids,
+                tag_ids,
+                chunk_size,
+            )
+        meta = {
+            'version': FORMAT_VERSION,
+            'taken_at': _utc(taken_at).isoformat(),
+            'digs': len(dig_ids),
+            'tags': len(tag_ids),
+            'memberships': memberships,
+        }
+        with open(os.path.join(work, 'meta.json'), 'w') as target:
+            json.dump(meta, target)
+
+        if os.path.exists(path):
+            old = tempfile.mkdtemp(prefix='.snapshot-old-', dir=parent)
+            os.rename(path, os.path.join(old, 'snapshot'))
+            os.rename(work, path)
+            shutil.rmtree(old)
+        else:
+            os.rename(work, path)
+    except BaseException:
+        shutil.rmtree(work, ignore_errors=True)
+        raise
+    return meta
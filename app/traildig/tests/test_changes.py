@@ -0,0 +1,304 @@
+"""
+Tests for the trail dig and tag change feeds.
+"""
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import (
+    MagicMock,
+    patch,
+)
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import changes
+from core.models import (
+    Change,
+    TrailDig,
+    Tag,
+)
+from traildig import bulk
+
+TRAILDIG_CHANGES_URL = reverse('traildig:traildig-changes')
+TAG_CHANGES_URL = reverse('traildig:tag-changes')
+
+
+def create_traildig(user, **params):
+    """Create and return a sample dig."""
+    defaults = {
+        'title': 'Sample dig title',
+        'time_minutes': 22,
+        'number_people': 10,
+    }
+    defaults.update(params)
+    return TrailDig.objects.create(user=user, **defaults)
+
+
+class ChangeFeedTests(TestCase):
+    """Test reading the changes since a cursor."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sync(self, url=TRAILDIG_CHANGES_URL, cursor=None, **params):
+        """Read every page of a feed, return the results and deletions."""
+        results, deleted = {}, []
+        while True:
+            if cursor is not None:
+                params['since'] = cursor
+            res = self.client.get(url, params)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            for item in res.data['results']:
+                results[item['id']] = item
+            deleted.extend(res.data['deleted'])
+            cursor = res.data['cursor']
+            if not res.data['more']:
+                return results, deleted, cursor
+
+    def test_initial_sync(self):
+        """Test the feed starts with every dig."""
+        digs = [create_traildig(self.user) for _ in range(5)]
+
+        results, deleted, _ = self.sync(page_size=2)
+
+        self.assertEqual(set(results), {dig.id for dig in digs})
+        self.assertEqual(deleted, [])
+        self.assertIn('description', results[digs[0].id])
+
+    def test_only_changes_since_cursor(self):
+        """Test a cursor returns only what changed after it."""
+        kept = create_traildig(self.user)
+        edited = create_traildig(self.user)
+        _, _, cursor = self.sync()
+
+        edited.title = 'Edited'
+        edited.save()
+        edited.save()
+        new = create_traildig(self.user)
+
+        results, deleted, cursor = self.sync(cursor=cursor)
+
+        self.assertEqual(list(results), [edited.id, new.id])
+        self.assertEqual(results[edited.id]['title'], 'Edited')
+        self.assertNotIn(kept.id, results)
+        self.assertEqual(self.sync(cursor=cursor)[:2], ({}, []))
+
+    def test_deletion_tombstones(self):
+        """Test deleted digs are listed until the client saw them."""
+        dig = create_traildig(self.user)
+        _, _, cursor = self.sync()
+
+        res = self.client.delete(
+            reverse('traildig:traildig-detail', args=[dig.id]),
+        )
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        results, deleted, _ = self.sync(cursor=cursor)
+
+        self.assertEqual(results, {})
+        self.assertEqual(deleted, [dig.id])
+
+    def test_user_deletion_cascades(self):
+        """Test the objects of a deleted user get tombstones."""
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        dig = create_traildig(other)
+        tag = Tag.objects.create(user=other, name='SDM')
+        dig.tags.add(tag)
+        _, _, dig_cursor = self.sync()
+        _, _, tag_cursor = self.sync(TAG_CHANGES_URL)
+
+        other.delete()
+
+        self.assertEqual(
+            self.sync(cursor=dig_cursor)[:2],
+            ({}, [dig.id]),
+        )
+        self.assertEqual(
+            self.sync(TAG_CHANGES_URL, cursor=tag_cursor)[:2],
+            ({}, [tag.id]),
+        )
+
+    def test_tags_changes(self):
+        """Test tagging changes the digs and the tag totals."""
+        dig = create_traildig(self.user)
+        other = create_traildig(self.user)
+        tag = Tag.objects.create(user=self.user, name='SDM')
+        _, _, dig_cursor = self.sync()
+        _, _, tag_cursor = self.sync(TAG_CHANGES_URL)
+
+        dig.tags.add(tag)
+        tags, _, tag_cursor = self.sync(TAG_CHANGES_URL, cursor=tag_cursor)
+        digs, _, dig_cursor = self.sync(cursor=dig_cursor)
+
+        self.assertEqual(tags[tag.id]['amount_work_done_minutes'], 22)
+        self.assertEqual(list(digs), [dig.id])
+        self.assertNotIn(other.id, digs)
+
+        tag.name = 'MSA'
+        tag.save()
+        digs, _, dig_cursor = self.sync(cursor=dig_cursor)
+        self.assertEqual(digs[dig.id]['tags'][0]['name'], 'MSA')
+
+        tag_id = tag.id
+        tag.delete()
+        digs, _, _ = self.sync(cursor=dig_cursor)
+        self.assertEqual(digs[dig.id]['tags'], [])
+        self.assertEqual(
+            self.sync(TAG_CHANGES_URL, cursor=tag_cursor)[1],
+            [tag_id],
+        )
+
+    def test_bulk_create_recorded(self):
+        """Test digs and tags created in bulk are in the feeds."""
+        _, _, cursor = self.sync()
+        digs = bulk.create_traildigs([
+            {
+                'user': self.user,
+                'title': f'Dig {i}',
+                'time_minutes': 10,
+                'number_people': 1,
+                'tags': [Tag(user=self.user, name='New')],
+            }
+            for i in range(3)
+        ])
+
+        results, _, _ = self.sync(cursor=cursor)
+        tags, _, _ = self.sync(TAG_CHANGES_URL)
+
+        self.assertEqual(set(results), {dig.id for dig in digs})
+        self.assertEqual(
+            [tag['name'] for tag in tags.values()],
+            ['New'],
+        )
+
+    def test_mine(self):
+        """Test ?mine=true follows the requesting user's digs only."""
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        mine = create_traildig(self.user)
+        create_traildig(other)
+
+        results, _, _ = self.sync(mine='true')
+
+        self.assertEqual(list(results), [mine.id])
+
+    def test_reads_only_changes(self):
+        """Test the feed does not read rows that did not change."""
+        for _ in range(20):
+            create_traildig(self.user)
+        _, _, cursor = self.sync()
+        create_traildig(self.user)
+
+        # PostgreSQL reads the visibility bound first.
+        queries = 5 if connection.vendor == 'postgresql' else 3
+        with self.assertNumQueries(queries):
+            res = self.client.get(TRAILDIG_CHANGES_URL, {'since': cursor})
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_changes_of_writers_in_progress_held_back(self):
+        """Test the feed stops below changes that may be uncommitted."""
+        digs = [create_traildig(self.user) for _ in range(3)]
+        bound = Change.objects.get(object_id=digs[1].id).id
+
+        with patch('core.changes.visible_bound', return_value=bound):
+            results, _, cursor = self.sync()
+        self.assertEqual(list(results), [digs[0].id])
+
+        results, _, _ = self.sync(cursor=cursor)
+        self.assertEqual(list(results), [digs[1].id, digs[2].id])
+
+    def test_visible_bound(self):
+        """Test the bound is the lowest in flight id or the next one."""
+        self.assertIsNone(changes.visible_bound())
+
+        for values, expected in [
+            ([(None,), (None,)], 1),
+            ([(40,), (None,)], 41),
+            ([(40,), (12,)], 12),
+        ]:
+            postgres = MagicMock(vendor='postgresql')
+            cursor = postgres.cursor.return_value.__enter__.return_value
+            cursor.fetchone.side_effect = values
+            with patch('core.changes.connection', postgres):
+                self.assertEqual(changes.visible_bound(), expected)
+
+    def test_write_records_dig_once(self):
+        """Test a dig update records one change for the dig."""
+        dig = create_traildig(self.user)
+        tag = Tag.objects.create(user=self.user, name='MSA')
+        dig.tags.add(Tag.objects.create(user=self.user, name='SDM'))
+
+        with patch('core.changes.record', wraps=changes.record) as record:
+            res = self.client.put(
+                reverse('traildig:traildig-detail', args=[dig.id]),
+                {
+                    'title': 'Edited',
+                    'time_minutes': 30,
+                    'number_people': 2,
+                    'tags': [{'name': tag.name}],
+                },
+                format='json',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recorded = [
+            call for call in record.call_args_list
+            if call.args[0] == changes.TRAILDIG
+        ]
+        self.assertEqual(len(recorded), 1)
+        self.assertEqual(list(recorded[0].args[1]), [(dig.id, self.user.id)])
+
+    def test_invalid_cursor(self):
+        """Test malformed cursors are rejected."""
+        for cursor in ['nope', changes.encode_cursor(-1, timezone.now())]:
+            res = self.client.get(TRAILDIG_CHANGES_URL, {'since': cursor})
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expired_cursor(self):
+        """Test cursors older than the tombstones are refused."""
+        cursor = changes.encode_cursor(
+            0,
+            timezone.now() - timedelta(days=31),
+        )
+
+        res = self.client.get(TRAILDIG_CHANGES_URL, {'since': cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+
+    def test_prune(self):
+        """Test the command deletes old tombstones only."""
+        old = create_traildig(self.user)
+        recent = create_traildig(self.user)
+        kept = create_traildig(self.user)
+        old_id, recent_id = old.id, recent.id
+        old.delete()
+        recent.delete()
+        Change.objects.filter(object_id=old_id).update(
+            changed_at=timezone.now() - timedelta(days=31),
+        )
+        out = StringIO()
+
+        call_command('prune_changes', stdout=out)
+
+        self.assertEqual(
+            set(Change.objects.values_list('object_id', flat=True)),
+            {recent_id, kept.id},
+        )
+        self.assertIn('Pruned 1 tombstone(s).', out.getvalue())
@@ -0,0 +1,193 @@
+"""
+Tests for the traildig management commands.
+"""
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import aggregates
+from core.models import (
+    ImportCheckpoint,
+    TrailDig,
+    Tag,
+)
+from traildig import bulk
+
+CSV_ROWS = '''title,description,time_minutes,number_people,link,date_time,tags
+Drainage,"Ditches, drains",60,3,,2024-10-25T10:00:00,SDM;MSA
+Bad people,,60,many,,,
+Offset,,60,3,,2024-10-25T10:00:00+02:00,
+Unknown tag,,60,3,,,Nope
+Jumps,,30,2,https://example.com,,
+'''
+
+
+class ImportTrailDigsTests(TestCase):
+    """Test importing trail digs from files."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.sdm = Tag.objects.create(user=self.user, name='SDM')
+        self.msa = Tag.objects.create(user=self.user, name='MSA')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as target:
+            target.write(content)
+        return path
+
+    def run_import(self, path, **options):
+        out = StringIO()
+        call_command(
+            'import_traildigs', path, user='user@example.com', stdout=out,
+            **options,
+        )
+        return out.getvalue()
+
+    def test_import_csv(self):
+        """Test valid rows are imported and invalid ones rejected."""
+        path = self.write('digs.csv', CSV_ROWS)
+        rejects = os.path.join(self.tmp.name, 'rejects.jsonl')
+
+        out = self.run_import(path, batch_size=2, rejects=rejects)
+
+        self.assertIn('Imported 3 trail dig(s), rejected 2.', out)
+        self.assertIn('4 rows read, 2 imported, 2 rejected.', out)
+        dig = TrailDig.objects.get(title='Drainage')
+        self.assertEqual(dig.user, self.user)
+        self.assertEqual(dig.description, 'Ditches, drains')
+        self.assertEqual(set(dig.tags.all()), {self.sdm, self.msa})
+        self.assertTrue(TrailDig.objects.filter(title='Jumps').exists())
+        # Like the API, offsets are converted to the naive local time.
+        self.assertEqual(
+            TrailDig.objects.get(title='Offset').date_time.isoformat(),
+            '2024-10-25T08:00:00',
+        )
+        self.sdm.refresh_from_db()
+        self.assertEqual(self.sdm.work_done_minutes, 60)
+        self.assertFalse(aggregates.stale_tags().exists())
+
+        with open(rejects) as source:
+            rejected = [json.loads(line) for line in source]
+        self.assertEqual([reject['row'] for reject in rejected], [2, 4])
+        self.assertIn('number_people', rejected[0]['errors'])
+        self.assertIn('Nope', str(rejected[1]['errors']))
+
+    @override_settings(TRAILDIG_AUTO_CREATE_TAGS=True)
+    def test_import_jsonl_creating_tags(self):
+        """Test JSON lines import, creating missing tags once."""
+        path = self.write('digs.jsonl', '\n'.join([
+            json.dumps({
+                'title': f'Dig {i}',
+                'time_minutes': 30,
+                'number_people': 2,
+                'tags': ['SDM', 'New'],
+            })
+            for i in range(3)
+        ] + ['not json', '']))
+
+        out = self.run_import(path, batch_size=2)
+
+        self.assertIn('Imported 3 trail dig(s), rejected 1.', out)
+        tag = Tag.objects.get(user=self.user, name='New')
+        self.assertEqual(tag.traildig_set.count(), 3)
+
+    def test_dry_run(self):
+        """Test a dry run validates without writing."""
+        path = self.write('digs.csv', CSV_ROWS)
+
+        out = self.run_import(path, dry_run=True, checkpoint='digs')
+
+        self.assertIn('Validated 3 trail dig(s), rejected 2.', out)
+        self.assertFalse(TrailDig.objects.exists())
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_resume_from_checkpoint(self):
+        """Test an import resumes after the rows already imported."""
+        path = self.write('digs.csv', CSV_ROWS)
+        self.run_import(path, batch_size=2, checkpoint='digs')
+        self.assertEqual(ImportCheckpoint.objects.get(name='digs').read, 5)
+
+        ImportCheckpoint.objects.filter(name='digs').update(
+            read=4, imported=2, rejected=2,
+        )
+        TrailDig.objects.filter(title='Jumps').delete()
+        out = self.run_import(path, checkpoint='digs')
+
+        self.assertIn('Resuming after row 4.', out)
+        self.assertIn('Imported 3 trail dig(s), rejected 2.', out)
+        self.assertEqual(TrailDig.objects.count(), 3)
+
+    def test_checkpoint_commits_with_batch(self):
+        """Test a failed batch leaves the checkpoint at the batch before."""
+        path = self.write('digs.csv', CSV_ROWS)
+        create_traildigs = bulk.create_traildigs
+        calls = []
+
+        def fail_second_batch(items):
+            calls.append(items)
+            created = create_traildigs(items)
+            if len(calls) == 2:
+                raise RuntimeError('Crashed')
+            return created
+
+        with patch.object(bulk, 'create_traildigs', fail_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path, batch_size=2, checkpoint='digs')
+
+        self.assertEqual(ImportCheckpoint.objects.get(name='digs').read, 2)
+        self.assertEqual(TrailDig.objects.count(), 1)
+
+        out = self.run_import(path, batch_size=2, checkpoint='digs')
+
+        self.assertIn('Resuming after row 2.', out)
+        self.assertIn('Imported 3 trail dig(s), rejected 2.', out)
+        self.assertEqual(TrailDig.objects.count(), 3)
+
+    def test_checkpoint_of_other_file(self):
+        """Test a checkpoint is not used for another file."""
+        path = self.write('digs.csv', CSV_ROWS)
+        ImportCheckpoint.objects.create(
+            name='digs', path='/elsewhere.csv', read=1,
+        )
+
+        with self.assertRaises(CommandError):
+            self.run_import(path, checkpoint='digs')
+
+    def test_import_export_round_trip(self):
+        """Test a CSV export imports back as the same digs."""
+        path = self.write('digs.csv', CSV_ROWS)
+        self.run_import(path)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        res = client.get(reverse('traildig:traildig-export'), {
+            'format': 'csv',
+        })
+        exported = b''.join(res.streaming_content).decode()
+        TrailDig.objects.all().delete()
+
+        self.run_import(self.write('export.csv', exported))
+
+        res = client.get(reverse('traildig:traildig-export'), {
+            'format': 'csv',
+        })
+        reexported = b''.join(res.streaming_content).decode()
+        self.assertCountEqual(
+            [line.split(',', 1)[1] for line in reexported.splitlines()],
+            [line.split(',', 1)[1] for line in exported.splitlines()],
+        )
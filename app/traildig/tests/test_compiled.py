@@ -0,0 +1,125 @@
+"""
+Tests for the compiled list serialization.
+"""
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import (
+    serializers,
+    status,
+)
+from rest_framework.test import APIClient
+
+from core.models import (
+    TrailDig,
+    Tag,
+)
+from traildig.compiled import compile_serializer
+from traildig.serializers import TrailDigSerializer
+from traildig.views import (
+    TagViewSet,
+    TrailDigViewSet,
+)
+
+TRAILDIGS_URL = reverse('traildig:traildig-list')
+TAGS_URL = reverse('traildig:tag-list')
+
+
+class CompiledListParityTests(TestCase):
+    """Test the compiled list output is identical to the serializers'."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        other_user = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        self.tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ['Zèbre', 'MSA', 'Chomeuse', 'SDM']
+        ]
+        other_tag = Tag.objects.create(user=other_user, name='Other')
+
+        for i in range(7):
+            dig = TrailDig.objects.create(
+                user=other_user if i % 3 == 0 else self.user,
+                title=f'Drainage «{i}»   "quoted"',
+                description='Ditches' if i % 2 else '',
+                time_minutes=15 * i,
+                number_people=i,
+                link='' if i % 2 else f'https://example.com/{i}',
+                date_time=f'2024-10-{i + 1:02d} 10:00:00.{i:06d}',
+            )
+            dig.tags.add(*self.tags[:i % 4])
+            if i % 3 == 0:
+                dig.tags.add(other_tag)
+
+    def assertSameContent(self, view_class, url, params=None):
+        """Check both serialization paths return the same bytes."""
+        compiled = self.client.get(url, params)
+        with patch.object(view_class, 'compiled_list', False):
+            serialized = self.client.get(url, params)
+
+        self.assertEqual(compiled.status_code, status.HTTP_200_OK)
+        self.assertEqual(compiled.content, serialized.content)
+        return compiled
+
+    def test_traildig_list(self):
+        """Test the dig list with various parameters."""
+        for params in [
+            {},
+            {'fields': 'id,title,date_time'},
+            {'fields': 'tags'},
+            {'mine': 'true', 'tags': f'{self.tags[0].id},{self.tags[1].id}'},
+            {'search': 'drainage'},
+            {'ordering': 'date_time', 'page_size': 2},
+        ]:
+            with self.subTest(params=params):
+                self.assertSameContent(TrailDigViewSet, TRAILDIGS_URL, params)
+
+    def test_traildig_list_next_pages(self):
+        """Test the pages after the first one."""
+        res = self.assertSameContent(
+            TrailDigViewSet, TRAILDIGS_URL, {'page_size': 3},
+        )
+        while res.data['next']:
+            res = self.assertSameContent(TrailDigViewSet, res.data['next'])
+
+    def test_tag_list(self):
+        """Test the tag list."""
+        for params in [{}, {'mine': 'true'}, {'fields': 'name'}]:
+            with self.subTest(params=params):
+                self.assertSameContent(TagViewSet, TAGS_URL, params)
+
+    def test_unsupported_fields_fall_back(self):
+        """Test a serializer with computed fields is not compiled."""
+        class ComputedSerializer(TrailDigSerializer):
+            user_email = serializers.EmailField(source='user.email')
+
+            class Meta(TrailDigSerializer.Meta):
+                fields = ['id', 'user_email']
+
+        self.assertIsNone(compile_serializer(ComputedSerializer()))
+
+
+class BenchmarkCommandTests(TestCase):
+    """Test the serialization benchmark command."""
+
+    def test_benchmark_leaves_no_rows(self):
+        """Test the benchmark reports rates and rolls back its data."""
+        out = StringIO()
+        call_command('benchmark_traildigs', rows=20, repeat=1, stdout=out)
+
+        self.assertIn('rows/s', out.getvalue())
+        self.assertFalse(TrailDig.objects.exists())
+        self.assertFalse(get_user_model().objects.exists())
@@ -0,0 +1,287 @@
+"""
+Tests for the change notifications served under ASGI.
+"""
+import asyncio
+import json
+
+from asgiref.sync import (
+    async_to_sync,
+    sync_to_async,
+)
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth import get_user_model
+from django.test import (
+    TestCase,
+    override_settings,
+)
+
+from rest_framework.authtoken.models import Token
+
+from core import changes
+from core.models import (
+    TrailDig,
+    Tag,
+)
+from traildig import events
+from user import access_tokens
+
+
+def create_traildig(user, **params):
+    """Create and return a sample dig."""
+    defaults = {
+        'title': 'Sample dig title',
+        'time_minutes': 22,
+        'number_people': 10,
+    }
+    defaults.update(params)
+    return TrailDig.objects.create(user=user, **defaults)
+
+
+def parse_events(body):
+    """Return the (id, event, data) of the events in a stream chunk."""
+    parsed = []
+    for block in body.decode().split('\n\n'):
+        fields = dict(
+            line.split(': ', 1) for line in block.splitlines()
+            if not line.startswith(':') and ': ' in line
+        )
+        if 'event' in fields:
+            parsed.append((
+                int(fields['id']),
+                fields['event'],
+                json.loads(fields['data']),
+            ))
+    return parsed
+
+
+@override_settings(
+    TRAILDIG_EVENTS_POLL_INTERVAL=0.02,
+    TRAILDIG_EVENTS_KEEPALIVE=0.2,
+    TRAILDIG_EVENTS_LONG_POLL_TIMEOUT=0.2,
+)
+class EventsTests(TestCase):
+    """Test the event stream and the long poll."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.token = Token.objects.create(user=self.user)
+
+    def scope(self, path=events.EVENTS_PATH, query='', headers=None):
+        """Return the ASGI scope of an authenticated GET."""
+        return {
+            'type': 'http',
+            'method': 'GET',
+            'path': path,
+            'query_string': query.encode(),
+            'headers': [
+                (b'authorization', f'Token {self.token.key}'.encode()),
+                *(headers or []),
+            ],
+        }
+
+    async def open(self, scope):
+        """Start a request, return its communicator and response start."""
+        communicator = ApplicationCommunicator(
+            events.events_application,
+            scope,
+        )
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output(1)
+        return communicator, start
+
+    async def read_json(self, communicator):
+        """Return the JSON body of a response."""
+        body = await communicator.receive_output(1)
+        return json.loads(body['body'])
+
+    async def close(self, communicator):
+        """Disconnect and wait for the hub to stop."""
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(1)
+        while events.get_hub().task is not None:
+            await asyncio.sleep(0.01)
+
+    async def next_events(self, communicator):
+        """Return the events of the next chunk carrying some."""
+        while True:
+            body = await communicator.receive_output(1)
+            parsed = parse_events(body['body'])
+            if parsed:
+                return parsed
+
+    def test_auth_required(self):
+        """Test anonymous and invalid credentials are rejected."""
+        async def check():
+            scope = self.scope()
+            scope['headers'] = []
+            _, start = await self.open(scope)
+            self.assertEqual(start['status'], 401)
+
+            scope['headers'] = [(b'authorization', b'Token nope')]
+            _, start = await self.open(scope)
+            self.assertEqual(start['status'], 401)
+
+        async_to_sync(check)()
+
+    def test_stream(self):
+        """Test writes are pushed to the event stream."""
+        async def check():
+            communicator, start = await self.open(self.scope())
+            self.assertEqual(start['status'], 200)
+            self.assertIn(
+                (b'content-type', b'text/event-stream'),
+                start['headers'],
+            )
+            retry = await communicator.receive_output(1)
+            self.assertTrue(retry['body'].startswith(b'retry:'))
+
+            dig = await sync_to_async(create_traildig)(self.user)
+            [(_, kind, data)] = await self.next_events(communicator)
+            self.assertEqual(kind, 'traildig')
+            self.assertEqual(data, {'changed': [dig.id], 'deleted': []})
+
+            dig_id = dig.id
+            await sync_to_async(dig.delete)()
+            [(_, kind, data)] = await self.next_events(communicator)
+            self.assertEqual(data, {'changed': [], 'deleted': [dig_id]})
+
+            await self.close(communicator)
+
+        async_to_sync(check)()
+
+    def test_filters(self):
+        """Test ?kinds= and ?mine= narrow the events."""
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+
+        async def check():
+            communicator, _ = await self.open(
+                self.scope(query='kinds=tag&mine=true'),
+            )
+            await communicator.receive_output(1)
+
+            await sync_to_async(create_traildig)(self.user)
+            await sync_to_async(Tag.objects.create)(user=other, name='SDM')
+            tag = await sync_to_async(Tag.objects.create)(
+                user=self.user,
+                name='MSA',
+            )
+
+            [(_, kind, data)] = await self.next_events(communicator)
+            self.assertEqual(kind, 'tag')
+            self.assertEqual(data['changed'], [tag.id])
+
+            await self.close(communicator)
+
+        async_to_sync(check)()
+
+    def test_resume_after_last_event_id(self):
+        """Test a reconnecting stream gets the changes it missed."""
+        latest = changes.latest_id()
+        dig = create_traildig(self.user)
+
+        async def check():
+            communicator, _ = await self.open(self.scope(headers=[
+                (b'last-event-id', str(latest).encode()),
+            ]))
+
+            [(event_id, _, data)] = await self.next_events(communicator)
+            self.assertEqual(data['changed'], [dig.id])
+            self.assertEqual(
+                event_id,
+                await sync_to_async(changes.latest_id)(),
+            )
+
+            await self.close(communicator)
+
+        async_to_sync(check)()
+
+    def test_keepalive(self):
+        """Test idle streams get comments."""
+        async def check():
+            communicator, _ = await self.open(self.scope())
+            await communicator.receive_output(1)
+
+            body = await communicator.receive_output(1)
+
+            self.assertEqual(body['body'], b': keepalive\n\n')
+            await self.close(communicator)
+
+        async_to_sync(check)()
+
+    def test_long_poll(self):
+        """Test the long poll answers with the changes past since."""
+        async def check():
+            communicator, start = await self.open(
+                self.scope(events.POLL_PATH),
+            )
+            self.assertEqual(start['status'], 200)
+            started = await self.read_json(communicator)
+            self.assertEqual(started['events'], [])
+
+            dig = await sync_to_async(create_traildig)(self.user)
+            communicator, _ = await self.open(self.scope(
+                events.POLL_PATH,
+                f"since={started['last_event_id']}",
+            ))
+            res = await self.read_json(communicator)
+            self.assertEqual(res['events'][0]['changed'], [dig.id])
+
+            communicator, _ = await self.open(self.scope(
+                events.POLL_PATH,
+                f"since={res['last_event_id']}",
+            ))
+            res = await self.read_json(communicator)
+            self.assertEqual(res['events'], [])
+            await communicator.wait(1)
+            while events.get_hub().task is not None:
+                await asyncio.sleep(0.01)
+
+        async_to_sync(check)()
+
+    def test_access_token_in_query(self):
+        """Test EventSource clients authenticate with ?access_token=."""
+        token, _ = access_tokens.issue(self.user)
+
+        async def check():
+            scope = self.scope(
+                events.POLL_PATH,
+                f'access_token={token}',
+            )
+            scope['headers'] = []
+            communicator, start = await self.open(scope)
+            self.assertEqual(start['status'], 200)
+            await self.read_json(communicator)
+
+        async_to_sync(check)()
+
+    def test_invalid_params(self):
+        """Test invalid parameters are rejected."""
+        async def check():
+            _, start = await self.open(self.scope(query='kinds=recipe'))
+            self.assertEqual(start['status'], 400)
+
+        async_to_sync(check)()
+
+    def test_router(self):
+        """Test only the event paths are served outside Django."""
+        served = []
+
+        async def django_application(scope, receive, send):
+            served.append(scope['path'])
+
+        async def check():
+            application = events.router(django_application)
+            await application(
+                {'type': 'http', 'path': '/api/traildig/traildigs/'},
+                None,
+                None,
+            )
+
+        async_to_sync(check)()
+        self.assertEqual(served, ['/api/traildig/traildigs/'])
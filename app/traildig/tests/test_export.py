@@ -0,0 +1,135 @@
+"""
+Tests for the trail dig export.
+"""
+import csv
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    TrailDig,
+    Tag,
+)
+
+EXPORT_URL = reverse('traildig:traildig-export')
+
+
+class TrailDigExportTests(TestCase):
+    """Test streaming the trail digs out."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        other_user = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        self.tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ['SDM', 'MSA']
+        ]
+        self.digs = []
+        for i in range(5):
+            dig = TrailDig.objects.create(
+                user=other_user if i == 4 else self.user,
+                title=f'Drainage, part "{i}"',
+                description='Ditches\nand drains' if i % 2 else '',
+                time_minutes=30,
+                number_people=i,
+                date_time=f'2024-10-{i + 1:02d} 10:00:00',
+            )
+            dig.tags.add(*self.tags[:i % 3])
+            self.digs.append(dig)
+
+    def export(self, params):
+        """Return the streamed response and its body."""
+        res = self.client.get(EXPORT_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        return res, b''.join(res.streaming_content)
+
+    def test_export_ndjson(self):
+        """Test the export streams one JSON object per line."""
+        res, body = self.export({'format': 'ndjson'})
+
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [
+            dig.id for dig in reversed(self.digs)
+        ])
+        self.assertEqual(rows[-1], {
+            'id': self.digs[0].id,
+            'title': 'Drainage, part "0"',
+            'description': '',
+            'time_minutes': 30,
+            'number_people': 0,
+            'link': '',
+            'date_time': '2024-10-01T10:00:00',
+            'tags': [],
+        })
+        self.assertEqual(rows[2]['tags'], ['MSA', 'SDM'])
+
+    def test_export_csv(self):
+        """Test the export streams CSV with tag names."""
+        res, body = self.export({'format': 'csv'})
+
+        self.assertEqual(res['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('traildigs.csv', res['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1]['description'], 'Ditches\nand drains')
+        self.assertEqual(rows[2]['tags'], 'MSA;SDM')
+        self.assertEqual(rows[2]['title'], 'Drainage, part "2"')
+
+    def test_export_honours_filters(self):
+        """Test the export applies the list filters and ordering."""
+        _, body = self.export({
+            'format': 'ndjson',
+            'mine': 'true',
+            'tags': self.tags[1].id,
+            'ordering': 'date_time',
+        })
+
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.digs[2].id])
+
+    def test_export_search(self):
+        """Test the export of search results."""
+        _, body = self.export({'format': 'ndjson', 'search': 'ditches'})
+
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertCountEqual(
+            [row['id'] for row in rows],
+            [self.digs[1].id, self.digs[3].id],
+        )
+
+    def test_export_queries_per_chunk(self):
+        """Test tags are read once per chunk, not once per dig."""
+        with override_settings(TRAILDIG_EXPORT_CHUNK_SIZE=2), \
+                CaptureQueriesContext(connection) as queries:
+            _, body = self.export({'format': 'ndjson'})
+
+        self.assertEqual(len(body.splitlines()), 5)
+        tag_queries = [
+            query for query in queries.captured_queries
+            if 'core_tag' in query['sql']
+        ]
+        self.assertEqual(len(tag_queries), 3)
+
+    def test_invalid_filters(self):
+        """Test invalid filters are reported before streaming."""
+        res = self.client.get(EXPORT_URL, {'format': 'csv', 'tags': 'x'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,86 @@
+"""
+Tests for the indexes backing the trail dig filters.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.models import (
+    TrailDig,
+    Tag,
+)
+from traildig.filters import (
+    StableOrderingFilter,
+    TrailDigFilter,
+)
+from traildig.views import TrailDigViewSet
+
+
+class TrailDigFilterIndexTests(TestCase):
+    """Test the filtered dig queries are served by indexes."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.tag = Tag.objects.create(user=self.user, name='SDM')
+        for i in range(20):
+            dig = TrailDig.objects.create(
+                user=self.user,
+                title=f'Dig {i}',
+                description='Drainage' if i % 2 else 'Jumps',
+                time_minutes=30,
+                number_people=i,
+            )
+            dig.tags.add(self.tag)
+
+        if connection.vendor == 'postgresql':
+            # The tables are tiny, make sure the planner does not prefer
+            # reading them whole.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan TO off')
+
+    def plan(self, params):
+        """Return the query plan of the dig list for query parameters."""
+        request = Request(APIRequestFactory().get('/', params))
+        request.user = self.user
+        view = TrailDigViewSet(request=request, action='list')
+        queryset = TrailDigViewSet.queryset.order_by('-id')
+        for backend in [TrailDigFilter, StableOrderingFilter]:
+            queryset = backend().filter_queryset(request, queryset, view)
+        return queryset.explain()
+
+    def test_mine_uses_user_id_index(self):
+        """Test listing own digs newest first reads the (user, id) index."""
+        plan = self.plan({'mine': 'true'})
+
+        self.assertIn('traildig_user_id_idx', plan)
+
+    def test_date_window_uses_user_date_index(self):
+        """Test a date window on own digs reads the (user, date) index."""
+        plan = self.plan({
+            'mine': 'true',
+            'date_from': '2024-01-01T00:00:00',
+            'ordering': 'date_time',
+        })
+
+        self.assertIn('traildig_user_date_idx', plan)
+
+    def test_tags_use_tag_dig_index(self):
+        """Test filtering on tags reads the (tag, dig) through index."""
+        plan = self.plan({'tags': str(self.tag.id)})
+
+        self.assertIn('core_traildig_tags_tag_dig_idx', plan)
+
+    def test_search_uses_search_index(self):
+        """Test searching reads the full text index."""
+        plan = self.plan({'search': 'drainage'})
+
+        if connection.vendor == 'postgresql':
+            self.assertIn('core_traildig_search_idx', plan)
+        else:
+            self.assertIn('core_traildig_fts VIRTUAL TABLE INDEX', plan)
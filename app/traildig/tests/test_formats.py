@@ -0,0 +1,130 @@
+"""
+Tests for the compact response formats.
+"""
+import json
+from unittest import skipIf
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    TrailDig,
+    Tag,
+)
+from core.renderers import msgpack
+from traildig import client
+
+TRAILDIGS_URL = reverse('traildig:traildig-list')
+TAGS_URL = reverse('traildig:tag-list')
+BULK_URL = reverse('traildig:traildig-bulk')
+
+
+class ResponseFormatTests(TestCase):
+    """Test the columnar and MessagePack formats round trip."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ['SDM', 'MSA']
+        ]
+        for i in range(5):
+            dig = TrailDig.objects.create(
+                user=self.user,
+                title=f'Drainage {i}',
+                time_minutes=30,
+                number_people=i,
+                date_time=f'2024-10-{i + 1:02d} 10:00:00',
+            )
+            dig.tags.add(*tags[:i % 3])
+        self.dig = dig
+
+    def get(self, url, media_type, params=None):
+        """Return the decoded response and its size in the format."""
+        res = self.client.get(url, params, HTTP_ACCEPT=media_type)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'].split(';')[0], media_type)
+        return client.decode(res.content, res['Content-Type']), \
+            len(res.content)
+
+    def assertRoundTrips(self, url, media_type, params=None):
+        """Check a format decodes to the JSON data and is smaller."""
+        expected, json_size = self.get(url, client.JSON_MEDIA_TYPE, params)
+        data, size = self.get(url, media_type, params)
+
+        self.assertEqual(data, expected)
+        return size, json_size
+
+    def test_columnar_lists(self):
+        """Test columnar lists decode to the JSON lists."""
+        size, json_size = self.assertRoundTrips(
+            TRAILDIGS_URL, client.COLUMNAR_MEDIA_TYPE, {'page_size': 2},
+        )
+        self.assertLess(size, json_size)
+        self.assertRoundTrips(TAGS_URL, client.COLUMNAR_MEDIA_TYPE)
+
+    def test_columnar_layout(self):
+        """Test field names are sent once with a list per column."""
+        res = self.client.get(TAGS_URL, {'format': 'columnar'})
+
+        self.assertEqual(json.loads(res.content), {
+            'columns': ['id', 'name', 'amount_work_done_minutes'],
+            'values': [
+                [tag.id for tag in Tag.objects.order_by('-name')],
+                ['SDM', 'MSA'],
+                [90, 30],
+            ],
+        })
+
+    def test_columnar_detail_is_plain(self):
+        """Test non list responses keep the JSON layout."""
+        url = reverse('traildig:traildig-detail', args=[self.dig.id])
+
+        self.assertRoundTrips(url, client.COLUMNAR_MEDIA_TYPE)
+        res = self.client.get(url, {'format': 'columnar'})
+        self.assertEqual(json.loads(res.content)['id'], self.dig.id)
+
+    def test_columnar_errors_are_plain(self):
+        """Test error bodies keep the JSON layout, lists included."""
+        res = self.client.post(BULK_URL, [
+            {'title': 'Valid dig', 'time_minutes': 30, 'number_people': 2},
+            {'title': 'Invalid dig'},
+        ], format='json', HTTP_ACCEPT=client.COLUMNAR_MEDIA_TYPE)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            res['Content-Type'].split(';')[0],
+            client.COLUMNAR_MEDIA_TYPE,
+        )
+        errors = json.loads(res.content)
+        self.assertIsInstance(errors, list)
+        self.assertEqual(errors[0], {})
+        self.assertIn('time_minutes', errors[1])
+
+    @skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        """Test MessagePack responses decode to the JSON data."""
+        size, json_size = self.assertRoundTrips(
+            TRAILDIGS_URL, client.MSGPACK_MEDIA_TYPE,
+        )
+        self.assertLess(size, json_size)
+        self.assertRoundTrips(TAGS_URL, client.MSGPACK_MEDIA_TYPE)
+        self.assertRoundTrips(
+            reverse('traildig:traildig-detail', args=[self.dig.id]),
+            client.MSGPACK_MEDIA_TYPE,
+        )
+
+    def test_json_is_the_default(self):
+        """Test clients not asking for a format get JSON."""
+        res = self.client.get(TRAILDIGS_URL)
+
+        self.assertEqual(res['Content-Type'], 'application/json')
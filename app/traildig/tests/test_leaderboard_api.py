@@ -0,0 +1,129 @@
+"""
+Tests for the leaderboard API.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    TrailDig,
+    Tag,
+)
+
+LEADERBOARD_URL = reverse('traildig:leaderboard-list')
+RANK_URL = reverse('traildig:leaderboard-rank')
+
+
+def create_user(email, name=''):
+    """Create and return a new user"""
+    return get_user_model().objects.create_user(
+        email=email,
+        password='testpass123',
+        name=name,
+    )
+
+
+def create_traildig(user, tags=(), **params):
+    """Create and return a sample dig."""
+    defaults = {
+        'title': 'Sample dig title',
+        'time_minutes': 60,
+        'number_people': 1,
+    }
+    defaults.update(params)
+    traildig = TrailDig.objects.create(user=user, **defaults)
+    traildig.tags.add(*tags)
+    return traildig
+
+
+class PublicLeaderboardApiTests(TestCase):
+    """Test unauthenticated API requests."""
+
+    def test_auth_required(self):
+        """Test auth is required to read the leaderboards."""
+        res = APIClient().get(LEADERBOARD_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateLeaderboardApiTests(TestCase):
+    """Test authenticated API requests."""
+
+    def setUp(self):
+        self.user = create_user('user@example.com', 'Ada')
+        self.second = create_user('second@example.com', 'Bea')
+        self.third = create_user('third@example.com', 'Cid')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        create_traildig(self.user, number_people=2)
+        create_traildig(
+            self.second,
+            [Tag.objects.create(user=self.second, name='SDM')],
+            number_people=3,
+        )
+        create_traildig(
+            self.third,
+            [Tag.objects.create(user=self.third, name='SDM')],
+            number_people=2,
+        )
+        create_user('idle@example.com')
+
+    def test_top(self):
+        """Test the top volunteers are ranked by person-minutes."""
+        res = self.client.get(LEADERBOARD_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'rank': 1, 'user': self.second.id, 'name': 'Bea',
+             'person_minutes': 180},
+            {'rank': 2, 'user': self.user.id, 'name': 'Ada',
+             'person_minutes': 120},
+            {'rank': 2, 'user': self.third.id, 'name': 'Cid',
+             'person_minutes': 120},
+        ])
+
+    def test_top_of_tag(self):
+        """Test ?tag= ranks the digs with a tag name only."""
+        res = self.client.get(LEADERBOARD_URL, {'tag': 'SDM', 'size': 1})
+
+        self.assertEqual(
+            [(item['rank'], item['user']) for item in res.data],
+            [(1, self.second.id)],
+        )
+
+    def test_rank(self):
+        """Test the rank of the requesting or of another volunteer."""
+        res = self.client.get(RANK_URL)
+        self.assertEqual(res.data, {
+            'rank': 2,
+            'user': self.user.id,
+            'person_minutes': 120,
+        })
+
+        res = self.client.get(RANK_URL, {'user': self.third.id, 'tag': 'SDM'})
+        self.assertEqual(res.data['rank'], 2)
+
+        res = self.client.get(RANK_URL, {'tag': 'SDM'})
+        self.assertEqual(res.data['rank'], None)
+        self.assertEqual(res.data['person_minutes'], 0)
+
+    def test_edits_move_ranks(self):
+        """Test a write shows in the next read."""
+        create_traildig(self.user, time_minutes=90)
+
+        res = self.client.get(RANK_URL)
+
+        self.assertEqual(res.data['rank'], 1)
+        self.assertEqual(res.data['person_minutes'], 210)
+
+    def test_invalid_params(self):
+        """Test invalid parameters are rejected."""
+        res = self.client.get(LEADERBOARD_URL, {'size': 0})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(RANK_URL, {'user': 'me'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,273 @@
+"""
+Tests for the response cache of the trail dig and tag reads.
+"""
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import (
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import (
+    response_cache,
+    singleflight,
+)
+from core.models import (
+    TrailDig,
+    Tag,
+)
+from traildig.views import TrailDigViewSet
+
+TRAILDIGS_URL = reverse('traildig:traildig-list')
+TAGS_URL = reverse('traildig:tag-list')
+
+
+def detail_url(traildig_id):
+    """Create and return trail dig detail URL."""
+    return reverse('traildig:traildig-detail', args=[traildig_id])
+
+
+def create_user(email='user@example.com', **params):
+    """Create and return a new user."""
+    return get_user_model().objects.create_user(
+        email=email, password='testpass123', **params,
+    )
+
+
+def create_traildig(user, **params):
+    """Create and return a sample dig."""
+    defaults = {
+        'title': 'Sample dig title',
+        'time_minutes': 22,
+        'number_people': 10,
+    }
+    defaults.update(params)
+    return TrailDig.objects.create(user=user, **defaults)
+
+
+class ResponseCacheTests(TestCase):
+    """Test reads are served from the cache until a write."""
+
+    def setUp(self):
+        cache.clear()
+        response_cache.stats.reset()
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='SDM')
+        self.traildig = create_traildig(self.user)
+        self.traildig.tags.add(self.tag)
+
+    def assertCached(self, url, params=None):
+        """Check a repeated read is a hit and return its data."""
+        res = self.client.get(url, params)
+        self.assertEqual(res['X-Cache'], 'MISS')
+
+        with self.assertNumQueries(1):
+            again = self.client.get(url, params)
+
+        self.assertEqual(again['X-Cache'], 'HIT')
+        self.assertEqual(again.content, res.content)
+        return again
+
+    def test_list_cached(self):
+        """Test the dig list is served from the cache."""
+        self.assertCached(TRAILDIGS_URL)
+
+    def test_retrieve_cached(self):
+        """Test a dig is served from the cache."""
+        self.assertCached(detail_url(self.traildig.id))
+
+    def test_tag_list_cached(self):
+        """Test the tag list is served from the cache."""
+        self.assertCached(TAGS_URL)
+
+    def test_formats_cached_apart(self):
+        """Test a hit is rendered in the requested format."""
+        self.assertCached(TRAILDIGS_URL)
+
+        res = self.client.get(TRAILDIGS_URL, {'format': 'columnar'})
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertIn(b'"columns"', res.content)
+
+    def test_write_invalidates(self):
+        """Test every kind of write moves the reads to new entries."""
+        writes = [
+            lambda: self.client.post(TRAILDIGS_URL, {
+                'title': 'New dig',
+                'time_minutes': 30,
+                'number_people': 2,
+            }, format='json'),
+            lambda: self.client.patch(
+                detail_url(self.traildig.id),
+                {'title': 'Renamed'},
+                format='json',
+            ),
+            lambda: self.traildig.tags.remove(self.tag),
+            lambda: Tag.objects.filter(pk=self.tag.pk).get().save(),
+            lambda: self.client.delete(detail_url(self.traildig.id)),
+        ]
+        self.assertCached(TRAILDIGS_URL)
+        self.assertCached(TAGS_URL)
+        for write in writes:
+            write()
+
+            self.assertCached(TRAILDIGS_URL)
+            self.assertCached(TAGS_URL)
+
+    def test_per_user(self):
+        """Test users do not share their entries."""
+        self.assertCached(TRAILDIGS_URL, {'mine': 'true'})
+        self.client.force_authenticate(create_user('other@example.com'))
+
+        res = self.client.get(TRAILDIGS_URL, {'mine': 'true'})
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['results'], [])
+
+    def test_shared_between_users(self):
+        """Test reads not scoped to the user share their entries."""
+        self.assertCached(TRAILDIGS_URL)
+        self.client.force_authenticate(create_user('other@example.com'))
+
+        res = self.client.get(TRAILDIGS_URL)
+
+        self.assertEqual(res['X-Cache'], 'HIT')
+
+    def test_stats(self):
+        """Test hits and misses are counted per view."""
+        self.assertCached(TRAILDIGS_URL)
+        self.client.get(TRAILDIGS_URL)
+
+        self.assertEqual(response_cache.stats.snapshot(), {
+            'TrailDigViewSet': {'hits': 2, 'misses': 1},
+        })
+
+    def test_disabled_per_view(self):
+        """Test a view can opt out of the cache."""
+        with patch.object(TrailDigViewSet, 'response_cache', False):
+            self.client.get(TRAILDIGS_URL)
+            res = self.client.get(TRAILDIGS_URL)
+
+        self.assertNotIn('X-Cache', res)
+        self.assertEqual(response_cache.stats.snapshot(), {})
+
+    @override_settings(TRAILDIG_RESPONSE_CACHE=False)
+    def test_disabled(self):
+        """Test the cache can be turned off."""
+        res = self.client.get(TRAILDIGS_URL)
+
+        self.assertNotIn('X-Cache', res)
+
+    def test_file_based_cache(self):
+        """Test the responses can be cached on disk."""
+        with tempfile.TemporaryDirectory() as location:
+            with self.settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.'
+                           'FileBasedCache',
+                'LOCATION': location,
+            }}):
+                self.assertCached(TRAILDIGS_URL)
+
+
+class CoalescingTests(TestCase):
+    """Test concurrent misses of expensive reads are computed once."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+        Tag.objects.create(user=self.user, name='SDM')
+
+    def test_shared_miss(self):
+        """Test a request waiting for a concurrent one reuses its data."""
+        leader = {}
+
+        def do(key, func, timeout):
+            leader['key'] = key
+            leader['response'] = func()
+            return leader['response'], False
+
+        with patch.object(singleflight.group, 'do', side_effect=do):
+            res = self.client.get(TAGS_URL)
+        self.assertEqual(res['X-Cache'], 'MISS')
+        cache.clear()
+
+        with patch.object(
+            singleflight.group,
+            'do',
+            return_value=(leader['response'], True),
+        ) as do, self.assertNumQueries(1):
+            again = self.client.get(TAGS_URL)
+
+        self.assertEqual(do.call_args.args[0], leader['key'])
+        self.assertEqual(again['X-Cache'], 'COALESCED')
+        self.assertEqual(again.content, res.content)
+
+    def test_users_share_computation(self):
+        """Test concurrent misses of different users are computed once."""
+        keys = []
+        leader = {}
+
+        def do(key, func, timeout):
+            keys.append(key)
+            if len(keys) == 1:
+                leader['response'] = func()
+                return leader['response'], False
+            return leader['response'], True
+
+        other = APIClient()
+        other.force_authenticate(create_user('other@example.com'))
+        with patch.object(singleflight.group, 'do', side_effect=do):
+            res = self.client.get(TAGS_URL)
+            cache.clear()
+            again = other.get(TAGS_URL)
+
+        self.assertEqual(keys[0], keys[1])
+        self.assertEqual(again['X-Cache'], 'COALESCED')
+        self.assertEqual(again.content, res.content)
+
+    def test_user_scoped_not_shared(self):
+        """Test reads of the user's own rows are coalesced per user."""
+        other = APIClient()
+        other.force_authenticate(create_user('other@example.com'))
+        with patch.object(
+            singleflight.group,
+            'do',
+            side_effect=lambda key, func, timeout: (func(), False),
+        ) as do:
+            self.client.get(TAGS_URL, {'mine': 'true'})
+            other.get(TAGS_URL, {'mine': 'true'})
+
+        first, second = (call.args[0] for call in do.call_args_list)
+        self.assertNotEqual(first, second)
+
+    def test_only_flagged_actions(self):
+        """Test reads not flagged as expensive are not coalesced."""
+        with patch.object(
+            singleflight.group,
+            'do',
+            side_effect=lambda key, func, timeout: (func(), False),
+        ) as do:
+            res = self.client.get(TRAILDIGS_URL)
+            self.client.get(TAGS_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(do.call_count, 1)
+
+    @override_settings(TRAILDIG_COALESCE=False)
+    def test_disabled(self):
+        """Test coalescing can be turned off."""
+        with patch.object(singleflight.group, 'do') as do:
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        do.assert_not_called()
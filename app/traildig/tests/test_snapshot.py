@@ -0,0 +1,213 @@
+"""
+Tests for the columnar snapshots and the reports over them.
+"""
+import json
+import os
+import tempfile
+from datetime import date
+from io import StringIO
+from unittest import skipIf
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from core.models import (
+    TrailDig,
+    Tag,
+)
+from traildig import (
+    reports,
+    snapshot,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+def create_user(email):
+    """Create and return a new user"""
+    return get_user_model().objects.create_user(
+        email=email,
+        password='testpass123',
+    )
+
+
+def create_traildig(user, date_time, tags=(), **params):
+    """Create and return a sample dig."""
+    defaults = {
+        'title': 'Sample dig title',
+        'time_minutes': 60,
+        'number_people': 2,
+    }
+    defaults.update(params)
+    traildig = TrailDig.objects.create(
+        user=user,
+        date_time=date_time,
+        **defaults,
+    )
+    traildig.tags.add(*tags)
+    return traildig
+
+
+@skipIf(np is None, 'numpy is not installed')
+class SnapshotTests(TestCase):
+    """Test writing snapshots and reporting on them."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'snapshot')
+
+        self.user = create_user('user@example.com')
+        self.other = create_user('other@example.com')
+        sdm = Tag.objects.create(user=self.user, name='SDM')
+        other_sdm = Tag.objects.create(user=self.other, name='SDM')
+        msa = Tag.objects.create(user=self.user, name='MSA')
+        self.digs = [
+            # Monday 2024-10-21 and Sunday 2024-10-27 share a week.
+            create_traildig(self.user, '2024-10-21 08:00:00', [sdm, msa]),
+            create_traildig(
+                self.other, '2024-10-27 18:00:00', [other_sdm],
+                time_minutes=30, number_people=5,
+            ),
+            create_traildig(
+                self.user, '2024-10-28 09:00:00', [sdm],
+                time_minutes=120, number_people=1,
+            ),
+            create_traildig(
+                self.user, '2024-11-30 09:00:00',
+                time_minutes=90, number_people=3,
+            ),
+        ]
+
+    def test_columns(self):
+        """Test the columns hold the digs and their memberships."""
+        meta = snapshot.write(self.path, chunk_size=3)
+
+        self.assertEqual(meta['digs'], 4)
+        self.assertEqual(meta['memberships'], 4)
+        data = reports.Snapshot(self.path)
+        self.assertEqual(
+            list(data.column('id')),
+            [dig.id for dig in self.digs],
+        )
+        self.assertEqual(list(data.column('time_minutes')), [60, 30, 120, 90])
+        self.assertEqual(
+            str(data.column('date_time')[1]),
+            '2024-10-27T18:00:00',
+        )
+        links = sorted(
+            (
+                int(data.column('id')[dig]),
+                data.tag_names[tag],
+            )
+            for dig, tag in zip(
+                data.column('membership_dig'),
+                data.column('membership_tag'),
+            )
+        )
+        self.assertEqual(links, [
+            (self.digs[0].id, 'MSA'),
+            (self.digs[0].id, 'SDM'),
+            (self.digs[1].id, 'SDM'),
+            (self.digs[2].id, 'SDM'),
+        ])
+
+    def test_replaces_previous_snapshot(self):
+        """Test writing again replaces the snapshot in place."""
+        snapshot.write(self.path)
+        self.digs[-1].delete()
+
+        snapshot.write(self.path)
+
+        self.assertEqual(len(reports.Snapshot(self.path)), 3)
+        self.assertEqual(
+            os.listdir(os.path.dirname(self.path)),
+            ['snapshot'],
+        )
+
+    def test_reports(self):
+        """Test the reports match the digs."""
+        snapshot.write(self.path)
+        data = reports.Snapshot(self.path)
+        rows = reports.select(data)
+
+        self.assertEqual(reports.summary_report(data, rows), {
+            'digs': 4,
+            'volunteers': 2,
+            'time_minutes': 300,
+            'person_minutes': 660,
+            'first': '2024-10-21T08:00:00',
+            'last': '2024-11-30T09:00:00',
+        })
+        minutes = reports.time_minutes_report(data, rows, [50, 100], 3)
+        self.assertEqual(minutes['percentiles'], {50: 75.0, 100: 120.0})
+        self.assertEqual(
+            [item['count'] for item in minutes['histogram']],
+            [1, 1, 2],
+        )
+        crews = reports.crew_size_report(data, rows, [50])
+        self.assertEqual(crews['sizes'], {1: 1, 2: 1, 3: 1, 5: 1})
+        self.assertEqual(reports.tag_week_report(data, rows), [
+            {'tag': 'MSA', 'week': '2024-10-21', 'digs': 1,
+             'time_minutes': 60, 'person_minutes': 120},
+            {'tag': 'SDM', 'week': '2024-10-21', 'digs': 2,
+             'time_minutes': 90, 'person_minutes': 270},
+            {'tag': 'SDM', 'week': '2024-10-28', 'digs': 1,
+             'time_minutes': 120, 'person_minutes': 120},
+        ])
+
+    def test_date_selection(self):
+        """Test reports cover the digs between two days only."""
+        snapshot.write(self.path)
+        data = reports.Snapshot(self.path)
+
+        rows = reports.select(data, date(2024, 10, 27), date(2024, 10, 28))
+
+        self.assertEqual(reports.summary_report(data, rows)['digs'], 2)
+        self.assertEqual(
+            [row['week'] for row in reports.tag_week_report(data, rows)],
+            ['2024-10-21', '2024-10-28'],
+        )
+        empty = reports.select(data, date(2025, 1, 1))
+        self.assertEqual(reports.tag_week_report(data, empty), [])
+        self.assertEqual(
+            reports.time_minutes_report(data, empty, [50], 10)['count'],
+            0,
+        )
+
+    def test_commands(self):
+        """Test snapshotting then reporting from the command line."""
+        out = StringIO()
+        call_command('snapshot_traildigs', self.path, stdout=out)
+        self.assertIn('Wrote 4 trail dig(s)', out.getvalue())
+
+        out = StringIO()
+        call_command(
+            'report_traildigs', self.path,
+            '--report', 'summary', '--report', 'tags',
+            '--from', '2024-10-28', '--json',
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())
+        self.assertEqual(list(results), ['summary', 'tags'])
+        self.assertEqual(results['summary']['digs'], 2)
+
+        out = StringIO()
+        call_command('report_traildigs', self.path, stdout=out)
+        self.assertIn('person_minutes: 660', out.getvalue())
+
+    def test_invalid_snapshot(self):
+        """Test reporting on something else than a snapshot fails."""
+        with self.assertRaises(CommandError):
+            call_command('report_traildigs', self.path, stdout=StringIO())
+        snapshot.write(self.path)
+        with self.assertRaises(CommandError):
+            call_command(
+                'report_traildigs', self.path, '--from', '2024-13-01',
+                stdout=StringIO(),
+            )
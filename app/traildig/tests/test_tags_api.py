@@ -2,7 +2,9 @@
 Tests for the tags API.
 """
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -24,6 +26,11 @@ def detail_url(tag_id):
     return reverse('traildig:tag-detail', args=[tag_id])
 
 
+def series_url(tag_id):
+    """Create and return tag series URL."""
+    return reverse('traildig:tag-series', args=[tag_id])
+
+
 def create_user(email='user@example.com', password='testpass123'):
     """Create and return a new user"""
     return get_user_model().objects.create_user(email=email, password=password)
@@ -92,6 +99,28 @@ class PrivateTagsApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
 
+    def test_tag_list_mine(self):
+        """Test scoping the tag list to the requesting user."""
+        other_user = create_user(email='other@example.com')
+        Tag.objects.create(user=other_user, name='Other')
+        tag = Tag.objects.create(user=self.user, name='Mine')
+
+        res = self.client.get(TAGS_URL, {'mine': 'true'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data], [tag.id])
+
+    def test_tag_list_fields(self):
+        """Test the tag list renders and loads only the requested fields."""
+        tag = Tag.objects.create(user=self.user, name='Mine')
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(TAGS_URL, {'fields': 'name'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [{'name': tag.name}])
+        self.assertNotIn('work_done_minutes', queries[-1]['sql'])
+
     def test_update_tag_fails(self):
         """Test updating a tag fails"""
         tag = Tag.objects.create(user=self.user, name='After Dinner')
@@ -104,6 +133,22 @@ class PrivateTagsApiTests(TestCase):
         tag.refresh_from_db()
         self.assertEqual(tag.name, 'After Dinner')
 
+    def test_admin_rename_to_existing_name_fails(self):
+        """Test a tag cannot be renamed to a name its user already has."""
+        admin = get_user_model().objects.create_superuser(
+            'admin@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(admin)
+        Tag.objects.create(user=self.user, name='Dessert')
+        tag = Tag.objects.create(user=self.user, name='After Dinner')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'Dessert'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'After Dinner')
+
     def test_delete_tag_fails(self):
         """test deleting a tag"""
         tag = Tag.objects.create(user=self.user, name='Breakfast')
@@ -132,3 +177,76 @@ class PrivateTagsApiTests(TestCase):
         #     tag_data['amount_work_done_per_year'],
         #     dig1.time_minutes,
         # )
+
+    def test_tag_list_uses_single_query(self):
+        """Test listing tags does not query per tag."""
+        for name in ['Chomeuse', 'MSA', 'SDM']:
+            tag = Tag.objects.create(user=self.user, name=name)
+            create_traildig(user=self.user).tags.add(tag)
+
+        # The change version check, then the tags.
+        with self.assertNumQueries(2):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 3)
+
+    def test_tag_list_not_modified(self):
+        """Test an unchanged tag list is not sent again."""
+        tag = Tag.objects.create(user=self.user, name='SDM')
+        res = self.client.get(TAGS_URL)
+
+        with self.assertNumQueries(1):
+            again = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        create_traildig(user=self.user).tags.add(tag)
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data[0]['amount_work_done_minutes'], 22)
+
+    def test_tag_series_per_month(self):
+        """Test the work done on a tag is listed per month."""
+        tag = Tag.objects.create(user=self.user, name='Chomeuse')
+        for date_time in ['2024-10-25 10:00:00', '2024-10-26 10:00:00',
+                          '2024-12-01 10:00:00', '2025-01-25 11:00:00']:
+            create_traildig(user=self.user, date_time=date_time).tags.add(tag)
+
+        res = self.client.get(series_url(tag.id), {
+            'start': '2024-11',
+            'end': '2025',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'year': 2024, 'month': 12, 'time_minutes': 22,
+             'person_minutes': 220},
+            {'year': 2025, 'month': 1, 'time_minutes': 22,
+             'person_minutes': 220},
+        ])
+
+    def test_tag_series_per_year(self):
+        """Test the work done on a tag is summed per year."""
+        tag = Tag.objects.create(user=self.user, name='Chomeuse')
+        for date_time in ['2024-10-25 10:00:00', '2024-12-01 10:00:00',
+                          '2025-01-25 11:00:00']:
+            create_traildig(user=self.user, date_time=date_time).tags.add(tag)
+
+        res = self.client.get(series_url(tag.id), {'period': 'year'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'year': 2024, 'time_minutes': 44, 'person_minutes': 440},
+            {'year': 2025, 'time_minutes': 22, 'person_minutes': 220},
+        ])
+
+    def test_tag_series_invalid_range(self):
+        """Test a reversed or malformed range is rejected."""
+        tag = Tag.objects.create(user=self.user, name='Chomeuse')
+
+        for params in [{'start': '2025', 'end': '2024'},
+                       {'start': '2024-13'},
+                       {'end': 'last year'}]:
+            res = self.client.get(series_url(tag.id), params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
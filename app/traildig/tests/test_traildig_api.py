@@ -1,25 +1,37 @@
 """
 Tests for traildig APIs.
 """
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import (
+    TestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import (
+        DataVersion,
         TrailDig,
         Tag,
 )
 
+from traildig.pagination import TrailDigCursorPagination
 from traildig.serializers import (
+        TagSerializer,
         TrailDigSerializer,
         TrailDigDetailSerializer,
 )
 
 
 TRAILDIGS_URL = reverse('traildig:traildig-list')
+BULK_URL = reverse('traildig:traildig-bulk')
 
 
 def detail_url(traildig_id):
@@ -79,7 +91,7 @@ class PrivateTrailDigAPITests(TestCase):
         traildigs = TrailDig.objects.all().order_by('-id')
         serializer = TrailDigSerializer(traildigs, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_unfiltered_traildig_list_contains_all_dig(self):
         """Test dig list retrieves all digs."""
@@ -92,7 +104,7 @@ class PrivateTrailDigAPITests(TestCase):
         traildigs = TrailDig.objects.all().order_by('-id')
         serializer = TrailDigSerializer(traildigs, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_get_traildig_detail(self):
         """Test get dig detail."""
@@ -249,6 +261,44 @@ class PrivateTrailDigAPITests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    @override_settings(TRAILDIG_AUTO_CREATE_TAGS=True)
+    def test_create_traildig_auto_creates_tags(self):
+        """Test missing tags are created when the option is set."""
+        existing = Tag.objects.create(user=self.user, name='SDM')
+        payload = {
+            'title': "Drainage",
+            'time_minutes': 180,
+            'number_people': 3,
+            'tags': [{'name': 'SDM'}, {'name': 'MSA'}, {'name': 'MSA'}],
+        }
+
+        res = self.client.post(TRAILDIGS_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        traildig = TrailDig.objects.get(id=res.data['id'])
+        tags = Tag.objects.filter(user=self.user)
+        self.assertEqual(tags.count(), 2)
+        self.assertEqual(set(traildig.tags.all()), set(tags))
+        self.assertIn(existing, tags)
+        self.assertEqual(tags.get(name='MSA').work_done_minutes, 180)
+
+    @override_settings(TRAILDIG_AUTO_CREATE_TAGS=True)
+    def test_update_traildig_auto_creates_tags(self):
+        """Test updating with a missing tag creates it for the user."""
+        other_user = create_user(email='other@example.com', password='pw123')
+        other_tag = Tag.objects.create(user=other_user, name='MSA')
+        traildig = create_traildig(user=self.user)
+
+        payload = {'tags': [{'name': 'MSA'}]}
+        res = self.client.patch(
+            detail_url(traildig.id), payload, format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        tag = traildig.tags.get()
+        self.assertEqual((tag.user, tag.name), (self.user, 'MSA'))
+        self.assertNotEqual(tag, other_tag)
+
     def test_update_traildig_assign_tag(self):
         """Assigning an existing tag when updating a trail dig."""
         tag_2030 = Tag.objects.create(user=self.user, name='2030')
@@ -276,3 +326,677 @@ class PrivateTrailDigAPITests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(traildig.tags.count(), 0)
+
+    def test_tags_resolved_for_requesting_user(self):
+        """Test tags of other users cannot be assigned."""
+        other_user = create_user(email='other@example.com', password='pw123')
+        Tag.objects.create(user=other_user, name='MSA')
+        traildig = create_traildig(user=self.user)
+
+        payload = {'tags': [{'name': 'MSA'}]}
+        url = detail_url(traildig.id)
+        res = self.client.patch(url, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(traildig.tags.count(), 0)
+
+    def test_retag_queries_do_not_grow_with_tags(self):
+        """Test retagging costs the same for 2 or 20 tags."""
+        tags = [
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+            for i in range(40)
+        ]
+        create_traildig(user=self.user).tags.add(*tags)
+        few_dig = create_traildig(user=self.user)
+        few_dig.tags.add(*tags[:2])
+        many_dig = create_traildig(user=self.user)
+        many_dig.tags.add(*tags[:20])
+
+        with CaptureQueriesContext(connection) as few:
+            res = self.client.patch(detail_url(few_dig.id), {
+                'tags': [{'name': tag.name} for tag in tags[1:3]],
+            }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as many:
+            res = self.client.patch(detail_url(many_dig.id), {
+                'tags': [{'name': tag.name} for tag in tags[10:30]],
+            }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(
+            set(many_dig.tags.values_list('name', flat=True)),
+            {tag.name for tag in tags[10:30]},
+        )
+
+    def test_unchanged_tags_write_nothing(self):
+        """Test resending the same tags does not touch the tag links."""
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ['SDM', 'MSA']
+        ]
+        traildig = create_traildig(user=self.user)
+        traildig.tags.add(*tags)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(detail_url(traildig.id), {
+                'tags': [{'name': 'MSA'}, {'name': 'SDM'}],
+            }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if '"core_change"' in sql:
+                # The dig itself is saved, see core.changes.
+                continue
+            self.assertFalse(
+                sql.startswith(('INSERT', 'DELETE')) or
+                sql.startswith('UPDATE "core_tag'),
+                sql,
+            )
+
+
+class TrailDigPaginationTests(TestCase):
+    """Test the cursor pagination of the trail dig list."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass23')
+        self.client.force_authenticate(self.user)
+
+    def collect_ids(self, params):
+        """Follow the next links and return the ids of every page."""
+        pages = []
+        res = self.client.get(TRAILDIGS_URL, params)
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            pages.append([dig['id'] for dig in res.data['results']])
+            if not res.data['next']:
+                return pages
+            res = self.client.get(res.data['next'])
+
+    def test_pages_follow_id_order(self):
+        """Test pages walk the digs from newest to oldest."""
+        digs = [create_traildig(user=self.user) for _ in range(5)]
+
+        pages = self.collect_ids({'page_size': 2})
+
+        ids = [dig.id for dig in reversed(digs)]
+        self.assertEqual(pages, [ids[0:2], ids[2:4], ids[4:]])
+
+    def test_pages_stable_under_inserts(self):
+        """Test new digs do not shift the following pages."""
+        digs = [create_traildig(user=self.user) for _ in range(4)]
+
+        res = self.client.get(TRAILDIGS_URL, {'page_size': 2})
+        create_traildig(user=self.user)
+        res = self.client.get(res.data['next'])
+
+        self.assertEqual(
+            [dig['id'] for dig in res.data['results']],
+            [digs[1].id, digs[0].id],
+        )
+
+    def test_order_by_date_time(self):
+        """Test paginating by date keeps ties in a stable order."""
+        dig1 = create_traildig(user=self.user, date_time='2024-10-02 10:00')
+        dig2 = create_traildig(user=self.user, date_time='2024-10-01 10:00')
+        dig3 = create_traildig(user=self.user, date_time='2024-10-02 10:00')
+        dig4 = create_traildig(user=self.user, date_time='2024-09-01 10:00')
+
+        pages = self.collect_ids({'ordering': 'date_time', 'page_size': 2})
+        self.assertEqual(pages, [[dig4.id, dig2.id], [dig1.id, dig3.id]])
+
+        pages = self.collect_ids({'ordering': '-date_time', 'page_size': 3})
+        self.assertEqual(pages, [[dig3.id, dig1.id, dig2.id], [dig4.id]])
+
+    def test_page_size_is_capped(self):
+        """Test the requested page size cannot exceed the maximum."""
+        for _ in range(3):
+            create_traildig(user=self.user)
+
+        with patch.object(TrailDigCursorPagination, 'max_page_size', 2):
+            res = self.client.get(TRAILDIGS_URL, {'page_size': 100})
+
+        self.assertEqual(len(res.data['results']), 2)
+
+    def test_list_does_not_count(self):
+        """Test listing never issues a COUNT query."""
+        for _ in range(3):
+            create_traildig(user=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(TRAILDIGS_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(res.data), {'next', 'previous', 'results'})
+        for query in queries.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
+
+    def test_invalid_cursor(self):
+        """Test a tampered cursor is rejected."""
+        res = self.client.get(TRAILDIGS_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TrailDigFilterTests(TestCase):
+    """Test filtering the trail dig list."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass23')
+        self.client.force_authenticate(self.user)
+        self.other_user = create_user(
+            email='other@example.com',
+            password='testpass23')
+        self.tag = Tag.objects.create(user=self.user, name='SDM')
+        self.other_tag = Tag.objects.create(user=self.user, name='MSA')
+
+        self.dig_oct = create_traildig(
+            self.user, number_people=2, date_time='2024-10-25 10:00:00',
+        )
+        self.dig_nov = create_traildig(
+            self.user, number_people=6, date_time='2024-11-02 10:00:00',
+        )
+        self.dig_other = create_traildig(
+            self.other_user, number_people=8, date_time='2024-10-26 10:00:00',
+        )
+        self.dig_oct.tags.add(self.tag)
+        self.dig_nov.tags.add(self.tag, self.other_tag)
+        self.dig_other.tags.add(self.other_tag)
+
+    def ids(self, params):
+        res = self.client.get(TRAILDIGS_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [dig['id'] for dig in res.data['results']]
+
+    def test_filter_mine(self):
+        """Test scoping the list to the requesting user."""
+        self.assertEqual(
+            self.ids({'mine': 'true'}),
+            [self.dig_nov.id, self.dig_oct.id],
+        )
+
+    def test_filter_tags(self):
+        """Test filtering digs having any of the given tags."""
+        self.assertEqual(self.ids({'tags': self.tag.id}), [
+            self.dig_nov.id, self.dig_oct.id,
+        ])
+        self.assertEqual(
+            self.ids({'tags': f'{self.tag.id},{self.other_tag.id}'}),
+            [self.dig_other.id, self.dig_nov.id, self.dig_oct.id],
+        )
+
+    def test_filter_date_window_and_people(self):
+        """Test filtering on the date window and the people count."""
+        self.assertEqual(self.ids({
+            'date_from': '2024-10-26T00:00:00',
+            'date_to': '2024-11-30T00:00:00',
+            'ordering': 'date_time',
+        }), [self.dig_other.id, self.dig_nov.id])
+        self.assertEqual(
+            self.ids({'min_people': 6, 'mine': 'true'}),
+            [self.dig_nov.id],
+        )
+
+    def test_invalid_filters(self):
+        """Test malformed filters are rejected."""
+        for params in [
+            {'tags': 'SDM'},
+            {'min_people': -1},
+            {'date_from': '2024-11-01', 'date_to': '2024-10-01'},
+        ]:
+            with self.subTest(params=params):
+                res = self.client.get(TRAILDIGS_URL, params)
+                self.assertEqual(
+                    res.status_code, status.HTTP_400_BAD_REQUEST,
+                )
+
+
+class TrailDigSearchTests(TestCase):
+    """Test searching the trail dig list."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass23')
+        self.client.force_authenticate(self.user)
+        self.in_title = create_traildig(
+            self.user,
+            title='Drainage of the north trail',
+            description='Dug two ditches.',
+        )
+        self.in_description = create_traildig(
+            self.user,
+            title='Autumn clean up',
+            description='Cleared the drainage and the leaves.',
+        )
+        create_traildig(
+            self.user,
+            title='Jump building',
+            description='Shaped the north jump.',
+        )
+
+    def ids(self, params):
+        res = self.client.get(TRAILDIGS_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [dig['id'] for dig in res.data['results']]
+
+    def test_search_ranks_title_matches_first(self):
+        """Test matches on the title rank above description matches."""
+        self.assertEqual(
+            self.ids({'search': 'drainage'}),
+            [self.in_title.id, self.in_description.id],
+        )
+
+    def test_search_matches_every_word(self):
+        """Test all the words of the search must match."""
+        self.assertEqual(
+            self.ids({'search': 'north drainage'}),
+            [self.in_title.id],
+        )
+        self.assertEqual(self.ids({'search': 'drainage jump'}), [])
+        self.assertEqual(self.ids({'search': '"!!'}), [])
+
+    def test_search_with_explicit_ordering(self):
+        """Test an explicit ordering replaces the ranking."""
+        self.assertEqual(
+            self.ids({'search': 'drainage', 'ordering': '-id'}),
+            [self.in_description.id, self.in_title.id],
+        )
+
+    def test_search_pages(self):
+        """Test ranked results can be paged through."""
+        res = self.client.get(
+            TRAILDIGS_URL, {'search': 'drainage', 'page_size': 1},
+        )
+        ids = [dig['id'] for dig in res.data['results']]
+        res = self.client.get(res.data['next'])
+        ids += [dig['id'] for dig in res.data['results']]
+
+        self.assertEqual(ids, [self.in_title.id, self.in_description.id])
+        self.assertIsNone(res.data['next'])
+
+    def test_search_pages_through_close_ranks(self):
+        """Test paging returns every match once, ties and near ties too."""
+        for i in range(12):
+            create_traildig(
+                self.user,
+                title=f'Ditch {i % 3}',
+                description='drainage ' + 'rocks ' * (i % 5),
+            )
+        expected = self.ids({'search': 'drainage', 'page_size': 100})
+
+        ids = []
+        res = self.client.get(
+            TRAILDIGS_URL, {'search': 'drainage', 'page_size': 2},
+        )
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            ids += [dig['id'] for dig in res.data['results']]
+            if res.data['next'] is None:
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(len(expected), 14)
+        self.assertEqual(ids, expected)
+
+    def test_search_follows_writes(self):
+        """Test created, edited and deleted digs are found accordingly."""
+        res = self.client.post(TRAILDIGS_URL, {
+            'title': 'Bridge repair',
+            'time_minutes': 60,
+            'number_people': 2,
+        }, format='json')
+        created_id = res.data['id']
+        res = self.client.post(BULK_URL, [{
+            'title': 'Bridge painting',
+            'time_minutes': 60,
+            'number_people': 2,
+        }], format='json')
+        bulk_id = res.data['ids'][0]
+        self.assertEqual(
+            self.ids({'search': 'bridge'}), [bulk_id, created_id],
+        )
+
+        self.client.patch(
+            detail_url(self.in_description.id),
+            {'title': 'Bridge clean up'},
+            format='json',
+        )
+        self.client.delete(detail_url(created_id))
+
+        self.assertCountEqual(
+            self.ids({'search': 'bridge'}),
+            [self.in_description.id, bulk_id],
+        )
+
+
+class TrailDigSparseFieldsTests(TestCase):
+    """Test requesting a subset of the trail dig fields."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass23')
+        self.client.force_authenticate(self.user)
+        tag = Tag.objects.create(user=self.user, name='SDM')
+        for i in range(3):
+            create_traildig(self.user, title=f'Dig {i}').tags.add(tag)
+
+    def test_list_fields(self):
+        """Test the list renders and loads only the requested fields."""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(
+                TRAILDIGS_URL, {'fields': 'id,title,date_time'},
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        for item in res.data['results']:
+            self.assertEqual(list(item), ['id', 'title', 'date_time'])
+        # The change version check, then the digs.
+        self.assertEqual(len(queries), 2)
+        sql = queries.captured_queries[-1]['sql']
+        self.assertNotIn('description', sql)
+        self.assertNotIn('time_minutes', sql)
+
+    def test_list_fields_pages(self):
+        """Test paging works when the ordering field is not requested."""
+        res = self.client.get(TRAILDIGS_URL, {
+            'fields': 'title',
+            'ordering': 'date_time',
+            'page_size': 2,
+        })
+        res = self.client.get(res.data['next'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [{'title': 'Dig 2'}])
+
+    def test_detail_fields(self):
+        """Test the detail view honours the requested fields."""
+        traildig = TrailDig.objects.first()
+
+        res = self.client.get(
+            detail_url(traildig.id), {'fields': 'description,tags'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {
+            'description': traildig.description,
+            'tags': TagSerializer(traildig.tags.all(), many=True).data,
+        })
+
+    def test_unknown_fields(self):
+        """Test requesting an unknown field fails."""
+        res = self.client.get(TRAILDIGS_URL, {'fields': 'id,description'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TrailDigBulkCreateTests(TestCase):
+    """Test creating many trail digs in one request."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass23')
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='SDM')
+
+    def payload(self, count, **params):
+        """Return a list of dig payloads."""
+        dig = {
+            'title': 'Drainage',
+            'time_minutes': 30,
+            'number_people': 2,
+            'date_time': '2024-10-25T10:00:00',
+            'tags': [{'name': 'SDM'}],
+        }
+        dig.update(params)
+        return [dict(dig, title=f'Drainage {i}') for i in range(count)]
+
+    def test_bulk_create(self):
+        """Test digs and their tags are created in bulk."""
+        payload = self.payload(3)
+        payload[0]['description'] = 'Bulk description'
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data['ids']), 3)
+        traildigs = TrailDig.objects.filter(id__in=res.data['ids'])
+        self.assertEqual(traildigs.count(), 3)
+        for traildig in traildigs:
+            self.assertEqual(traildig.user, self.user)
+            self.assertEqual(list(traildig.tags.all()), [self.tag])
+        self.assertEqual(
+            TrailDig.objects.get(id=res.data['ids'][0]).description,
+            'Bulk description',
+        )
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.work_done_minutes, 90)
+        self.assertEqual(self.tag.rollups.get().person_minutes, 180)
+
+    def test_bulk_create_reports_item_errors(self):
+        """Test invalid items are reported and nothing is created."""
+        payload = self.payload(3)
+        payload[1]['tags'] = [{'name': 'Unknown'}]
+        del payload[2]['time_minutes']
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('non_field_errors', res.data[1])
+        self.assertIn('time_minutes', res.data[2])
+        self.assertFalse(TrailDig.objects.exists())
+
+    def test_bulk_create_uses_own_tags_only(self):
+        """Test tags of other users are not resolved."""
+        other_user = create_user(email='other@example.com', password='pw123')
+        Tag.objects.create(user=other_user, name='MSA')
+
+        res = self.client.post(
+            BULK_URL,
+            self.payload(1, tags=[{'name': 'MSA'}]),
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(TRAILDIG_AUTO_CREATE_TAGS=True)
+    def test_bulk_create_auto_creates_tags_once(self):
+        """Test a tag missing from many items is created once."""
+        payload = self.payload(3, tags=[{'name': 'MSA'}, {'name': 'SDM'}])
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        tag = Tag.objects.get(user=self.user, name='MSA')
+        self.assertEqual(tag.traildig_set.count(), 3)
+        self.assertEqual(tag.work_done_minutes, 90)
+
+    def test_bulk_create_limit(self):
+        """Test the number of digs per request is capped."""
+        with self.settings(TRAILDIG_BULK_MAX_ITEMS=2):
+            res = self.client.post(BULK_URL, self.payload(3), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(TrailDig.objects.exists())
+
+    @skipUnlessDBFeature('can_return_rows_from_bulk_insert')
+    def test_bulk_create_queries_do_not_grow(self):
+        """Test the number of queries does not depend on the digs."""
+        self.client.post(BULK_URL, self.payload(1), format='json')
+        with CaptureQueriesContext(connection) as few:
+            self.client.post(BULK_URL, self.payload(2), format='json')
+        with CaptureQueriesContext(connection) as many:
+            self.client.post(BULK_URL, self.payload(200), format='json')
+
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(TrailDig.objects.count(), 203)
+
+
+class TrailDigConditionalGetTests(TestCase):
+    """Test reads answer 304 Not Modified while nothing changed."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass23')
+        self.other = create_user(
+            email='other@example.com',
+            password='testpass23')
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='SDM')
+        self.traildig = create_traildig(user=self.user)
+        self.traildig.tags.add(self.tag)
+
+    def assertNotModified(self, url, params=None, **headers):
+        """Check a request repeated with its ETag is not modified."""
+        res = self.client.get(url, params, **headers)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('Last-Modified', res)
+
+        with self.assertNumQueries(1):
+            again = self.client.get(
+                url, params, HTTP_IF_NONE_MATCH=res['ETag'], **headers,
+            )
+
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(again['ETag'], res['ETag'])
+        self.assertEqual(again.content, b'')
+        return res['ETag']
+
+    def assertModified(self, url, etag, params=None):
+        """Check a request with a previous ETag gets a full response."""
+        res = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_list_not_modified(self):
+        """Test an unchanged list is not sent again."""
+        self.assertNotModified(TRAILDIGS_URL)
+
+    def test_retrieve_not_modified(self):
+        """Test an unchanged dig is not sent again."""
+        self.assertNotModified(detail_url(self.traildig.id))
+
+    def test_list_if_modified_since(self):
+        """Test the list honours If-Modified-Since."""
+        res = self.client.get(TRAILDIGS_URL)
+
+        again = self.client.get(
+            TRAILDIGS_URL,
+            HTTP_IF_MODIFIED_SINCE=res['Last-Modified'],
+        )
+
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_depends_on_query_and_format(self):
+        """Test different queries and formats get different ETags."""
+        etags = {
+            self.assertNotModified(TRAILDIGS_URL),
+            self.assertNotModified(TRAILDIGS_URL, {'mine': 'true'}),
+            self.assertNotModified(TRAILDIGS_URL, {'format': 'columnar'}),
+        }
+
+        self.assertEqual(len(etags), 3)
+
+    def test_create_modifies_list(self):
+        """Test creating a dig changes the list ETag."""
+        etag = self.assertNotModified(TRAILDIGS_URL)
+
+        self.client.post(TRAILDIGS_URL, {
+            'title': 'New dig',
+            'time_minutes': 30,
+            'number_people': 2,
+        }, format='json')
+
+        self.assertModified(TRAILDIGS_URL, etag)
+
+    def test_update_modifies_retrieve(self):
+        """Test editing a dig changes its ETag."""
+        url = detail_url(self.traildig.id)
+        etag = self.assertNotModified(url)
+
+        self.client.patch(url, {'title': 'Renamed'}, format='json')
+
+        self.assertModified(url, etag)
+
+    def test_delete_modifies_list(self):
+        """Test deleting a dig changes the list ETag."""
+        dig = create_traildig(user=self.user)
+        etag = self.assertNotModified(TRAILDIGS_URL)
+
+        self.client.delete(detail_url(dig.id))
+
+        self.assertModified(TRAILDIGS_URL, etag)
+
+    def test_tag_rename_modifies_retrieve(self):
+        """Test renaming a tag changes the ETag of its digs."""
+        url = detail_url(self.traildig.id)
+        etag = self.assertNotModified(url)
+
+        self.tag.name = 'MSA'
+        self.tag.save()
+
+        self.assertModified(url, etag)
+
+    def test_bulk_create_modifies_list(self):
+        """Test creating digs in bulk changes the list ETag."""
+        etag = self.assertNotModified(TRAILDIGS_URL)
+
+        self.client.post(BULK_URL, [{
+            'title': 'Bulk dig',
+            'time_minutes': 30,
+            'number_people': 2,
+        }], format='json')
+
+        self.assertModified(TRAILDIGS_URL, etag)
+
+    def test_all_users_version_single_row(self):
+        """Test everyone's list reads its version from one row."""
+        res = self.client.get(TRAILDIGS_URL)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(TRAILDIGS_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(len(queries), 1)
+        self.assertIn(
+            DataVersion._meta.db_table,
+            queries.captured_queries[0]['sql'],
+        )
+
+    def test_missing_version_row_recreated(self):
+        """Test a write recreates the version row of all users."""
+        DataVersion.objects.all().delete()
+        etag = self.client.get(TRAILDIGS_URL)['ETag']
+
+        create_traildig(user=self.other)
+
+        self.assertEqual(DataVersion.objects.get().version, 1)
+        self.assertModified(TRAILDIGS_URL, etag)
+
+    def test_other_user_change(self):
+        """Test another user's dig changes everyone's list, not mine."""
+        everyone = self.assertNotModified(TRAILDIGS_URL)
+        mine = self.assertNotModified(TRAILDIGS_URL, {'mine': 'true'})
+
+        create_traildig(user=self.other)
+
+        self.assertModified(TRAILDIGS_URL, everyone)
+        res = self.client.get(
+            TRAILDIGS_URL, {'mine': 'true'}, HTTP_IF_NONE_MATCH=mine,
+        )
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
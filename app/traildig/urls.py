@@ -11,8 +11,14 @@ from rest_framework.routers import DefaultRouter
 from traildig import views
 
 router = DefaultRouter()
+router.APIRootView = views.TrailDigAPIRootView
 router.register('traildigs', views.TrailDigViewSet)
 router.register('tags', views.TagViewSet)
+router.register(
+    'leaderboard',
+    views.LeaderboardViewSet,
+    basename='leaderboard',
+)
 
 app_name = 'traildig'
 
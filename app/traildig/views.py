@@ -1,13 +1,33 @@
 """
 Views fro the trail dig APIs.
 """
+import hashlib
+from calendar import timegm
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch, Q, Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import (
+    http_date,
+    quote_etag,
+)
+
 from rest_framework import (
         viewsets,
         mixins,
         status
 )
+from rest_framework.decorators import action
+from rest_framework.exceptions import (
+    APIException,
+    ValidationError,
+)
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.routers import APIRootView
 from rest_framework.permissions import (
     IsAuthenticated,
     IsAdminUser,
@@ -17,19 +37,415 @@ from core.models import (
         TrailDig,
         Tag
 )
-from traildig import serializers
+from core import (
+    aggregates,
+    changes,
+    leaderboards,
+    response_cache,
+    singleflight,
+    versions,
+)
+from core.query_budget import QueryBudgetMixin
+from core.renderers import (
+    CSVRenderer,
+    NDJSONRenderer,
+    format_renderers,
+)
+from traildig import (
+    export,
+    serializers,
+)
+from traildig.compiled import compile_serializer
+from traildig.filters import (
+    OwnerFilter,
+    StableOrderingFilter,
+    TrailDigFilter,
+)
+from traildig.pagination import TrailDigCursorPagination
+from user.authentication import (
+    AccessTokenAuthentication,
+    CachedTokenAuthentication,
+)
+
+
+class SparseFieldsetMixin:
+    """Render and load only the fields listed in ?fields= on reads.
+
+    Views call `narrow_queryset` to defer the columns no requested field
+    uses and `wants_field` to skip the related data nobody asked for.
+    """
+    fields_param = 'fields'
+    sparse_actions = ['list', 'retrieve']
+
+    def get_sparse_fields(self):
+        """Return the requested field names, or None for all of them."""
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = None
+            value = self.request.query_params.get(self.fields_param)
+            if value is not None and self.action in self.sparse_actions:
+                names = [name.strip() for name in value.split(',')]
+                available = self.get_serializer_class()().fields
+                unknown = sorted(set(names) - set(available))
+                if unknown:
+                    raise ValidationError({self.fields_param: [
+                        f"Unknown fields: {', '.join(unknown)}."
+                    ]})
+                self._sparse_fields = names
+        return self._sparse_fields
+
+    def wants_field(self, name):
+        """Return whether the response renders the field name."""
+        fields = self.get_sparse_fields()
+        return fields is None or name in fields
+
+    def narrow_queryset(self, queryset):
+        """Load only the columns used by the requested fields."""
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return queryset
+
+        opts = queryset.model._meta
+        serializer_fields = self.get_serializer_class()().fields
+        sources = {serializer_fields[name].source for name in fields}
+        # Cursor pagination reads the ordering values off the rows.
+        sources.update(getattr(self, 'ordering_fields', None) or [])
+        columns = []
+        for source in sources:
+            try:
+                field = opts.get_field(source)
+            except FieldDoesNotExist:
+                # Computed output, no safe way to narrow the columns.
+                return queryset
+            if field.concrete and not field.many_to_many:
+                columns.append(field.attname)
+        return queryset.only(*columns)
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+
+class CompiledListMixin:
+    """Render list responses from values() rows, see traildig.compiled.
+
+    Falls back to the serializer when it has fields the compiled path
+    cannot render. `related_ordering` gives the ordering of the nested
+    many to many fields, matching the view's prefetches.
+    """
+    compiled_list = True
+    related_ordering = {}
+
+    def list(self, request, *args, **kwargs):
+        compiled = None
+        if self.compiled_list:
+            compiled = compile_serializer(
+                self.get_serializer(),
+                self.related_ordering,
+            )
+        if compiled is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        # Pagination reads its position from the ordering values.
+        extra = [
+            name for name in [
+                *queryset.query.annotations,
+                *(getattr(self, 'ordering_fields', None) or []),
+            ] if name not in compiled.columns
+        ]
+        rows = compiled.values(queryset, *dict.fromkeys(extra))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(compiled.render(page))
+        return Response(compiled.render(rows))
+
+
+class ConditionalGetMixin:
+    """Answer reads the client already has with 304 Not Modified.
+
+    The ETag and Last-Modified come from the change versions of the users
+    whose data the response shows, see core.versions, read with one query
+    before the handler runs. A match skips the serializer and every query
+    behind it.
+    """
+    conditional_actions = ['list', 'retrieve']
+
+    def is_user_scoped(self):
+        """Return whether the response shows the requesting user's rows only.
+
+        That is a list with ?mine=true; every other read is the same for
+        every user.
+        """
+        if self.detail:
+            return False
+        params = serializers.OwnerFilterParamsSerializer(
+            data=self.request.query_params,
+        )
+        params.is_valid(raise_exception=True)
+        return params.validated_data['mine']
+
+    def get_version_users(self, user_scoped):
+        """Return the users whose data the response shows, None for all."""
+        users = get_user_model().objects.all()
+        if self.detail:
+            lookup = self.lookup_url_kwarg or self.lookup_field
+            return users.filter(pk__in=self.queryset.filter(**{
+                self.lookup_field: self.kwargs[lookup],
+            }).values('user_id'))
+        if user_scoped:
+            return users.filter(pk=self.request.user.pk)
+        return None
+
+    def get_validators(self):
+        """Return the key, ETag and last modification of the response.
+
+        The key identifies the response data, for caching it. Only the
+        responses scoped to the requesting user have their id in it, the
+        others are shared by every user.
+        """
+        user_scoped = self.is_user_scoped()
+        version, changed_at = versions.current(
+            self.get_version_users(user_scoped),
+        )
+        parts = [
+            version,
+            self.request.accepted_media_type,
+            # Pagination links are absolute.
+            self.request.build_absolute_uri(),
+        ]
+        if user_scoped:
+            parts.append(f'user:{self.request.user.pk}')
+        key = hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+        return key, quote_etag(key), changed_at
+
+    def conditional(self, handler, request, *args, **kwargs):
+        """Run handler, unless the client has the current response."""
+        if (
+            request.method not in ('GET', 'HEAD')
+            or self.action not in self.conditional_actions
+        ):
+            return handler(request, *args, **kwargs)
+
+        key, etag, changed_at = self.get_validators()
+        last_modified = None
+        if changed_at is not None:
+            last_modified = timegm(changed_at.utctimetuple())
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=last_modified,
+        )
+        if response is None:
+            response = self.get_response(
+                key, handler, request, *args, **kwargs,
+            )
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get_response(self, key, handler, request, *args, **kwargs):
+        """Return the response identified by key."""
+        return handler(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
 
+class CachedResponseMixin(ConditionalGetMixin):
+    """Serve reads from the response cache, see core.response_cache.
 
-class TrailDigViewSet(viewsets.ModelViewSet):
+    Set `response_cache` to False to always run the handler. Misses of
+    the `coalesced_actions`, expensive reads, are computed once for the
+    concurrent identical requests, see core.singleflight.
+    """
+    response_cache = True
+    coalesced_actions = []
+
+    def get_response(self, key, handler, request, *args, **kwargs):
+        if not self.response_cache or not response_cache.enabled():
+            return super().get_response(
+                key, handler, request, *args, **kwargs,
+            )
+
+        data = response_cache.get(type(self).__name__, key)
+        if data is not None:
+            return self.cached_response(data, 'HIT')
+
+        if (
+            self.action not in self.coalesced_actions
+            or not singleflight.enabled()
+        ):
+            return self.get_missed_response(
+                key, handler, request, *args, **kwargs,
+            )
+        response, shared = singleflight.group.do(
+            key,
+            lambda: self.get_coalesced_response(
+                key, handler, request, *args, **kwargs,
+            ),
+            settings.TRAILDIG_COALESCE_TIMEOUT,
+        )
+        if not shared:
+            return response
+        if response.status_code != status.HTTP_200_OK:
+            return self.get_missed_response(
+                key, handler, request, *args, **kwargs,
+            )
+        return self.cached_response(response.data, 'COALESCED')
+
+    def cached_response(self, data, outcome):
+        """Return a response of data from the cache or another request."""
+        response = Response(data)
+        response['X-Cache'] = outcome
+        return response
+
+    def get_missed_response(self, key, handler, request, *args, **kwargs):
+        """Run the handler and cache its data."""
+        response = super().get_response(
+            key, handler, request, *args, **kwargs,
+        )
+        if response.status_code == status.HTTP_200_OK:
+            response_cache.set(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def get_coalesced_response(self, key, handler, request, *args,
+                               **kwargs):
+        """Run the handler unless another process cached the data first."""
+        with singleflight.advisory_lock(
+            key,
+            settings.TRAILDIG_COALESCE_TIMEOUT,
+        ) as locked:
+            if locked:
+                data = response_cache.get(type(self).__name__, key)
+                if data is not None:
+                    return self.cached_response(data, 'COALESCED')
+            return self.get_missed_response(
+                key, handler, request, *args, **kwargs,
+            )
+
+
+class CursorExpired(APIException):
+    """The deletions a change feed cursor needs were pruned."""
+    status_code = status.HTTP_410_GONE
+    default_detail = 'Cursor expired, download everything again.'
+    default_code = 'cursor_expired'
+
+
+class ChangeFeedMixin:
+    """Serve the objects changed since a cursor, see core.changes.
+
+    `?since=` takes the `cursor` of the previous response, the feed
+    starts from the beginning without it. Pages are read until `more` is
+    false.
+    """
+    change_kind = None
+
+    @action(detail=False)
+    def changes(self, request):
+        """Return the objects changed and deleted since a cursor."""
+        params = serializers.ChangeFeedParamsSerializer(
+            data=request.query_params,
+        )
+        params.is_valid(raise_exception=True)
+        after, synced_at = params.validated_data.get('since', (0, None))
+        if synced_at is not None and synced_at < changes.horizon():
+            raise CursorExpired()
+        limit = params.validated_data['page_size']
+        user_id = None
+        if params.validated_data['mine']:
+            user_id = request.user.pk
+
+        read_at = timezone.now()
+        rows = changes.since(self.change_kind, after, limit + 1, user_id)
+        more = len(rows) > limit
+        rows = rows[:limit]
+        position = {
+            row.object_id: index for index, row in enumerate(rows)
+            if not row.deleted
+        }
+        # Objects changed again since show their latest state, and come
+        # again later in the feed.
+        objects = sorted(
+            self.get_queryset().filter(pk__in=list(position)),
+            key=lambda obj: position[obj.pk],
+        )
+        data = self.get_serializer(objects, many=True).data
+
+        # Until the client has read every page, deletions since its
+        # previous complete copy are still needed.
+        if synced_at is None or not more:
+            synced_at = read_at
+        return Response({
+            'results': data,
+            'deleted': [row.object_id for row in rows if row.deleted],
+            'cursor': changes.encode_cursor(
+                rows[-1].id if rows else after,
+                synced_at,
+            ),
+            'more': more,
+        })
+
+
+class TrailDigAPIRootView(QueryBudgetMixin, APIRootView):
+    """Browsable root of the trail dig APIs."""
+    query_budgets = {'get': 0}
+
+
+class TrailDigViewSet(QueryBudgetMixin,
+                      CachedResponseMixin,
+                      ChangeFeedMixin,
+                      SparseFieldsetMixin,
+                      CompiledListMixin,
+                      viewsets.ModelViewSet):
     """View for manage trail dig APIs."""
     serializer_class = serializers.TrailDigDetailSerializer
     queryset = TrailDig.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication,
+        AccessTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
+    renderer_classes = format_renderers()
+    pagination_class = TrailDigCursorPagination
+    filter_backends = [TrailDigFilter, StableOrderingFilter]
+    ordering_fields = ['id', 'date_time']
+    ordering = ['-id']
+    related_ordering = {'tags': ['name']}
+    change_kind = changes.TRAILDIG
+    query_budgets = {
+        'list': 4,
+        'retrieve': 4,
+        'create': 25,
+        'update': 27,
+        'partial_update': 27,
+        'destroy': 18,
+        'bulk': 23,
+        'changes': 5,
+        # The rows are read while the response streams, after the view
+        # returned, so only the queries before streaming are counted.
+        'export': 1,
+    }
 
     def get_queryset(self):
         """Retrieve trail digs for authencated user."""
-        return self.queryset.order_by('-id')
+        queryset = self.queryset.order_by('-id')
+        # Updates render the tags they saved, deletes none.
+        if (
+            self.action not in ('update', 'partial_update', 'destroy')
+            and self.wants_field('tags')
+        ):
+            queryset = queryset.prefetch_related(
+                Prefetch('tags', queryset=Tag.objects.order_by(
+                    *self.related_ordering['tags'],
+                )),
+            )
+        return self.narrow_queryset(queryset)
 
     def get_serializer_class(self):
         """Return the serializer class for request."""
@@ -38,33 +454,92 @@ class TrailDigViewSet(viewsets.ModelViewSet):
 
         return self.serializer_class
 
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
     def perform_create(self, serializer):
         """Crate a new trail dig."""
-        serializer.save(user=self.request.user)
+        with aggregates.deferred():
+            serializer.save(user=self.request.user)
+
+    def perform_update(self, serializer):
+        with aggregates.deferred():
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        with aggregates.deferred():
+            instance.delete()
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Create many trail digs in one request."""
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        traildigs = serializer.save(user=request.user)
+
+        return Response(
+            {'ids': [traildig.id for traildig in traildigs]},
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(
+        detail=False,
+        renderer_classes=[NDJSONRenderer, CSVRenderer],
+    )
+    def export(self, request):
+        """Stream the filtered trail digs as NDJSON or CSV."""
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = export.iter_export_rows(
+            queryset,
+            settings.TRAILDIG_EXPORT_CHUNK_SIZE,
+        )
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.stream(rows),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="traildigs.{renderer.format}"'
+        )
+        return response
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        if instance.user != request.user:
+        if instance.user_id != request.user.pk:
             return Response(status=status.HTTP_403_FORBIDDEN)
 
-        return super().destroy(request, *args, **kwargs)
+        self.perform_destroy(instance)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class BaseTrailDigAttrViewSet(mixins.DestroyModelMixin,
+class BaseTrailDigAttrViewSet(QueryBudgetMixin,
+                              CachedResponseMixin,
+                              ChangeFeedMixin,
+                              SparseFieldsetMixin,
+                              CompiledListMixin,
+                              mixins.DestroyModelMixin,
                               mixins.UpdateModelMixin,
                               mixins.ListModelMixin,
                               viewsets.GenericViewSet):
     """Base trail dig attribute view set."""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication,
+        AccessTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
+    renderer_classes = format_renderers()
+    filter_backends = [OwnerFilter]
 
     def get_queryset(self):
         """Retrieve tag for authencated user."""
-        return self.queryset.order_by('-name')
+        return self.narrow_queryset(self.queryset.order_by('-name'))
 
     def get_permissions(self):
         """Assign permissions based on action"""
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'series', 'changes']:
             self.permission_classes = [IsAuthenticated]
         else:
             self.permission_classes = [IsAdminUser]
@@ -76,3 +551,106 @@ class TagViewSet(BaseTrailDigAttrViewSet):
     """Manage tags in the database."""
     serializer_class = serializers.TagSerializer
     queryset = Tag.objects.all()
+    change_kind = changes.TAG
+    # Every user lists every tag with its total.
+    coalesced_actions = ['list']
+    query_budgets = {
+        'list': 3,
+        'series': 3,
+        'changes': 4,
+        'update': 13,
+        'partial_update': 12,
+        'destroy': 12,
+    }
+
+    @action(detail=True)
+    def series(self, request, pk=None):
+        """Return the work done on a tag per month or per year."""
+        params = serializers.TagSeriesParamsSerializer(
+            data=request.query_params,
+        )
+        params.is_valid(raise_exception=True)
+        tag = self.get_object()
+
+        rollups = tag.rollups.all()
+        if 'start' in params.validated_data:
+            year, month = params.validated_data['start']
+            rollups = rollups.filter(
+                Q(year__gt=year) | Q(year=year, month__gte=month)
+            )
+        if 'end' in params.validated_data:
+            year, month = params.validated_data['end']
+            rollups = rollups.filter(
+                Q(year__lt=year) | Q(year=year, month__lte=month)
+            )
+
+        group_by = ['year']
+        if params.validated_data['period'] == 'month':
+            group_by.append('month')
+        rows = rollups.values(*group_by).annotate(
+            total_minutes=Sum('time_minutes'),
+            total_person_minutes=Sum('person_minutes'),
+        ).order_by(*group_by)
+
+        serializer = serializers.TagSeriesSerializer(rows, many=True)
+        return Response(serializer.data)
+
+
+class LeaderboardViewSet(QueryBudgetMixin, viewsets.ViewSet):
+    """Rank volunteers by person-minutes, see core.leaderboards.
+
+    `?tag=` ranks on the digs with a tag name instead of on all digs.
+    """
+    authentication_classes = [
+        CachedTokenAuthentication,
+        AccessTokenAuthentication,
+    ]
+    permission_classes = [IsAuthenticated]
+    query_budgets = {
+        'list': 2,
+        'rank': 2,
+    }
+
+    def list(self, request):
+        """Return the top of a leaderboard."""
+        params = serializers.LeaderboardParamsSerializer(
+            data=request.query_params,
+        )
+        params.is_valid(raise_exception=True)
+        ranked = leaderboards.top(
+            params.validated_data['size'],
+            params.validated_data.get('tag'),
+        )
+        serializer = serializers.LeaderboardEntrySerializer(
+            [
+                {
+                    'rank': rank,
+                    'user': total.user_id,
+                    'name': total.user.name,
+                    'person_minutes': total.person_minutes,
+                }
+                for rank, total in ranked
+            ],
+            many=True,
+        )
+        return Response(serializer.data)
+
+    @action(detail=False)
+    def rank(self, request):
+        """Return the rank of a volunteer, the requesting one by default.
+
+        The rank is null for volunteers without person-minutes.
+        """
+        params = serializers.LeaderboardRankParamsSerializer(
+            data=request.query_params,
+        )
+        params.is_valid(raise_exception=True)
+        user_id = params.validated_data.get('user', request.user.pk)
+        ranked = leaderboards.rank(user_id, params.validated_data.get('tag'))
+        rank, person_minutes = ranked or (None, 0)
+        serializer = serializers.LeaderboardEntrySerializer({
+            'rank': rank,
+            'user': user_id,
+            'person_minutes': person_minutes,
+        })
+        return Response(serializer.data)
@@ -0,0 +1,142 @@
+"""
+Short lived access tokens, verified without reading the user.
+
+An access token is a payload signed with the SECRET_KEY (HMAC, see
+django.core.signing) carrying the user id and admin flags, a token id
+and an expiry. `/api/user/token/` issues one with the database token,
+`/api/user/token/refresh/` issues a new one to holders of the database
+token.
+
+For emergencies, `revoke_token` and `revoke_user` store revocations in
+the AccessTokenRevocation table, `prune` deletes them once the tokens
+they cover expired.
+Deactivating a user, changing their password or their admin flags
+revokes their tokens, see user.signals. The revocations of a user are
+read through the cache named by TRAILDIG_ACCESS_TOKEN_CACHE_ALIAS for
+TRAILDIG_AUTH_CACHE_TIMEOUT seconds. The cache only holds copies, an
+evicted entry is read from the table again; revoking drops it.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.db import transaction
+
+from core.models import AccessTokenRevocation
+
+SALT = 'user.access_tokens'
+REVOCATIONS_PREFIX = 'access:revocations:'
+
+
+class InvalidAccessToken(Exception):
+    """The access token is malformed, forged, expired or revoked."""
+
+
+def get_cache():
+    """Return the cache in front of the revocations table."""
+    return caches[settings.TRAILDIG_ACCESS_TOKEN_CACHE_ALIAS]
+
+
+def enabled():
+    """Return whether access tokens are issued."""
+    return settings.TRAILDIG_ACCESS_TOKEN_LIFETIME > 0
+
+
+def issue(user):
+    """Return a new access token for user and its lifetime in seconds."""
+    lifetime = settings.TRAILDIG_ACCESS_TOKEN_LIFETIME
+    now = time.time()
+    token = signing.dumps(
+        {
+            'uid': user.pk,
+            'staff': user.is_staff,
+            'super': user.is_superuser,
+            'jti': uuid.uuid4().hex,
+            'iat': round(now, 3),
+            'exp': int(now) + lifetime,
+        },
+        salt=SALT,
+    )
+    return token, lifetime
+
+
+def decode(token):
+    """Return the claims of a genuine access token, expired or not."""
+    try:
+        return signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        raise InvalidAccessToken('Invalid token.')
+
+
+def revocations(user_id):
+    """Return when every token of a user was last revoked and the ids of
+    their revoked tokens, from the cache or the table.
+    """
+    key = REVOCATIONS_PREFIX + str(user_id)
+    cached = get_cache().get(key)
+    if cached is None:
+        rows = list(AccessTokenRevocation.objects.filter(
+            user_id=user_id,
+            expires_at__gt=time.time(),
+        ).values_list('jti', 'revoked_at'))
+        cached = (
+            max((at for jti, at in rows if not jti), default=None),
+            {jti for jti, _ in rows if jti},
+        )
+        get_cache().set(key, cached, settings.TRAILDIG_AUTH_CACHE_TIMEOUT)
+    return cached
+
+
+def verify(token):
+    """Return the claims of a valid access token."""
+    claims = decode(token)
+    if claims['exp'] <= time.time():
+        raise InvalidAccessToken('Token expired.')
+
+    revoked_at, revoked_ids = revocations(claims['uid'])
+    if (
+        claims['jti'] in revoked_ids
+        or (revoked_at is not None and claims['iat'] <= revoked_at)
+    ):
+        raise InvalidAccessToken('Token revoked.')
+    return claims
+
+
+def revoke(user_id, jti=''):
+    """Store a revocation and drop the cached revocations of the user.
+
+    They are dropped again once committed, a concurrent request may have
+    cached them from the table in the meantime.
+    """
+    now = time.time()
+    AccessTokenRevocation.objects.create(
+        user_id=user_id,
+        jti=jti,
+        revoked_at=round(now, 3),
+        expires_at=now + settings.TRAILDIG_ACCESS_TOKEN_LIFETIME + 1,
+    )
+    key = REVOCATIONS_PREFIX + str(user_id)
+    get_cache().delete(key)
+    transaction.on_commit(lambda: get_cache().delete(key))
+
+
+def revoke_token(token):
+    """Reject an access token from now on."""
+    claims = decode(token)
+    if claims['exp'] > time.time():
+        revoke(claims['uid'], claims['jti'])
+
+
+def revoke_user(user_id):
+    """Reject every access token issued to a user so far."""
+    revoke(user_id)
+
+
+def prune():
+    """Delete the revocations of expired tokens, return their count."""
+    deleted, _ = AccessTokenRevocation.objects.filter(
+        expires_at__lte=time.time(),
+    ).delete()
+    return deleted
@@ -0,0 +1,140 @@
+"""
+Token authentication with the token to user resolution cached, and
+authentication with the signed access tokens of user.access_tokens.
+
+Entries hold the user's field values, but not the password hash, for
+TRAILDIG_AUTH_CACHE_TIMEOUT seconds in the cache named by
+TRAILDIG_AUTH_CACHE_ALIAS, which bounds their number. user.signals drops
+them when the token is deleted or the user saved, so password changes
+and deactivations apply right away; writes bypassing the signals, such
+as queryset updates, wait for the timeout.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router
+
+from rest_framework.authentication import (
+    BaseAuthentication,
+    TokenAuthentication,
+    get_authorization_header,
+)
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from user import access_tokens
+
+KEY_PREFIX = 'auth:token:'
+# Never copied out of the database.
+EXCLUDED_FIELDS = {'password'}
+
+
+def get_cache():
+    """Return the cache holding the authentications."""
+    return caches[settings.TRAILDIG_AUTH_CACHE_ALIAS]
+
+
+def cache_key(key):
+    """Return the cache key of a token, which is not stored as is."""
+    return KEY_PREFIX + hashlib.sha256(key.encode()).hexdigest()
+
+
+def user_fields():
+    """Return the user columns kept in the cache."""
+    return [
+        field.attname for field in get_user_model()._meta.concrete_fields
+        if field.attname not in EXCLUDED_FIELDS
+    ]
+
+
+def forget_tokens(keys):
+    """Drop the cached authentications of tokens."""
+    keys = list(keys)
+    if keys:
+        get_cache().delete_many([cache_key(key) for key in keys])
+
+
+def load_fields(user, names):
+    """Load the fields of an authenticated user left deferred, at once."""
+    missing = set(names) & user.get_deferred_fields()
+    if missing:
+        user.refresh_from_db(fields=missing)
+    return user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop in TokenAuthentication skipping the database on cache hits."""
+
+    def authenticate_credentials(self, key):
+        cached = get_cache().get(cache_key(key))
+        if cached is not None:
+            return self.from_cache(cached)
+
+        user, token = super().authenticate_credentials(key)
+        get_cache().set(
+            cache_key(key),
+            self.to_cache(user, token),
+            settings.TRAILDIG_AUTH_CACHE_TIMEOUT,
+        )
+        return user, token
+
+    def to_cache(self, user, token):
+        """Return the cacheable state of an authentication."""
+        return {
+            'user': [getattr(user, name) for name in user_fields()],
+            'token': [token.key, token.user_id, token.created],
+            'db': token._state.db,
+        }
+
+    def from_cache(self, cached):
+        """Return the (user, token) of a cached authentication.
+
+        The password is left deferred, saving the user leaves it alone.
+        """
+        user = get_user_model().from_db(
+            cached['db'], user_fields(), cached['user'],
+        )
+        token = Token.from_db(
+            cached['db'], ['key', 'user_id', 'created'], cached['token'],
+        )
+        token.user = user
+        return user, token
+
+
+class AccessTokenAuthentication(BaseAuthentication):
+    """Authenticate ``Authorization: Bearer <access token>`` headers.
+
+    No query is run: the user is built from the token claims with every
+    other field deferred, loaded on first access. Changing the admin
+    flags of a user revokes their tokens, so the claimed flags are
+    current. ``request.auth`` holds
+    the claims.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed('Invalid token header.')
+
+        try:
+            claims = access_tokens.verify(auth[1].decode())
+        except (UnicodeError, access_tokens.InvalidAccessToken) as exc:
+            raise AuthenticationFailed(str(exc) or 'Invalid token.')
+        return self.user_from_claims(claims), claims
+
+    def user_from_claims(self, claims):
+        """Return the user of token claims, without reading it."""
+        model = get_user_model()
+        return model.from_db(
+            router.db_for_read(model),
+            ['id', 'is_active', 'is_staff', 'is_superuser'],
+            [claims['uid'], True, claims['staff'], claims['super']],
+        )
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,63 @@
+"""
+Django command to revoke signed access tokens in an emergency.
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from user import access_tokens
+
+
+class Command(BaseCommand):
+    """Django command to revoke access tokens"""
+    help = (
+        'Reject access tokens before they expire: the given tokens, or '
+        'every token issued so far to the given users. --prune deletes the '
+        'revocations of the tokens expired since.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'tokens',
+            nargs='*',
+            help='Access tokens to revoke.',
+        )
+        parser.add_argument(
+            '--user',
+            action='append',
+            default=[],
+            help='Email of a user whose tokens to revoke, repeatable.',
+        )
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help='Delete the revocations of expired tokens.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command."""
+        if not (options['tokens'] or options['user'] or options['prune']):
+            raise CommandError('Give access tokens, --user or --prune.')
+
+        for email in options['user']:
+            try:
+                user = get_user_model().objects.get(email=email)
+            except get_user_model().DoesNotExist:
+                raise CommandError(f'User {email} does not exist.')
+            access_tokens.revoke_user(user.pk)
+            self.stdout.write(f'Revoked the access tokens of {email}.')
+
+        for token in options['tokens']:
+            try:
+                access_tokens.revoke_token(token)
+            except access_tokens.InvalidAccessToken as exc:
+                raise CommandError(f'{exc} {token[:16]}...')
+        if options['tokens']:
+            self.stdout.write(
+                f"Revoked {len(options['tokens'])} access token(s)."
+            )
+
+        if options['prune']:
+            count = access_tokens.prune()
+            self.stdout.write(f'Pruned {count} expired revocation(s).')
+
+        self.stdout.write(self.style.SUCCESS('Done.'))
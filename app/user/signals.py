@@ -0,0 +1,85 @@
+"""
+Signal handlers dropping cached authentications, see user.authentication.
+
+The entries are dropped right away, then again once the transaction of
+the write commits: until then, a concurrent request still reads the
+committed state and may cache it again.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from user import access_tokens
+from user.authentication import forget_tokens
+
+# The user fields the access tokens carry as claims.
+ADMIN_FLAGS = ('is_staff', 'is_superuser')
+
+
+def forget_now_and_on_commit(forget, using):
+    """Run forget now and once the current transaction commits."""
+    forget()
+    transaction.on_commit(forget, using=using)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, using=None, **kwargs):
+    """Stop authenticating with a deleted token."""
+    key = instance.key
+    forget_now_and_on_commit(lambda: forget_tokens([key]), using)
+
+
+def admin_flags_changed(sender, instance, update_fields, using):
+    """Return whether a save changes the admin flags of a user."""
+    if update_fields is not None and not set(ADMIN_FLAGS) & update_fields:
+        return False
+    stored = sender._default_manager.using(using).filter(
+        pk=instance.pk,
+    ).values_list(*ADMIN_FLAGS).first()
+    return stored is not None and stored != tuple(
+        getattr(instance, name) for name in ADMIN_FLAGS
+    )
+
+
+@receiver(pre_save, sender=get_user_model())
+def forget_saved_user(sender, instance, raw=False, update_fields=None,
+                      using=None, **kwargs):
+    """Reload a saved user, so password changes and deactivations apply.
+
+    They also revoke the user's access tokens, as do changes of the admin
+    flags, which the tokens carry. What to forget is decided before the
+    save, see `forget_user_tokens` for after it.
+    """
+    instance._forget_tokens = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    keys = list(Token.objects.using(using).filter(
+        user_id=instance.pk,
+    ).values_list('key', flat=True))
+    # Set by set_password() until the save completes.
+    revoke = (
+        instance._password is not None
+        or not instance.is_active
+        or admin_flags_changed(sender, instance, update_fields, using)
+    )
+    forget_tokens(keys)
+    if revoke:
+        # In the transaction of the save, when there is one.
+        access_tokens.revoke_user(instance.pk)
+    instance._forget_tokens = lambda: forget_tokens(keys)
+
+
+@receiver(post_save, sender=get_user_model())
+def forget_user_tokens(sender, instance, using=None, **kwargs):
+    """Forget the saved user's authentications again once committed."""
+    forget = getattr(instance, '_forget_tokens', None)
+    if forget is not None:
+        instance._forget_tokens = None
+        transaction.on_commit(forget, using=using)
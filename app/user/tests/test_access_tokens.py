@@ -0,0 +1,298 @@
+"""
+Tests for the signed access tokens.
+"""
+import time
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import (
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import (
+    AccessTokenRevocation,
+    Tag,
+)
+from user import access_tokens
+
+ME_URL = reverse('user:me')
+TOKEN_URL = reverse('user:token')
+REFRESH_URL = reverse('user:token-refresh')
+TRAILDIGS_URL = reverse('traildig:traildig-list')
+
+
+class AccessTokenTests(TestCase):
+    """Test authenticating with signed access tokens."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.client = APIClient()
+        access_tokens.get_cache().clear()
+
+    def bearer(self, token):
+        """Authenticate the client with an access token."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_token_view_issues_access_token(self):
+        """Test logging in returns an access token next to the token."""
+        res = self.client.post(TOKEN_URL, {
+            'email': 'test@example.com',
+            'password': 'testpass123',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('token', res.data)
+        self.assertEqual(res.data['access_expires_in'], 300)
+        claims = access_tokens.verify(res.data['access'])
+        self.assertEqual(claims['uid'], self.user.pk)
+
+    @override_settings(TRAILDIG_ACCESS_TOKEN_LIFETIME=0)
+    def test_disabled(self):
+        """Test no access token is issued when they are disabled."""
+        res = self.client.post(TOKEN_URL, {
+            'email': 'test@example.com',
+            'password': 'testpass123',
+        })
+
+        self.assertNotIn('access', res.data)
+
+    def test_authenticates_without_query(self):
+        """Test the token is verified without reading the database."""
+        token, _ = access_tokens.issue(self.user)
+        self.bearer(token)
+        # Reads the user's revocations, then finds them in the cache.
+        self.client.get(ME_URL)
+
+        # Only the profile fields are loaded.
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['name'], 'Test Name')
+
+    def test_write_as_token_user(self):
+        """Test writes are made on behalf of the token's user."""
+        token, _ = access_tokens.issue(self.user)
+        self.bearer(token)
+
+        res = self.client.post(TRAILDIGS_URL, {
+            'title': 'Dig',
+            'time_minutes': 30,
+            'number_people': 2,
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.user.traildig_set.count(), 1)
+
+    def test_profile_update_keeps_password(self):
+        """Test updating the profile leaves the password alone."""
+        token, _ = access_tokens.issue(self.user)
+        self.bearer(token)
+
+        res = self.client.patch(ME_URL, {'name': 'Renamed'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'Renamed')
+        self.assertTrue(self.user.check_password('testpass123'))
+
+    def test_admin_flags(self):
+        """Test admin only routes accept admins' access tokens."""
+        tag = Tag.objects.create(user=self.user, name='SDM')
+        url = reverse('traildig:tag-detail', args=[tag.id])
+        admin = get_user_model().objects.create_superuser(
+            'admin@example.com', 'testpass123',
+        )
+
+        self.bearer(access_tokens.issue(self.user)[0])
+        res = self.client.patch(url, {'name': 'MSA'})
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.bearer(access_tokens.issue(admin)[0])
+        res = self.client.patch(url, {'name': 'MSA'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_rejected_tokens(self):
+        """Test forged, expired and malformed tokens are rejected."""
+        token, _ = access_tokens.issue(self.user)
+        forged = token[:-1] + ('A' if token[-1] != 'A' else 'B')
+
+        for bad in [forged, 'not-a-token', f'{token} extra']:
+            self.bearer(bad)
+            res = self.client.get(ME_URL)
+            self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        with patch('user.access_tokens.time.time',
+                   return_value=time.time() + 301):
+            self.bearer(token)
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(res['WWW-Authenticate'], 'Token')
+
+    def test_refresh(self):
+        """Test the database token gets a new access token."""
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        res = self.client.post(REFRESH_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            access_tokens.verify(res.data['access'])['uid'],
+            self.user.pk,
+        )
+
+    def test_refresh_needs_database_token(self):
+        """Test an access token cannot renew itself."""
+        self.bearer(access_tokens.issue(self.user)[0])
+
+        res = self.client.post(REFRESH_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_token(self):
+        """Test a revoked token is rejected, the others still work."""
+        revoked, _ = access_tokens.issue(self.user)
+        other, _ = access_tokens.issue(self.user)
+
+        access_tokens.revoke_token(revoked)
+
+        self.bearer(revoked)
+        self.assertEqual(
+            self.client.get(ME_URL).status_code,
+            status.HTTP_401_UNAUTHORIZED,
+        )
+        self.bearer(other)
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_200_OK)
+
+    def test_password_change_revokes(self):
+        """Test changing the password revokes the issued tokens."""
+        token, _ = access_tokens.issue(self.user)
+
+        self.user.set_password('newpass123')
+        self.user.save()
+
+        self.bearer(token)
+        self.assertEqual(
+            self.client.get(ME_URL).status_code,
+            status.HTTP_401_UNAUTHORIZED,
+        )
+        self.bearer(access_tokens.issue(self.user)[0])
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_200_OK)
+
+    def test_deactivation_revokes(self):
+        """Test deactivating a user revokes their tokens."""
+        token, _ = access_tokens.issue(self.user)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.bearer(token)
+        self.assertEqual(
+            self.client.get(ME_URL).status_code,
+            status.HTTP_401_UNAUTHORIZED,
+        )
+
+    def test_demotion_revokes(self):
+        """Test the tokens of a demoted admin no longer grant admin rights."""
+        tag = Tag.objects.create(user=self.user, name='SDM')
+        url = reverse('traildig:tag-detail', args=[tag.id])
+        admin = get_user_model().objects.create_superuser(
+            'admin@example.com', 'testpass123',
+        )
+        token, _ = access_tokens.issue(admin)
+
+        admin.is_staff = False
+        admin.is_superuser = False
+        admin.save()
+
+        self.bearer(token)
+        res = self.client.patch(url, {'name': 'MSA'})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'SDM')
+
+    def test_other_saves_keep_tokens(self):
+        """Test saving a user without a revoking change keeps tokens."""
+        token, _ = access_tokens.issue(self.user)
+
+        self.user.name = 'Renamed'
+        self.user.save()
+
+        self.bearer(token)
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_200_OK)
+
+    def test_revocation_outlives_cache(self):
+        """Test a revocation still applies once evicted from the cache."""
+        token, _ = access_tokens.issue(self.user)
+        access_tokens.revoke_token(token)
+
+        access_tokens.get_cache().clear()
+
+        with self.assertRaises(access_tokens.InvalidAccessToken):
+            access_tokens.verify(token)
+
+    def test_profile_update_keeps_stored_flags(self):
+        """Test a profile update does not write the claims back."""
+        token, _ = access_tokens.issue(self.user)
+        # Writes bypassing the signals do not revoke the tokens.
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            is_active=False,
+            is_staff=True,
+        )
+        self.bearer(token)
+
+        res = self.client.patch(ME_URL, {'name': 'Renamed'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'Renamed')
+        self.assertFalse(self.user.is_active)
+        self.assertTrue(self.user.is_staff)
+
+    def test_prune_command(self):
+        """Test the revocations of expired tokens are pruned."""
+        token, _ = access_tokens.issue(self.user)
+        access_tokens.revoke_token(token)
+        out = StringIO()
+
+        with patch('user.access_tokens.time.time',
+                   return_value=time.time() + 302):
+            call_command('revoke_access_tokens', '--prune', stdout=out)
+
+        self.assertIn('Pruned 1 expired revocation(s).', out.getvalue())
+        self.assertFalse(AccessTokenRevocation.objects.exists())
+
+    def test_revoke_command(self):
+        """Test revoking tokens from the command line."""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123',
+        )
+        token, _ = access_tokens.issue(self.user)
+        users_token, _ = access_tokens.issue(other)
+        out = StringIO()
+
+        call_command(
+            'revoke_access_tokens', token, '--user', 'other@example.com',
+            stdout=out,
+        )
+
+        for revoked in [token, users_token]:
+            with self.assertRaises(access_tokens.InvalidAccessToken):
+                access_tokens.verify(revoked)
+        self.assertIn('Revoked 1 access token(s).', out.getvalue())
@@ -0,0 +1,119 @@
+"""
+Tests for the cached token authentication.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.authentication import (
+    cache_key,
+    get_cache,
+)
+
+ME_URL = reverse('user:me')
+TOKEN_URL = reverse('user:token')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test tokens are resolved from the cache until they change."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cached_after_first_request(self):
+        """Test the token is only read from the database once."""
+        with self.assertNumQueries(1):
+            self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_password_not_cached(self):
+        """Test the cache never holds the password hash."""
+        self.client.get(ME_URL)
+
+        cached = get_cache().get(cache_key(self.token.key))
+
+        self.assertNotIn(self.user.password, repr(cached))
+        self.assertNotIn(self.token.key, cache_key(self.token.key))
+
+    def test_save_keeps_password(self):
+        """Test saving the cached user leaves the password alone."""
+        self.client.get(ME_URL)
+
+        res = self.client.patch(ME_URL, {'name': 'Renamed'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'Renamed')
+        self.assertTrue(self.user.check_password('testpass123'))
+
+    def test_token_deleted(self):
+        """Test a deleted token stops working right away."""
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_deactivated(self):
+        """Test a deactivated user is rejected right away."""
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_reloads_user(self):
+        """Test changing the password drops the cached user."""
+        self.client.get(ME_URL)
+
+        self.user.set_password('newpass123')
+        self.user.save()
+
+        self.assertIsNone(get_cache().get(cache_key(self.token.key)))
+        with self.assertNumQueries(1):
+            self.client.get(ME_URL)
+
+    def test_recached_before_commit_dropped(self):
+        """Test entries cached again before the save commits are dropped.
+
+        Until the commit, concurrent requests read the old user.
+        """
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.is_active = False
+            self.user.save()
+            # A concurrent request caching the committed, active user.
+            get_cache().set(cache_key(self.token.key), 'stale')
+
+        self.assertEqual(get_cache().get(cache_key(self.token.key)), 'stale')
+        for callback in callbacks:
+            callback()
+
+        self.assertIsNone(get_cache().get(cache_key(self.token.key)))
+
+    def test_deleted_token_recached_before_commit_dropped(self):
+        """Test a deleted token cached again before the commit is dropped."""
+        key = cache_key(self.token.key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+            get_cache().set(key, 'stale')
+
+        self.assertIsNone(get_cache().get(key))
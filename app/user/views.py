@@ -1,33 +1,95 @@
 """
 Views for the user API.
 """
-from rest_framework import generics, authentication, permissions
+from django.contrib.auth import get_user_model
+
+from rest_framework import generics, permissions
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from core.query_budget import QueryBudgetMixin
 
+from user import access_tokens
+from user.authentication import (
+    AccessTokenAuthentication,
+    CachedTokenAuthentication,
+    load_fields,
+)
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
 )
 
 
-class CreateUserView(generics.CreateAPIView):
+def access_token_data(user):
+    """Return the response fields of a new access token for user."""
+    access, expires_in = access_tokens.issue(user)
+    return {'access': access, 'access_expires_in': expires_in}
+
+
+class CreateUserView(QueryBudgetMixin, generics.CreateAPIView):
     """Create a new user in the system."""
     serializer_class = UserSerializer
+    query_budgets = {'post': 2}
 
 
-class CreateTokenView(ObtainAuthToken):
+class CreateTokenView(QueryBudgetMixin, ObtainAuthToken):
     """Create a new auth token for user."""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    query_budgets = {'post': 5}
+
+    def post(self, request, *args, **kwargs):
+        """Return the user's token, and an access token when enabled."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        token, created = Token.objects.get_or_create(user=user)
 
+        data = {'token': token.key}
+        if access_tokens.enabled():
+            data.update(access_token_data(user))
+        return Response(data)
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+
+class RefreshAccessTokenView(QueryBudgetMixin, APIView):
+    """Issue a new access token to the holder of a user's token."""
+    # Not access tokens, which could otherwise renew themselves forever.
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    query_budgets = {'post': 1}
+
+    def post(self, request):
+        """Return a new access token."""
+        if not access_tokens.enabled():
+            raise NotFound('Access tokens are disabled.')
+        return Response(access_token_data(request.user))
+
+
+class ManageUserView(QueryBudgetMixin, generics.RetrieveUpdateAPIView):
     """Manage the authenticated user."""
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication,
+        AccessTokenAuthentication,
+    ]
     permission_classes = [permissions.IsAuthenticated]
+    # Access tokens read their revocations then the profile fields. Writes
+    # read the stored user, saving it reads its stored admin flags and a
+    # password change stores a revocation, see user.signals.
+    query_budgets = {'get': 2, 'put': 8, 'patch': 8}
 
     def get_object(self):
-        """Retrieve and return the authenticated user."""
-        return self.request.user
+        """Retrieve and return the authenticated user.
+
+        Writes get the stored user: the authenticated one comes from the
+        cache or from access token claims, saving it would write those
+        values back.
+        """
+        if self.request.method in permissions.SAFE_METHODS:
+            return load_fields(self.request.user, ['email', 'name'])
+        return get_user_model().objects.get(pk=self.request.user.pk)
@@ -5,5 +5,10 @@ set -e
 python manage.py wait_for_db
 python manage.py collectstatic --noinput
 python manage.py migrate
+python manage.py createcachetable
+
+# Change notifications hold connections open, served by an ASGI server
+# so they do not pin the uwsgi workers, see traildig.events.
+uvicorn app.asgi:application --host 0.0.0.0 --port 9001 --lifespan off &
 
 uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi